@@ -0,0 +1,56 @@
+# Sarim Shahwar
+# Mine import: POST /mines one at a time against one streamed POST
+# /mines/bulk, then the time to stream GET /mines/export back.
+# Run from the repo root:  python -m benchmarks.bench_bulk --mines 500000
+import argparse
+import os
+import time
+
+os.environ.setdefault("ROVER_COMMANDS_FIXTURE", os.path.join("fixtures", "rover_commands.json"))
+os.environ.setdefault("ROVER_PIN_WARMER", "0")
+
+from fastapi.testclient import TestClient
+
+import rover_server
+
+
+def survey(count, cols):
+    # One mine per cell, row by row, serials from 1
+    for serial in range(1, count + 1):
+        yield serial // cols, serial % cols, serial
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk mine import/export benchmark")
+    parser.add_argument("--mines", type=int, default=500_000)
+    parser.add_argument("--single", type=int, default=2000, help="mines sent one request each, for comparison")
+    args = parser.parse_args()
+
+    client = TestClient(rover_server.app)
+    side = int((args.mines * 2) ** 0.5) + 1
+    client.put("/map", json={"row": side, "col": side})
+
+    start = time.perf_counter()
+    for row, col, serial in survey(args.single, side):
+        client.post("/mines", json={"row": row, "col": col, "serialNum": serial})
+    single = args.single / (time.perf_counter() - start)
+
+    client.put("/map", json={"row": side, "col": side})
+    body = (f'{{"row": {r}, "col": {c}, "serialNum": {s}}}\n'.encode() for r, c, s in survey(args.mines, side))
+    start = time.perf_counter()
+    result = client.post("/mines/bulk", content=body, headers={"Content-Type": "application/x-ndjson"}).json()
+    bulk = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with client.stream("GET", "/mines/export", params={"format": "csv"}) as response:
+        exported = sum(chunk.count(b"\n") for chunk in response.iter_bytes()) - 1
+    export = time.perf_counter() - start
+
+    print(f"POST /mines one by one: {single:8.0f} mines/s")
+    print(f"POST /mines/bulk:       {result['created'] / bulk:8.0f} mines/s "
+          f"({result['created']} in {bulk:.1f}s, {result['error_count']} errors)")
+    print(f"GET /mines/export:      {exported / export:8.0f} mines/s ({exported} in {export:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Sarim Shahwar
+# Load test: read throughput at increasing client concurrency while rovers are
+# being dispatched in the background. Runs the app under uvicorn.
+# Run from the repo root:  python -m benchmarks.bench_concurrency --duration 5
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, extra_args=(), env=None):
+    env = dict(os.environ, **(env or {}))
+    env.setdefault("ROVER_COMMANDS_FIXTURE", os.path.join("fixtures", "rover_commands.json"))
+    env.setdefault("ROVER_PIN_WARMER", "0")  # background PIN solves would compete for the CPU
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "rover_server:app", "--port", str(port),
+                             "--log-level", "warning", *extra_args], env=env)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(base + "/rovers")
+            return proc, base
+        except httpx.TransportError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read throughput under concurrent dispatch load")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per concurrency level")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--size", type=int, default=300)
+    args = parser.parse_args()
+
+    proc, base = start_server(free_port())
+    try:
+        setup = httpx.Client(base_url=base)
+        setup.put("/map", json={"row": args.size, "col": args.size, "density": 0.02})
+        serials = [m["id"] for m in setup.get("/mines").json()["mines"]][:500]
+        commands = "MMMMRMMMMLMMMMRMMMML" * 50  # no D, keeps disarm jobs out of the picture
+        rover_ids = [setup.post("/rovers", json={"commands": commands}).json()["id"] for _ in range(200)]
+
+        for level in args.levels:
+            stop = threading.Event()
+            reads = [0] * level
+            dispatches = [0]
+
+            def dispatcher():
+                with httpx.Client(base_url=base) as client:
+                    i = 0
+                    while not stop.is_set():
+                        client.put(f"/rovers/{rover_ids[i % len(rover_ids)]}", json={"commands": commands})
+                        client.post(f"/rovers/{rover_ids[i % len(rover_ids)]}/dispatch")
+                        dispatches[0] += 1
+                        i += 1
+
+            def reader(slot):
+                with httpx.Client(base_url=base) as client:
+                    i = slot
+                    while not stop.is_set():
+                        client.get(f"/mines/{serials[i % len(serials)]}")
+                        client.get(f"/rovers/{rover_ids[i % len(rover_ids)]}")
+                        reads[slot] += 2
+                        i += level
+
+            threads = [threading.Thread(target=dispatcher)] + \
+                      [threading.Thread(target=reader, args=(slot,)) for slot in range(level)]
+            for t in threads:
+                t.start()
+            time.sleep(args.duration)
+            stop.set()
+            for t in threads:
+                t.join()
+            print(f"readers={level:>3}: {sum(reads) / args.duration:8.0f} reads/s  "
+                  f"{dispatches[0] / args.duration:6.0f} dispatches/s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# Sarim Shahwar
+# Coverage planning: time and route lengths for fleets clearing a seeded
+# field, against a plain serpentine row sweep split the same way.
+# Run from the repo root:  python -m benchmarks.bench_coverage
+import argparse
+import time
+
+import numpy as np
+
+import coverage_planner
+import helper
+
+
+def lengths_of(routes):
+    lengths = [len(route.commands) for route in routes]
+    return max(lengths), sum(lengths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coverage planning benchmark")
+    parser.add_argument("--size", type=int, nargs="+", default=[100, 500, 2000])
+    parser.add_argument("--density", type=float, default=0.01)
+    parser.add_argument("--fleet", type=int, default=8)
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds for improving the tour")
+    args = parser.parse_args()
+
+    for size in args.size:
+        grid = helper.generate_map_grid(size, size, update_change=False, density=args.density, seed=1)[0]
+        grid[0, 0] = 0
+        rows, cols = np.nonzero(grid)
+        serpentine = np.lexsort((np.where(rows % 2, -cols, cols), rows))
+        sweep = []
+        for start, stop in coverage_planner.split(rows, cols, serpentine, args.fleet):
+            cells = zip(rows[serpentine[start:stop]].tolist(), cols[serpentine[start:stop]].tolist())
+            sweep.append(coverage_planner.route_commands(grid, cells))
+        sweep = lengths_of(sweep)
+        start = time.perf_counter()
+        planned = lengths_of(coverage_planner.plan(grid, rows, cols, args.fleet, args.budget))
+        seconds = time.perf_counter() - start
+        print(f"{size}x{size}, {len(rows)} mines, {args.fleet} rovers: planned in {seconds:.2f}s  "
+              f"makespan {planned[0]} (sweep {sweep[0]})  total {planned[1]} (sweep {sweep[1]})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# Sarim Shahwar
+# Serial helper.disarm_mine vs the process pool solver in disarm_engine.
+# Run from the repo root:  python -m benchmarks.bench_disarm --prefix 00000
+import argparse
+import os
+import time
+
+import helper
+from disarm_engine import DisarmEngine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Disarm PIN solver benchmark")
+    parser.add_argument("--serials", type=int, nargs="+", default=[1234, 4821, 7777, 9001])
+    parser.add_argument("--prefix", default="00000", help="hash prefix to solve for (game uses 000000)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    engine = DisarmEngine(workers=args.workers, cache_path=None)
+    engine.solve(1000, "0")  # start the pool outside the timed section
+
+    serial_total = pool_total = 0.0
+    print(f"prefix={args.prefix!r} workers={engine.workers}")
+    for serial in args.serials:
+        start = time.perf_counter()
+        expected = helper.disarm_mine(serial, args.prefix)
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pin = engine.solve(serial, args.prefix)
+        pool_time = time.perf_counter() - start
+
+        assert pin == expected, f"serial {serial}: pool gave {pin}, serial loop gave {expected}"
+        serial_total += serial_time
+        pool_total += pool_time
+        print(f"serial {serial}: pin {pin:>9}  loop {serial_time:7.3f}s  pool {pool_time:7.3f}s  "
+              f"x{serial_time / pool_time:.2f}")
+
+    # A solved serial costs a dictionary lookup from then on
+    engine.disarm(args.serials[0], args.prefix)
+    start = time.perf_counter()
+    engine.disarm(args.serials[0], args.prefix)
+    cached_time = time.perf_counter() - start
+
+    print(f"total: loop {serial_total:.3f}s  pool {pool_total:.3f}s  x{serial_total / pool_total:.2f}")
+    print(f"cached disarm: {cached_time * 1e6:.1f}us")
+    engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Sarim Shahwar
+# Rovers per second: POST /rovers/dispatch-batch vs looping POST /rovers/{id}/dispatch.
+# Run from the repo root:  python -m benchmarks.bench_dispatch --rovers 2000
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault("ROVER_COMMANDS_FIXTURE", os.path.join("fixtures", "rover_commands.json"))
+os.environ.setdefault("ROVER_PIN_WARMER", "0")
+
+from fastapi.testclient import TestClient
+
+import rover_server
+
+
+def make_fleet(client, rovers, length, rng):
+    ids = []
+    for _ in range(rovers):
+        commands = "".join(rng.choice("LRMMMMD") for _ in range(length))
+        ids.append(client.post("/rovers", json={"commands": commands}).json()["id"])
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch dispatch throughput benchmark")
+    parser.add_argument("--rovers", type=int, default=2000)
+    parser.add_argument("--length", type=int, default=200, help="commands per rover")
+    parser.add_argument("--size", type=int, default=200, help="map is size x size")
+    parser.add_argument("--density", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=892)
+    args = parser.parse_args()
+
+    # Disarm jobs would start hashing in the background and skew the timings
+    rover_server.disarm_jobs.solver = lambda serial: "0"
+    client = TestClient(rover_server.app)
+    rng = random.Random(args.seed)
+    timings = {}
+    for mode in ("loop", "batch"):
+        client.put("/map", json={"row": args.size, "col": args.size, "density": args.density})
+        ids = make_fleet(client, args.rovers, args.length, rng)
+        start = time.perf_counter()
+        if mode == "loop":
+            for rover_id in ids:
+                client.post(f"/rovers/{rover_id}/dispatch")
+        else:
+            client.post("/rovers/dispatch-batch", json={"ids": ids})
+        timings[mode] = time.perf_counter() - start
+        print(f"{mode:>5}: {args.rovers} rovers in {timings[mode]:.3f}s "
+              f"-> {args.rovers / timings[mode]:,.0f} rovers/s")
+    print(f"speedup x{timings['loop'] / timings['batch']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
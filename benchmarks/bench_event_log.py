@@ -0,0 +1,120 @@
+# Sarim Shahwar
+# Event log costs: per-mutation overhead on POST /mines (log off / interval /
+# commit), group commit under concurrent writers, and restart time for a
+# large world (snapshot + log replay).
+# Run from the repo root:  python -m benchmarks.bench_event_log --mines 1000000
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("ROVER_COMMANDS_FIXTURE", os.path.join("fixtures", "rover_commands.json"))
+os.environ.setdefault("ROVER_PIN_WARMER", "0")
+
+
+def child(mode, directory, count, size, density):
+    # Runs in a fresh process: ROVER_DATA_DIR is read when rover_server is imported
+    if mode in ("interval", "commit", "build"):
+        os.environ["ROVER_DATA_DIR"] = directory
+        os.environ["ROVER_WAL_SYNC"] = "commit" if mode == "build" else mode
+    from fastapi.testclient import TestClient
+    import rover_server
+
+    result = {}
+    if mode == "recover":
+        start = time.perf_counter()
+        rover_server.open_event_log(directory, "interval")
+        result["seconds"] = time.perf_counter() - start
+        result["mines"] = len(rover_server.mines)
+        result["rovers"] = len(rover_server.rovers)
+    elif mode == "build":
+        client = TestClient(rover_server.app)
+        start = time.perf_counter()
+        client.put("/map", json={"row": size, "col": size, "density": density})
+        result["snapshot_seconds"] = time.perf_counter() - start
+        # Logged changes on top of the snapshot, replayed at recovery
+        for _ in range(count):
+            client.post("/rovers", json={"commands": "MMRML"})
+        result["mines"] = len(rover_server.mines)
+    else:
+        client = TestClient(rover_server.app)
+        client.put("/map", json={"row": 1000, "col": 1000})
+        start = time.perf_counter()
+        for i in range(count):
+            client.post("/mines", json={"row": i // 999, "col": i % 999 + 1, "serialNum": 10_000_000 + i})
+        result["seconds"] = time.perf_counter() - start
+    print(json.dumps(result))
+
+
+def run_child(*args):
+    out = subprocess.run([sys.executable, "-m", "benchmarks.bench_event_log", "--child", *map(str, args)],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def group_commit(directory, writers, per_writer):
+    from event_log import EventLog
+    log = EventLog(directory)
+    log.recover()
+    log.start()
+
+    def write():
+        for i in range(per_writer):
+            log.wait(log.append({"type": "bench", "i": i}))
+
+    threads = [threading.Thread(target=write) for _ in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    log.close()
+    return elapsed, log.flushes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event log benchmark")
+    parser.add_argument("--mutations", type=int, default=2000)
+    parser.add_argument("--mines", type=int, default=1_000_000, help="approximate mines in the recovery world")
+    parser.add_argument("--log-records", type=int, default=2000, help="logged changes replayed on top of the snapshot")
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--child", nargs=5)
+    args = parser.parse_args()
+    if args.child:
+        mode, directory, count, size, density = args.child
+        child(mode, directory, int(count), int(size), float(density))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"POST /mines x{args.mutations}:")
+        baseline = None
+        for mode in ("off", "interval", "commit"):
+            result = run_child(mode, os.path.join(tmp, mode), args.mutations, 0, 0)
+            per_call = result["seconds"] / args.mutations * 1e6
+            baseline = baseline or per_call
+            print(f"  {mode:>8}: {per_call:7.0f} us/mutation (+{per_call - baseline:.0f} us)")
+
+        for writers in (1, args.writers):
+            elapsed, flushes = group_commit(os.path.join(tmp, f"group{writers}"), writers, 500)
+            records = writers * 500
+            print(f"group commit, {writers:>2} writers: {records / elapsed:,.0f} durable records/s, "
+                  f"{records / flushes:.1f} records per fsync")
+
+        world = os.path.join(tmp, "world")
+        density = 0.2
+        size = int((args.mines / density) ** 0.5)
+        built = run_child("build", world, args.log_records, size, density)
+        print(f"{size}x{size} map with {built['mines']:,} mines: PUT /map (generate + snapshot) "
+              f"{built['snapshot_seconds']:.2f}s ({os.path.getsize(os.path.join(world, 'snapshot.bin')) / 1e6:.1f} MB)")
+        recovered = run_child("recover", world, 0, 0, 0)
+        print(f"recovery: {recovered['mines']:,} mines + {recovered['rovers']} logged rovers "
+              f"in {recovered['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Sarim Shahwar
+# Fan-out cost of the /ws/events hub: one publisher thread, thousands of
+# subscribers on an event loop (the WebSocket send itself is left out).
+# Run from the repo root:  python -m benchmarks.bench_events --subscribers 5000
+import argparse
+import asyncio
+import threading
+import time
+
+from events import EventHub
+
+
+async def run(subscribers, events, entities, max_pending, burst):
+    hub = EventHub(max_pending=max_pending)
+    subs = [hub.subscribe() for _ in range(subscribers)]
+    received = [0] * subscribers
+    resyncs = [0]
+
+    async def consume(i, sub):
+        while True:
+            for event in await sub.next_batch():
+                if event["type"] == "resync":
+                    resyncs[0] += 1
+                else:
+                    received[i] += 1
+
+    consumers = [asyncio.create_task(consume(i, sub)) for i, sub in enumerate(subs)]
+
+    def publisher():
+        # Bursts with short gaps, like dispatches arriving over time
+        for n in range(events):
+            hub.publish(("rover", n % entities), {"type": "rover_updated", "seq": n})
+            if burst and n % burst == burst - 1:
+                time.sleep(0.001)
+
+    start = time.perf_counter()
+    thread = threading.Thread(target=publisher)
+    thread.start()
+    while thread.is_alive():
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0)  # let the last deliveries run
+    while any(sub.cursor != sub.channel.end for sub in subs):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    for task in consumers:
+        task.cancel()
+
+    delivered = sum(received)
+    print(f"{subscribers} subscribers, {events} events over {entities} entities: {elapsed:.3f}s")
+    print(f"  {events * subscribers / elapsed:,.0f} event fan-outs/s, {delivered:,} delivered "
+          f"({events * subscribers - delivered:,} coalesced), {resyncs[0]} resyncs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event hub fan-out benchmark")
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--entities", type=int, default=200, help="distinct rovers the events are about")
+    parser.add_argument("--max-pending", type=int, default=1000)
+    parser.add_argument("--burst", type=int, default=10, help="events per burst, 0 publishes flat out")
+    args = parser.parse_args()
+    asyncio.run(run(args.subscribers, args.events, args.entities, args.max_pending, args.burst))
+
+
+if __name__ == "__main__":
+    main()
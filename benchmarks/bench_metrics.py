@@ -0,0 +1,65 @@
+# Sarim Shahwar
+# Cost of the instrumentation: RWLock acquire/release and a cheap endpoint,
+# with metrics off (the default) and on.
+# Run from the repo root:  python -m benchmarks.bench_metrics
+import argparse
+import os
+import time
+
+os.environ.setdefault("ROVER_COMMANDS_FIXTURE", os.path.join("fixtures", "rover_commands.json"))
+os.environ.setdefault("ROVER_PIN_WARMER", "0")
+
+from fastapi.testclient import TestClient
+
+import metrics
+import rover_server
+from locks import RWLock
+
+
+def lock_cost(rounds):
+    lock = RWLock("bench")
+    timings = {}
+    for mode in ("off", "on"):
+        lock.observe = None if mode == "off" else (lambda kind, wait, hold: None)
+        best = float("inf")
+        for _ in range(5):  # best of 5, single runs are noisy
+            start = time.perf_counter()
+            for _ in range(rounds):
+                with lock.read():
+                    pass
+            best = min(best, time.perf_counter() - start)
+        timings[mode] = best / rounds * 1e9
+    return timings
+
+
+def endpoint_cost(client, rounds, rover_id):
+    timings = {}
+    for mode in ("off", "on", "off"):
+        metrics.set_enabled(mode == "on")
+        client.get(f"/rovers/{rover_id}")
+        start = time.perf_counter()
+        for _ in range(rounds):
+            client.get(f"/rovers/{rover_id}")
+        timings[mode] = (time.perf_counter() - start) / rounds * 1e6  # second "off" run wins (warm)
+    metrics.set_enabled(False)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Instrumentation overhead benchmark")
+    parser.add_argument("--lock-rounds", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    locks = lock_cost(args.lock_rounds)
+    print(f"RWLock read acquire+release: off {locks['off']:.0f} ns, on {locks['on']:.0f} ns")
+
+    client = TestClient(rover_server.app)
+    rover_id = client.post("/rovers", json={"commands": "MM"}).json()["id"]
+    requests = endpoint_cost(client, args.requests, rover_id)
+    print(f"GET /rovers/{{id}}: off {requests['off']:.0f} us, on {requests['on']:.0f} us "
+          f"({(requests['on'] / requests['off'] - 1) * 100:+.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Sarim Shahwar
+# Disarm latency: a dispatch disarm that has to solve its PIN, one whose PIN
+# the warmer already put in the PIN table, and a cold one while the warmer is
+# busy (it gives way to the real disarm).
+# Run from the repo root:  python -m benchmarks.bench_pin_table --mines 5
+import argparse
+import os
+import tempfile
+import time
+
+os.environ.setdefault("ROVER_COMMANDS_FIXTURE", os.path.join("fixtures", "rover_commands.json"))
+os.environ.setdefault("ROVER_DISARM_PREFIX", "00000")  # ~1M hashes per PIN, keeps the run short
+os.environ.setdefault("ROVER_PIN_CACHE", "")
+os.environ.setdefault("ROVER_PIN_TABLE", os.path.join(tempfile.mkdtemp(), "pin_table.bin"))
+os.environ.setdefault("ROVER_PIN_WARMER", "0")  # warmed below, when the benchmark says so
+
+from fastapi.testclient import TestClient
+
+import disarm_engine
+import rover_server
+from disarm_jobs import PinWarmer
+
+
+def disarm_time(client, serial):
+    # Seconds from dispatching a rover onto the mine until its disarm job is done
+    client.put("/map", json={"row": 3, "col": 1})
+    client.post("/mines", json={"row": 1, "col": 0, "serialNum": serial})
+    rover_id = client.post("/rovers", json={"commands": "MD"}).json()["id"]
+    start = time.perf_counter()
+    job_id = client.post(f"/rovers/{rover_id}/dispatch").json()["disarm_jobs"][0]
+    rover_server.disarm_jobs.get(job_id).future.result()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Disarm latency with and without the PIN table")
+    parser.add_argument("--mines", type=int, default=5, help="disarms per case")
+    args = parser.parse_args()
+
+    client = TestClient(rover_server.app)
+    cold = [disarm_time(client, 1000 + i) for i in range(args.mines)]
+
+    warm_serials = list(range(2000, 2000 + args.mines))
+    warmer = PinWarmer()
+    start = time.perf_counter()
+    warmer.schedule(warm_serials, [1] * args.mines, [0] * args.mines, [(0, 0)])
+    while warmer.warmed < args.mines:
+        time.sleep(0.01)
+    warm_up = time.perf_counter() - start
+    warm = [disarm_time(client, serial) for serial in warm_serials]
+
+    # Keep the warmer busy with serials nobody asks for, then disarm cold ones
+    warmer.schedule(list(range(5000, 5000 + 10 * args.mines)), [1] * 10 * args.mines, [0] * 10 * args.mines,
+                    [(0, 0)])
+    time.sleep(0.5)
+    contended = [disarm_time(client, 3000 + i) for i in range(args.mines)]
+
+    def ms(times):
+        return f"{sum(times) / len(times) * 1000:9.1f} ms"
+
+    print(f"prefix {disarm_engine.DISARM_PREFIX!r}, {disarm_engine.engine.workers} solver processes")
+    print(f"cold disarm (solve):         {ms(cold)}")
+    print(f"warmed disarm (table hit):   {ms(warm)}   warm-up took {warm_up / args.mines * 1000:.0f} ms per PIN")
+    print(f"cold disarm, warmer running: {ms(contended)}")
+    print(f"table: {len(disarm_engine.engine.table)} PINs, "
+          f"{os.path.getsize(disarm_engine.engine.table.path)} bytes")
+    disarm_engine.engine.close()
+
+
+if __name__ == "__main__":
+    main()
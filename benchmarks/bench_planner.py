@@ -0,0 +1,45 @@
+# Sarim Shahwar
+# Route planning time on a large map at the server's mine density, by route
+# length. The search only covers states whose f is under the route's, so the
+# time follows the route length and the mines in the way, not the map size.
+# Routes past max_states or max_seconds come back as the search limit (422
+# from the server). Set ROVER_PLAN_MAX_SECONDS to time the slow ones fully.
+# Run from the repo root:  python -m benchmarks.bench_planner --size 10000
+import argparse
+import time
+
+import numpy as np
+
+import helper
+import planner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Route planner timing")
+    parser.add_argument("--size", type=int, default=10_000, help="map is size x size")
+    parser.add_argument("--density", type=float, default=helper.MINE_DENSITY)
+    parser.add_argument("--distances", type=int, nargs="+", default=[100, 500, 1000, 2000, 5000, 10000])
+    parser.add_argument("--max-states", type=int, default=planner.MAX_STATES)
+    args = parser.parse_args()
+
+    # Only the grid is needed, generate_map_grid would also list every mine
+    rng = np.random.default_rng(1)
+    grid = np.zeros((args.size, args.size), dtype=np.uint8)
+    for row in range(0, args.size, 1000):
+        grid[row:row + 1000] = rng.random((min(1000, args.size - row), args.size), dtype=np.float32) < args.density
+    grid[0, 0] = 0
+    for distance in args.distances:
+        target = (min(distance, args.size - 1), min(distance // 2, args.size - 1))
+        for mode in planner.MODES:
+            start = time.perf_counter()
+            try:
+                route = planner.plan(grid, (0, 0), 2, target, mode, max_states=args.max_states)
+                outcome = f"{len(route.commands):6d} commands, {len(route.disarms):3d} disarms, " \
+                          f"{route.searched:9d} states"
+            except (planner.NoRoute, planner.SearchLimit) as e:
+                outcome = str(e)
+            print(f"target {target} {mode:>6}: {outcome}  {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Sarim Shahwar
+# Region queries: GET /mines and GET /rovers for one viewport against
+# downloading everything and filtering on the client.
+# Run from the repo root:  python -m benchmarks.bench_queries --size 2000
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault("ROVER_COMMANDS_FIXTURE", os.path.join("fixtures", "rover_commands.json"))
+os.environ.setdefault("ROVER_PIN_WARMER", "0")
+
+from fastapi.testclient import TestClient
+
+import rover_server
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Region query benchmark")
+    parser.add_argument("--size", type=int, default=2000)
+    parser.add_argument("--density", type=float, default=0.02)
+    parser.add_argument("--rovers", type=int, default=5000)
+    parser.add_argument("--window", type=int, default=100, help="viewport side, in cells")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    client = TestClient(rover_server.app)
+    client.put("/map", json={"row": args.size, "col": args.size, "density": args.density})
+    rng = random.Random(1)
+    with rover_server.rover_lock.write():
+        # Scatter rovers over the map without dispatching them
+        for _ in range(args.rovers):
+            rover = rover_server.rovers.create("", rover_server.ROVER_IDLE)
+            rover.position = (rng.randrange(args.size), rng.randrange(args.size))
+            rover_server.rovers.save(rover)
+
+    r0 = c0 = (args.size - args.window) // 2
+    region = {"row0": r0, "col0": c0, "rows": args.window, "cols": args.window}
+
+    def inside(item):
+        return r0 <= item["row"] < r0 + args.window and c0 <= item["col"] < c0 + args.window
+
+    def in_view_rover(item):
+        return r0 <= item["position"][0] < r0 + args.window and c0 <= item["position"][1] < c0 + args.window
+
+    for name, key, keep in (("mines", "mines", inside), ("rovers", "rovers", in_view_rover)):
+        full, everything = timed(lambda: client.get(f"/{name}").json()[key], args.repeat)
+        windowed, found = timed(lambda: client.get(f"/{name}", params=region).json()[key], args.repeat)
+        assert sorted(map(str, found)) == sorted(map(str, filter(keep, everything)))
+        print(f"GET /{name:<7} all {len(everything):>7}: {full:8.1f} ms   "
+              f"{args.window}x{args.window} window ({len(found)}): {windowed:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
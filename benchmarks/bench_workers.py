@@ -0,0 +1,73 @@
+# Sarim Shahwar
+# Throughput against the number of uvicorn workers on the shared state
+# backend, with the in-memory backend (one worker) as the reference. Load
+# comes from client processes so the load generator is not GIL bound.
+# Workers only help with free cores: on an N core box expect gains up to
+# about N workers, less the cores the clients use.
+# Run from the repo root:  python -m benchmarks.bench_workers --workers 1 2 4
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.bench_concurrency import free_port, start_server
+
+COMMANDS = "MMMMRMMMMLMMMMRMMMML" * 10  # no D, keeps disarm jobs out of the picture
+
+
+def client_loop(base, rover_ids, serials, duration, slot):
+    # Mostly reads with some dispatches, like the UI plus a few controllers
+    done = 0
+    with httpx.Client(base_url=base) as client:
+        deadline = time.perf_counter() + duration
+        i = slot
+        while time.perf_counter() < deadline:
+            rover_id = rover_ids[i % len(rover_ids)]
+            if i % 10 == 0:
+                client.post(f"/rovers/{rover_id}/dispatch")
+            elif i % 2:
+                client.get(f"/mines/{serials[i % len(serials)]}")
+            else:
+                client.get(f"/rovers/{rover_id}")
+            done += 1
+            i += 1
+    return done
+
+
+def measure(backend, workers, args):
+    with tempfile.TemporaryDirectory() as state_dir:
+        env = {"ROVER_BACKEND": backend, "ROVER_STATE_DIR": state_dir}
+        proc, base = start_server(free_port(), ("--workers", str(workers)), env)
+        try:
+            setup = httpx.Client(base_url=base)
+            setup.put("/map", json={"row": args.size, "col": args.size, "density": 0.02})
+            serials = [m["id"] for m in setup.get("/mines").json()["mines"]][:500]
+            rover_ids = [setup.post("/rovers", json={"commands": COMMANDS}).json()["id"] for _ in range(100)]
+            with multiprocessing.Pool(args.clients) as pool:
+                counts = pool.starmap(client_loop, [(base, rover_ids, serials, args.duration, slot)
+                                                    for slot in range(args.clients)])
+            return sum(counts) / args.duration
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput by uvicorn worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8, help="client processes")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--size", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cpus, {args.clients} client processes")
+    print(f"memory  workers=1: {measure('memory', 1, args):8.0f} req/s")
+    for workers in args.workers:
+        print(f"shared  workers={workers}: {measure('shared', workers, args):8.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# Sarim Shahwar
+# Scenario benchmark harness: replays the seeded scenarios from
+# benchmarks/scenarios.py against the app, in-process (TestClient) and/or
+# through uvicorn, and reports p50/p99 latency and throughput per endpoint.
+#
+# Each run also records a digest of the final mines and rovers. The scenario
+# is deterministic, so a different digest means the engine changed behaviour,
+# not just speed. --save stores results in benchmarks/baselines.json and
+# --check fails (exit 1) on a digest change or a p50 slowdown beyond
+# --tolerance. p99 is reported but not gated, it is too noisy on shared boxes.
+# Run from the repo root:  python -m benchmarks.harness --transport both --check
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import httpx
+import numpy as np
+
+os.environ.setdefault("ROVER_COMMANDS_FIXTURE", os.path.join("fixtures", "rover_commands.json"))
+os.environ.setdefault("ROVER_COMMANDS_SNAPSHOT", "")
+os.environ.setdefault("ROVER_DISARM_PREFIX", "0000")  # ~65k hashes per PIN instead of ~16M
+os.environ.setdefault("ROVER_PIN_CACHE", "")  # a warm cache would hide the solver
+os.environ.setdefault("ROVER_PIN_TABLE", "")  # same for the PIN table
+os.environ.setdefault("ROVER_PIN_WARMER", "0")  # and for PINs solved ahead of the run
+
+from benchmarks.bench_concurrency import free_port, start_server
+from benchmarks.scenarios import SCENARIOS, DEFAULT_SCENARIOS, disarm_serials, free_cells, rover_commands
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+BATCH_SIZE = 50  # rovers per POST /rovers/dispatch-batch
+
+
+class Recorder:
+    def __init__(self, client):
+        self.client = client
+        self.latencies = {}  # endpoint -> seconds per request
+        self.items = {}  # endpoint -> items handled (rovers per batch dispatch)
+
+    def call(self, name, method, url, items=1, **kwargs):
+        start = time.perf_counter()
+        response = self.client.request(method, url, **kwargs)
+        self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+        self.items[name] = self.items.get(name, 0) + items
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {url} -> {response.status_code}: {response.text[:200]}")
+        return response
+
+    def stats(self):
+        stats = {}
+        for name, samples in self.latencies.items():
+            ms = np.array(samples) * 1000
+            stats[name] = {"n": len(samples), "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                           "p99_ms": round(float(np.percentile(ms, 99)), 3),
+                           "per_s": round(self.items[name] / float(np.sum(samples)), 1)}
+        return stats
+
+
+def run_scenario(client, scenario):
+    rec = Recorder(client)
+    size, samples = scenario["size"], scenario["samples"]
+    rec.call("PUT /map", "PUT", "/map", json={"row": size, "col": size, "density": scenario["density"],
+                                              "seed": scenario["seed"]})
+    mine_cells = []
+    for _ in range(max(samples // 10, 3)):
+        mine_cells = [(m["row"], m["col"]) for m in rec.call("GET /mines", "GET", "/mines").json()["mines"]]
+    for _ in range(samples):
+        rec.call("GET /map", "GET", "/map")
+        rec.call("GET /map (bits)", "GET", "/map", params={"format": "bits"})
+        rec.call("GET /map (32x32 window)", "GET", "/map", params={"rows": 32, "cols": 32})
+
+    cells = free_cells(scenario, mine_cells, samples)
+    for i, (row, col) in enumerate(cells):
+        rec.call("POST /mines", "POST", "/mines", json={"row": row, "col": col, "serialNum": 10_000_000 + i})
+    for i in range(len(cells)):
+        rec.call("DELETE /mines/{id}", "DELETE", f"/mines/{10_000_000 + i}")
+
+    ids = [rec.call("POST /rovers", "POST", "/rovers", json={"commands": commands}).json()["id"]
+           for commands in rover_commands(scenario)]
+    for rover_id in ids[:samples]:
+        rec.call("GET /rovers/{id}", "GET", f"/rovers/{rover_id}")
+    half = len(ids) // 2
+    for rover_id in ids[:half]:
+        rec.call("POST /rovers/{id}/dispatch", "POST", f"/rovers/{rover_id}/dispatch")
+    for start in range(half, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+        rec.call("POST /rovers/dispatch-batch", "POST", "/rovers/dispatch-batch", items=len(batch),
+                 json={"ids": batch})
+
+    # Behaviour fingerprint: final mines and rovers (ids left out, they depend on earlier runs)
+    final_mines = sorted((m["row"], m["col"], m["id"]) for m in client.get("/mines").json()["mines"])
+    final_rovers = [client.get(f"/rovers/{rover_id}").json() for rover_id in ids]
+    final_rovers = [(r["commands"], r["status"], r["position"], r["executed_commands"]) for r in final_rovers]
+    digest = hashlib.sha256(json.dumps([final_mines, final_rovers]).encode()).hexdigest()[:16]
+
+    # Disarm end to end: dispatch onto a mine, then poll until the PIN is in
+    client.put("/map", json={"row": size, "col": size})
+    for serial in disarm_serials(scenario):
+        client.post("/mines", json={"row": 1, "col": 0, "serialNum": serial})
+        rover_id = client.post("/rovers", json={"commands": "MD"}).json()["id"]
+        start = time.perf_counter()
+        job_id = client.post(f"/rovers/{rover_id}/dispatch").json()["disarm_jobs"][0]
+        while client.get(f"/disarm-jobs/{job_id}").json()["status"] not in ("done", "failed"):
+            time.sleep(0.002)
+        rec.latencies.setdefault("disarm (dispatch -> PIN)", []).append(time.perf_counter() - start)
+        rec.items["disarm (dispatch -> PIN)"] = rec.items.get("disarm (dispatch -> PIN)", 0) + 1
+    return rec.stats(), digest
+
+
+def compare(name, result, baseline, tolerance, min_delta_ms):
+    # Returns a list of regression messages
+    problems = []
+    if baseline["digest"] != result["digest"]:
+        problems.append(f"{name}: final state digest {result['digest']} != baseline {baseline['digest']}")
+    for endpoint, stats in result["endpoints"].items():
+        base = baseline["endpoints"].get(endpoint)
+        if base is None:
+            continue
+        if stats["p50_ms"] > base["p50_ms"] * (1 + tolerance) and stats["p50_ms"] - base["p50_ms"] > min_delta_ms:
+            problems.append(f"{name}: {endpoint} p50 {stats['p50_ms']:.2f}ms vs baseline {base['p50_ms']:.2f}ms")
+    return problems
+
+
+def print_result(name, result, baseline):
+    print(f"\n{name}  (digest {result['digest']})")
+    print(f"  {'endpoint':<30}{'n':>6}{'p50 ms':>10}{'p99 ms':>10}{'per s':>12}{'p50 vs base':>13}")
+    for endpoint, stats in result["endpoints"].items():
+        base = (baseline or {}).get("endpoints", {}).get(endpoint)
+        delta = f"{(stats['p50_ms'] / base['p50_ms'] - 1) * 100:+.0f}%" if base and base["p50_ms"] else ""
+        print(f"  {endpoint:<30}{stats['n']:>6}{stats['p50_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+              f"{stats['per_s']:>12,.1f}{delta:>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seeded scenario benchmarks with stored baselines")
+    parser.add_argument("--scenarios", nargs="+", default=DEFAULT_SCENARIOS, choices=sorted(SCENARIOS))
+    parser.add_argument("--transport", choices=["inprocess", "uvicorn", "both"], default="inprocess")
+    parser.add_argument("--baselines", default=BASELINES_PATH)
+    parser.add_argument("--save", action="store_true", help="store these results as the new baselines")
+    parser.add_argument("--check", action="store_true", help="exit 1 on regressions against the baselines")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown, 0.5 = 50%%")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    transports = ["inprocess", "uvicorn"] if args.transport == "both" else [args.transport]
+    results = {}
+    for transport in transports:
+        proc = None
+        if transport == "inprocess":
+            from fastapi.testclient import TestClient
+            import rover_server
+            client = TestClient(rover_server.app)
+        else:
+            proc, base = start_server(free_port())
+            client = httpx.Client(base_url=base, timeout=60)
+        try:
+            for scenario_name in args.scenarios:
+                name = f"{scenario_name}/{transport}"
+                endpoints, digest = run_scenario(client, SCENARIOS[scenario_name])
+                results[name] = {"digest": digest, "endpoints": endpoints}
+                print_result(name, results[name], baselines.get(name))
+        finally:
+            if proc is not None:
+                client.close()
+                proc.terminate()
+                proc.wait()
+
+    problems = []
+    for name, result in results.items():
+        if name in baselines:
+            problems += compare(name, result, baselines[name], args.tolerance, args.min_delta_ms)
+    if args.save:
+        baselines.update(results)
+        with open(args.baselines, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nsaved {len(results)} baseline(s) to {args.baselines}")
+    if problems:
+        print("\nregressions:")
+        for problem in problems:
+            print("  " + problem)
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# Sarim Shahwar
+# Seeded scenarios for benchmarks/harness.py. A scenario fixes the map size,
+# mine density, rover count and command length; its seed fixes everything
+# random (mine field, serials, rover commands, extra mine cells), so two runs
+# of one scenario send exactly the same requests.
+import random
+
+SCENARIOS = {
+    "tiny": {"size": 20, "density": 0.1, "rovers": 20, "length": 50, "samples": 50, "disarms": 3, "seed": 1},
+    "small": {"size": 100, "density": 0.05, "rovers": 200, "length": 200, "samples": 200, "disarms": 10, "seed": 2},
+    "dense": {"size": 100, "density": 0.3, "rovers": 200, "length": 100, "samples": 200, "disarms": 10, "seed": 3},
+    "large": {"size": 1000, "density": 0.02, "rovers": 1000, "length": 1000, "samples": 50, "disarms": 10,
+              "seed": 4},
+}
+DEFAULT_SCENARIOS = ["tiny", "small", "dense"]
+
+# Weighted so rovers travel. No D: background disarm jobs would compete with
+# the dispatch timings, disarms get their own phase in the harness.
+COMMAND_CHOICES = "MMMMMLR"
+
+
+def rover_commands(scenario):
+    rng = random.Random(scenario["seed"])
+    return ["".join(rng.choice(COMMAND_CHOICES) for _ in range(scenario["length"]))
+            for _ in range(scenario["rovers"])]
+
+
+def free_cells(scenario, mine_cells, count):
+    # Cells for POST /mines that are empty on the scenario's map, never (0, 0)
+    rng = random.Random(scenario["seed"] + 1)
+    taken = set(map(tuple, mine_cells)) | {(0, 0)}
+    cells = []
+    while len(cells) < count:
+        cell = (rng.randrange(scenario["size"]), rng.randrange(scenario["size"]))
+        if cell not in taken:
+            taken.add(cell)
+            cells.append(cell)
+    return cells
+
+
+def disarm_serials(scenario):
+    rng = random.Random(scenario["seed"] + 2)
+    return rng.sample(range(20_000_000, 30_000_000), scenario["disarms"])
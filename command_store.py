@@ -0,0 +1,112 @@
+# Sarim Shahwar
+# Rover command sets from the course API, fetched lazily and kept in a TTL
+# cache that is snapshotted to disk so the server still works offline.
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+COMMANDS_API = 'https://coe892.reev.dev/lab1/rover'
+DEFAULT_IDS = range(1, 11)
+COMMANDS_TTL = float(os.environ.get("ROVER_COMMANDS_TTL", 3600))
+SNAPSHOT_PATH = os.environ.get("ROVER_COMMANDS_SNAPSHOT", "commands_snapshot.json")
+
+
+class CommandsUnavailable(Exception):
+    pass
+
+
+class RemoteCommandSource:
+    def __init__(self, api=COMMANDS_API, max_connections=10, timeout=10.0):
+        self.api = api
+        self.limits = httpx.Limits(max_connections=max_connections)
+        self.timeout = timeout
+
+    async def _fetch(self, client, rover_id):
+        r = await client.get(f'{self.api}/{rover_id}')
+        r.raise_for_status()
+        return r.json()['data']['moves']
+
+    async def fetch_many(self, ids):
+        # One pooled client per batch, every id requested at the same time
+        async with httpx.AsyncClient(limits=self.limits, timeout=self.timeout) as client:
+            results = await asyncio.gather(*(self._fetch(client, i) for i in ids), return_exceptions=True)
+        return dict(zip(ids, results))
+
+
+class FixtureCommandSource:
+    # Local stand-in for the API, backed by a JSON file of {"id": "moves"}
+    def __init__(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            self.commands = {int(k): v for k, v in json.load(f).items()}
+
+    async def fetch_many(self, ids):
+        return {i: self.commands[i] if i in self.commands else KeyError(f"No fixture for rover {i}")
+                for i in ids}
+
+
+class CommandStore:
+    def __init__(self, source, ttl=COMMANDS_TTL, snapshot_path=SNAPSHOT_PATH, warm_ids=DEFAULT_IDS):
+        self.source = source
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.warm_ids = list(warm_ids)
+        self._entries = {}  # id -> (moves, fetched_at)
+        if snapshot_path and os.path.exists(snapshot_path):
+            try:
+                with open(snapshot_path, "r", encoding="utf-8") as f:
+                    snapshot = json.load(f)
+                self._entries = {int(k): (v["moves"], v["fetched_at"]) for k, v in snapshot.items()}
+            except (OSError, ValueError, KeyError, TypeError):
+                self._entries = {}
+
+    def _fresh(self, rover_id):
+        entry = self._entries.get(rover_id)
+        return entry is not None and time.time() - entry[1] < self.ttl
+
+    def _save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        snapshot = {str(k): {"moves": moves, "fetched_at": at} for k, (moves, at) in self._entries.items()}
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, self.snapshot_path)
+
+    async def get_many(self, ids):
+        stale = [i for i in dict.fromkeys(ids) if not self._fresh(i)]
+        if stale:
+            results = await self.source.fetch_many(stale)
+            now = time.time()
+            fetched = False
+            for i, moves in results.items():
+                if not isinstance(moves, BaseException):
+                    self._entries[i] = (moves, now)
+                    fetched = True
+            if fetched:
+                self._save_snapshot()
+        out = {}
+        for i in ids:
+            # Fall back to an expired entry rather than failing when offline
+            if i not in self._entries:
+                raise CommandsUnavailable(f"Commands for rover {i} are unavailable")
+            out[i] = self._entries[i][0]
+        return out
+
+    async def get(self, rover_id):
+        # The first miss also pulls in the rest of the default set in the same batch
+        ids = [rover_id] + [i for i in self.warm_ids if i != rover_id and not self._fresh(i)]
+        try:
+            found = await self.get_many(ids)
+        except CommandsUnavailable:
+            found = await self.get_many([rover_id])
+        return found[rover_id]
+
+
+def make_source():
+    fixture = os.environ.get("ROVER_COMMANDS_FIXTURE")
+    if fixture:
+        return FixtureCommandSource(fixture)
+    return RemoteCommandSource()
@@ -0,0 +1,225 @@
+# Sarim Shahwar
+# Coverage planning: command strings for a fleet of rovers that together
+# disarm every mine on the map.
+#
+# Every rover starts where dispatch starts it, (0, 0) facing south. When a
+# rover may disarm, nothing blocks it (a mine on the way costs one D), so
+# the cost of a leg is its Manhattan distance and no path search is needed.
+#   1. One tour through all mines. Up to MATRIX_LIMIT mines: nearest neighbour
+#      on a distance matrix, then 2-opt until the time budget runs out.
+#      Larger fields: Hilbert curve order, then 2-opt in chunks.
+#   2. The tour is cut into one stretch per rover so the longest route is
+#      as short as possible.
+#   3. Each stretch becomes commands: L-shaped legs with the fewest turns,
+#      and a D after every M that lands on a mine.
+import collections
+import contextlib
+import time
+
+import numpy as np
+
+from dispatch_engine import DIRECTION_OFFSETS
+
+MATRIX_LIMIT = 2000  # mines per distance matrix (int32, 16MB at the limit)
+START = (0, 0)
+START_DIRECTION = 2  # south
+
+_STEPS = [tuple(step) for step in DIRECTION_OFFSETS.tolist()]
+_TURN = ["", "R", "RR", "L"]  # by (new heading - heading) % 4
+
+Route = collections.namedtuple("Route", ["commands", "cells"])  # cells: mines disarmed, in order
+
+
+def distance_matrix(rows, cols):
+    return (np.abs(rows[:, None] - rows[None, :]) + np.abs(cols[:, None] - cols[None, :])).astype(np.int32)
+
+
+def nearest_neighbour(dist):
+    # Path over all nodes, starting at node 0
+    n = len(dist)
+    path = np.empty(n, dtype=np.int64)
+    free = np.ones(n, dtype=bool)
+    node = 0
+    for i in range(n):
+        path[i] = node
+        free[node] = False
+        if i + 1 < n:
+            row = np.where(free, dist[node], np.iinfo(np.int32).max)
+            node = int(np.argmin(row))
+    return path
+
+
+def two_opt(path, dist, deadline):
+    # Improves an open path whose first node stays put. Reversing path[i..j]
+    # swaps edges (a, b) + (c, e) for (a, c) + (b, e), e being absent at the end.
+    path = path.copy()
+    n = len(path)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            if time.perf_counter() > deadline:
+                return path
+            a, b = path[i - 1], path[i]
+            c = path[i + 1:]
+            gain = dist[a, b] - dist[a, c]
+            e = path[i + 2:]
+            gain[:-1] += dist[c[:-1], e] - dist[b, e]
+            k = int(np.argmax(gain))
+            if gain[k] > 0:
+                path[i:i + k + 2] = path[i:i + k + 2][::-1].copy()
+                improved = True
+    return path
+
+
+def hilbert_index(rows, cols, size):
+    # Position of each cell along a Hilbert curve covering a size x size square (size a power of 2)
+    x, y = cols.astype(np.int64), rows.astype(np.int64)
+    d = np.zeros(len(x), dtype=np.int64)
+    s = size // 2
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        flip = ~ry & rx
+        x[flip] = size - 1 - x[flip]
+        y[flip] = size - 1 - y[flip]
+        swap = ~ry
+        x[swap], y[swap] = y[swap], x[swap]
+        s //= 2
+    return d
+
+
+def tour(rows, cols, time_budget):
+    # Visiting order of the mines, starting from START. Returns indices into rows/cols.
+    deadline = time.perf_counter() + time_budget
+    n = len(rows)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if n < MATRIX_LIMIT:
+        r = np.concatenate([[START[0]], rows])
+        c = np.concatenate([[START[1]], cols])
+        dist = distance_matrix(r, c)
+        return two_opt(nearest_neighbour(dist), dist, deadline)[1:] - 1
+    size = 1 << int(max(rows.max(), cols.max(), 1)).bit_length()
+    order = np.argsort(hilbert_index(rows, cols, size), kind="stable")
+    # 2-opt each chunk, anchored on the last mine of the chunk before
+    chunk = MATRIX_LIMIT - 1
+    anchor_r, anchor_c = START
+    for n_done, base in enumerate(range(0, n, chunk)):
+        part = order[base:base + chunk]
+        r = np.concatenate([[anchor_r], rows[part]])
+        c = np.concatenate([[anchor_c], cols[part]])
+        chunks_left = -(-(n - base) // chunk)
+        share = (deadline - time.perf_counter()) / chunks_left
+        path = two_opt(np.arange(len(r)), distance_matrix(r, c), time.perf_counter() + share)
+        order[base:base + chunk] = part[path[1:] - 1]
+        anchor_r, anchor_c = rows[order[base + len(part) - 1]], cols[order[base + len(part) - 1]]
+    return order
+
+
+def split(rows, cols, order, fleet):
+    # Cuts the tour into at most `fleet` stretches, minimising the longest route
+    # (Manhattan legs from START plus one D per mine). Returns (start, stop) pairs.
+    n = len(order)
+    if n == 0:
+        return []
+    r, c = rows[order].astype(np.int64), cols[order].astype(np.int64)
+    legs = np.abs(np.diff(r)) + np.abs(np.diff(c))
+    walked = np.concatenate([[0], np.cumsum(legs)])  # distance along the tour to each mine
+    reach = walked + np.arange(n)  # plus the Ds before it, stretch costs are differences of this
+    from_start = np.abs(r - START[0]) + np.abs(c - START[1])
+
+    def cuts(limit):
+        # Greedy: each stretch takes as many mines as fit in limit
+        stretches = []
+        s = 0
+        while s < n:
+            stop = int(np.searchsorted(reach, limit - from_start[s] - 1 + reach[s], side="right"))
+            if stop <= s:
+                return None
+            stretches.append((s, stop))
+            if len(stretches) > fleet:
+                return None
+            s = stop
+        return stretches
+
+    low, high = int((from_start + 1).max()), int(from_start[0] + reach[-1] + 1)
+    while low < high:
+        mid = (low + high) // 2
+        if cuts(mid) is None:
+            low = mid + 1
+        else:
+            high = mid
+    return cuts(low)
+
+
+def route_commands(grid, cells, start=START, direction=START_DIRECTION, done=None):
+    # Commands that visit cells in order, disarming every mine the rover lands on.
+    # done: mine cells already disarmed on this route (shared set, updated).
+    done = set() if done is None else done
+    out = []
+    disarmed = []
+    r, c = start
+    if grid[r, c] and (r, c) not in done:
+        out.append("D")  # anything else would set it off
+        done.add((r, c))
+        disarmed.append((r, c))
+    heading = direction
+    for tr, tc in cells:
+        if (tr, tc) in done:
+            continue  # crossed on an earlier leg
+        vertical = 2 if tr > r else 0
+        horizontal = 1 if tc > c else 3
+        rows_first = [(vertical, abs(tr - r)), (horizontal, abs(tc - c))]
+        legs = min(rows_first, rows_first[::-1], key=lambda option: _turns(heading, option))
+        for new_heading, steps in legs:
+            if not steps:
+                continue
+            out.append(_TURN[(new_heading - heading) % 4])
+            heading = new_heading
+            r, c = _leg(grid, r, c, heading, steps, out, done, disarmed)
+    return Route("".join(out), disarmed)
+
+
+def _turns(heading, legs):
+    turns = 0
+    for new_heading, steps in legs:
+        if steps:
+            turns += len(_TURN[(new_heading - heading) % 4])
+            heading = new_heading
+    return turns
+
+
+def _leg(grid, r, c, heading, steps, out, done, disarmed):
+    # Straight run of M with a D after each step onto a live mine
+    dr, dc = _STEPS[heading]
+    if dr:
+        line = grid[r + 1:r + steps + 1, c] if dr > 0 else grid[r - steps:r, c][::-1]
+    else:
+        line = grid[r, c + 1:c + steps + 1] if dc > 0 else grid[r, c - steps:c][::-1]
+    moved = 0
+    for k in np.flatnonzero(line).tolist():
+        cell = (r + (k + 1) * dr, c + (k + 1) * dc)
+        if cell in done:
+            continue
+        out.append("M" * (k + 1 - moved) + "D")
+        moved = k + 1
+        done.add(cell)
+        disarmed.append(cell)
+    out.append("M" * (steps - moved))
+    return r + steps * dr, c + steps * dc
+
+
+def plan(grid, rows, cols, fleet, time_budget=1.0, lock=None):
+    # One Route per rover (empty ones when there are more rovers than stretches).
+    # Each route disarms every mine it lands on, so any dispatch order is safe.
+    # lock, when given, is held only while the commands are read off grid.
+    order = tour(rows, cols, time_budget)
+    stretches = split(rows, cols, order, fleet)
+    with lock() if lock else contextlib.nullcontext():
+        routes = []
+        for s, stop in stretches:
+            cells = list(zip(rows[order[s:stop]].tolist(), cols[order[s:stop]].tolist()))
+            routes.append(route_commands(grid, cells))
+    return routes + [Route("", [])] * (fleet - len(routes))
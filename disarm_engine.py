@@ -0,0 +1,291 @@
+# Sarim Shahwar
+# Parallel deminer: splits the PIN search across a process pool and keeps
+# solved serial -> PIN pairs on disk so a mine never has to be cracked twice.
+# Serials the PIN table covers (pin_table.py) go there, any others to the
+# JSON cache.
+import atexit
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+import helper
+import pin_table
+
+CHUNK_SIZE = 250_000      # PINs per task handed to a worker
+CHECK_EVERY = 4096        # how often a worker looks at the shared best PIN
+NOT_FOUND = 2 ** 62
+PIN_CACHE_PATH = os.environ.get("ROVER_PIN_CACHE", "pin_cache.json")
+CACHE_FLUSH_EVERY = 1.0   # seconds a new PIN may wait before the cache file is rewritten
+# Shorter prefixes make disarms cheap, for benchmark runs and demos only
+DISARM_PREFIX = os.environ.get("ROVER_DISARM_PREFIX", helper.DISARM_PREFIX)
+
+# Shared best PIN for the solve in progress (set in each worker process)
+_best = None
+
+
+class SolveCancelled(Exception):
+    pass
+
+
+def _init_worker(best):
+    global _best
+    _best = best
+
+
+def _matcher(prefix):
+    # An all-zero prefix of even length is just a check on the raw digest bytes,
+    # which skips the hexdigest() call for every candidate.
+    if prefix and set(prefix) == {"0"} and len(prefix) % 2 == 0:
+        zeros = bytes(len(prefix) // 2)
+        size = len(zeros)
+        return lambda h: h.digest()[:size] == zeros
+    return lambda h: h.hexdigest().startswith(prefix)
+
+
+def scan_range(serial, prefix, start, stop):
+    # First PIN in [start, stop) or None. Gives up early once another worker
+    # has found a PIN lower than anything left in this range.
+    key = str(serial).encode("utf-8")
+    sha256 = hashlib.sha256
+    matches = _matcher(prefix)
+    for base in range(start, stop, CHECK_EVERY):
+        if _best is not None and _best.value < base:
+            return None
+        for pin in range(base, min(base + CHECK_EVERY, stop)):
+            if matches(sha256(key + str(pin).encode("ascii"))):
+                if _best is not None:
+                    with _best.get_lock():
+                        if pin < _best.value:
+                            _best.value = pin
+                return pin
+    return None
+
+
+class PinCache:
+    # serial -> PIN map persisted as JSON (path=None keeps it in memory only).
+    # New PINs are written together, at most CACHE_FLUSH_EVERY seconds after
+    # the first of them and on close, so n puts don't rewrite the file n times.
+    def __init__(self, path=PIN_CACHE_PATH, flush_every=CACHE_FLUSH_EVERY):
+        self.path = path
+        self.flush_every = flush_every
+        self._pins = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # one file write at a time
+        self._timer = None  # pending flush, None while the file is current
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._pins = json.load(f)
+            except (OSError, ValueError):
+                self._pins = {}
+
+    @staticmethod
+    def _key(serial, prefix):
+        return str(serial) if prefix == helper.DISARM_PREFIX else f"{serial}:{prefix}"
+
+    def get(self, serial, prefix=helper.DISARM_PREFIX):
+        return self._pins.get(self._key(serial, prefix))
+
+    def put(self, serial, pin, prefix=helper.DISARM_PREFIX):
+        with self._lock:
+            self._pins[self._key(serial, prefix)] = pin
+            if self.path and self._timer is None:
+                self._timer = threading.Timer(self.flush_every, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        # Writes the PINs put since the last flush, if any
+        with self._write_lock:
+            with self._lock:
+                if self._timer is None:
+                    return
+                self._timer.cancel()
+                self._timer = None
+                pins = dict(self._pins)
+            # Write then rename so a crash never leaves a half written cache
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(pins, f)
+            os.replace(tmp, self.path)
+
+    def __len__(self):
+        return len(self._pins)
+
+
+class DisarmEngine:
+    def __init__(self, workers=None, cache_path=PIN_CACHE_PATH, chunk_size=CHUNK_SIZE,
+                 table_path=pin_table.PIN_TABLE_PATH, table_prefix=DISARM_PREFIX):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.cache = PinCache(cache_path)
+        try:
+            self.table = pin_table.PinTable.open(table_path, table_prefix)
+        except (OSError, ValueError):
+            self.table = pin_table.PinTable(table_prefix)  # unreadable or another prefix's file, left alone
+        self.closed = False
+        self._pool = None
+        self._best = None
+        # The pool shares one best-PIN slot, so solves take turns on it
+        self._solve_lock = threading.Lock()
+        # Totals for /metrics. hashes counts PINs up to each answer, what the
+        # serial loop hashes (the pool also checks a little past it).
+        self.solves = 0
+        self.cache_hits = 0
+        self.table_hits = 0
+        self.hashes = 0
+        self._stats_lock = threading.Lock()
+        # Solves in progress by (serial, prefix), so one serial is never solved twice at once
+        self._solving = {}
+        # Disarms someone is waiting for. While there are any, background solves stop.
+        self._urgent = 0
+        self._preempt = threading.Event()
+        self._idle = threading.Condition(self._stats_lock)
+
+    def _get_pool(self):
+        if self.closed:
+            raise RuntimeError("Disarm engine is closed")
+        if self._pool is None:
+            ctx = multiprocessing.get_context("spawn")
+            self._best = ctx.Value("q", NOT_FOUND)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx,
+                                             initializer=_init_worker, initargs=(self._best,))
+        return self._pool
+
+    def solve(self, serial, prefix=helper.DISARM_PREFIX, cancel=None) -> str:
+        # cancel: Event that stops the search with SolveCancelled once it is set.
+        # Cancellable (background) solves always use the pool, so they never hold the GIL here.
+        if self.workers == 1 and cancel is None:
+            return str(scan_range(serial, prefix, 0, NOT_FOUND))
+        with self._solve_lock:
+            pool = self._get_pool()
+            self._best.value = NOT_FOUND
+            pending = {}
+            next_start = 0
+            # Keep every worker busy with consecutive ranges until one of them hits.
+            # Ranges above the hit cancel themselves, ranges below it still have to
+            # finish so we return the same (lowest) PIN as the serial loop.
+            while True:
+                if cancel is not None and cancel.is_set():
+                    self._best.value = -1  # running ranges give up at their next check
+                    for fut in pending:
+                        fut.cancel()
+                    wait(pending)
+                    raise SolveCancelled(serial)
+                while len(pending) < self.workers * 2 and next_start < self._best.value:
+                    fut = pool.submit(scan_range, serial, prefix, next_start, next_start + self.chunk_size)
+                    pending[fut] = next_start
+                    next_start += self.chunk_size
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    pending.pop(fut)
+                    fut.result()
+                best = self._best.value
+                if best != NOT_FOUND and all(start > best for start in pending.values()):
+                    for fut in pending:
+                        fut.cancel()
+                    return str(best)
+
+    def lookup(self, serial, prefix=helper.DISARM_PREFIX):
+        # PIN from the table or the cache, None if it would have to be solved
+        if prefix == self.table.prefix:
+            pin = self.table.get(serial)
+            if pin is not None:
+                return pin
+        return self.cache.get(serial, prefix)
+
+    def known(self, serials, prefix=helper.DISARM_PREFIX):
+        # Bool mask over an int array: True where the PIN needs no solving
+        serials = np.asarray(serials, dtype=np.int64)
+        found = self.table.known(serials) if prefix == self.table.prefix else np.zeros(len(serials), dtype=bool)
+        for i in np.flatnonzero(~found).tolist():
+            found[i] = self.cache.get(int(serials[i]), prefix) is not None
+        return found
+
+    def _known(self, serial, prefix):
+        # lookup() that counts hits for /metrics
+        pin = self.table.get(serial) if prefix == self.table.prefix else None
+        if pin is not None:
+            with self._stats_lock:
+                self.table_hits += 1
+            return pin
+        pin = self.cache.get(serial, prefix)
+        if pin is not None:
+            with self._stats_lock:
+                self.cache_hits += 1
+        return pin
+
+    def _store(self, serial, pin, prefix):
+        if prefix == self.table.prefix and self.table.put(serial, pin):
+            self.table.save()
+        else:
+            self.cache.put(serial, pin, prefix)
+
+    def disarm(self, serial, prefix=helper.DISARM_PREFIX, background=False) -> str:
+        # background: a warm-up solve (disarm_jobs.PinWarmer). It raises
+        # SolveCancelled as soon as a disarm someone is waiting for comes in.
+        if not background:
+            with self._stats_lock:
+                self._urgent += 1
+                self._preempt.set()
+        try:
+            key = (serial, prefix)
+            while True:
+                pin = self._known(serial, prefix)
+                if pin is not None:
+                    return pin
+                with self._stats_lock:
+                    running = self._solving.get(key)
+                    if running is None:
+                        self._solving[key] = threading.Event()
+                if running is None:
+                    break
+                running.wait()  # solved elsewhere (or given up), look again
+            try:
+                pin = self.solve(serial, prefix, cancel=self._preempt if background else None)
+                self._store(serial, pin, prefix)
+                with self._stats_lock:
+                    self.solves += 1
+                    self.hashes += int(pin) + 1
+            finally:
+                with self._stats_lock:
+                    self._solving.pop(key).set()
+            return pin
+        finally:
+            if not background:
+                with self._stats_lock:
+                    self._urgent -= 1
+                    if not self._urgent:
+                        self._preempt.clear()
+                        self._idle.notify_all()
+
+    def wait_idle(self):
+        # Blocks while disarms someone is waiting for are running
+        with self._idle:
+            while self._urgent:
+                self._idle.wait()
+
+    def close(self):
+        self.closed = True
+        self.cache.flush()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+engine = DisarmEngine()
+atexit.register(engine.close)
+
+
+def disarm(serial) -> str:
+    return engine.disarm(serial, DISARM_PREFIX)
+
+
+def cached_pin(serial):
+    # PIN if it is in the table or was solved before, never starts a solve
+    return engine.lookup(serial, DISARM_PREFIX)
@@ -0,0 +1,193 @@
+# Sarim Shahwar
+# Background disarm jobs: the PIN search runs on its own threads so the API
+# lock is only held long enough to mark a mine as "disarming".
+import collections
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import disarm_engine
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+MAX_FINISHED_JOBS = 10_000  # finished jobs kept for GET /disarm-jobs/{id}, the oldest go first
+
+log = logging.getLogger(__name__)
+
+
+class DisarmJob:
+    __slots__ = ("id", "serial", "row", "col", "status", "pin", "error", "future", "seconds")
+
+    def __init__(self, job_id, serial, row, col):
+        self.id = job_id
+        self.serial = serial
+        self.row = row
+        self.col = col
+        self.status = JOB_PENDING
+        self.pin = None
+        self.error = None
+        self.future = None
+        self.seconds = None  # time spent in the solver
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "serial": self.serial,
+            "row": self.row,
+            "col": self.col,
+            "status": self.status,
+            "pin": self.pin,
+            "error": self.error
+        }
+
+
+class DisarmJobQueue:
+    def __init__(self, solver=disarm_engine.disarm, workers=2, ids=None, keep=MAX_FINISHED_JOBS):
+        self.solver = solver
+        self.keep = keep
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="disarm")
+        self._ids = ids or itertools.count(1).__next__  # the shared backend hands out ids across workers
+        self._jobs = {}
+        self._finished = collections.deque()  # job ids in the order they finished
+        self._lock = threading.Lock()
+
+    def submit(self, serial, row, col, on_done=None) -> DisarmJob:
+        with self._lock:
+            job = DisarmJob(self._ids(), serial, row, col)
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job, on_done)
+        return job
+
+    def _run(self, job, on_done):
+        job.status = JOB_RUNNING
+        start = time.perf_counter()
+        try:
+            job.pin = self.solver(job.serial)
+            job.status = JOB_DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = JOB_FAILED
+        job.seconds = time.perf_counter() - start
+        if on_done is not None:
+            on_done(job)
+        with self._lock:
+            # Pending and running jobs stay, finished ones past keep are forgotten (404)
+            self._finished.append(job.id)
+            while len(self._finished) > self.keep:
+                del self._jobs[self._finished.popleft()]
+        return job.pin
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+
+MAX_SOURCES = 1024  # rover cells compared exactly, more than that are merged into buckets
+SOURCE_BUCKET = 16  # cells per bucket side when merging
+POSITIONS_EVERY = 1.0  # seconds the warmer ranks against the same rover positions
+
+
+def proximity(rows, cols, positions):
+    # Manhattan distance from each (rows[i], cols[i]) to the nearest of positions
+    sources = np.unique(np.asarray(positions, dtype=np.int64).reshape(-1, 2), axis=0)
+    if len(sources) > MAX_SOURCES:
+        # Approximate: nearest bucket centre
+        sources = np.unique(sources // SOURCE_BUCKET, axis=0) * SOURCE_BUCKET + SOURCE_BUCKET // 2
+    rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+    nearest = np.empty(len(rows), dtype=np.int64)
+    chunk = max(1, (1 << 22) // max(len(sources), 1))  # keeps each distance block around 32MB
+    for start in range(0, len(rows), chunk):
+        r, c = rows[start:start + chunk, None], cols[start:start + chunk, None]
+        nearest[start:start + chunk] = (np.abs(r - sources[:, 0]) + np.abs(c - sources[:, 1])).min(axis=1)
+    return nearest
+
+
+class PinWarmer:
+    # Solves PINs for mines on the map before anyone disarms them, so the
+    # disarm finds its PIN in the table. One thread, mines nearest a rover
+    # first, one solve at a time, and only while no real disarm is waiting:
+    # those cancel a warm-up solve in progress, which goes back in the queue.
+    # positions() returns the rover cells, the warmer thread calls it when it
+    # ranks and keeps the answer for POSITIONS_EVERY seconds.
+    def __init__(self, engine=None, prefix=None, positions=None):
+        self.engine = engine or disarm_engine.engine
+        self.prefix = prefix or disarm_engine.DISARM_PREFIX
+        self.positions = positions or (lambda: [(0, 0)])
+        self.warmed = 0
+        self._queue = []  # heap of (distance to nearest rover, serial)
+        self._incoming = []  # (serials, rows, cols, replace), ranked on the warmer thread
+        self._snapshot = (None, 0.0)  # (rover cells, when they were read)
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        with self._cond:
+            return len(self._queue) + sum(len(batch[0]) for batch in self._incoming)
+
+    def schedule(self, serials, rows, cols, replace=False):
+        # Queues mines by distance to the nearest rover. replace drops what was
+        # queued before (new map, the whole map queued again).
+        with self._cond:
+            if replace:
+                self._incoming.clear()
+            self._incoming.append((np.asarray(serials), rows, cols, replace))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pin-warmer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _rover_cells(self):
+        cells, read_at = self._snapshot
+        if cells is None or time.monotonic() - read_at >= POSITIONS_EVERY:
+            cells = self.positions()
+            self._snapshot = (cells, time.monotonic())
+        return cells
+
+    def _rank(self, serials, rows, cols, replace):
+        todo = ~self.engine.known(serials, self.prefix)
+        distance = proximity(np.asarray(rows)[todo], np.asarray(cols)[todo], self._rover_cells())
+        entries = list(zip(distance.tolist(), serials[todo].tolist()))
+        with self._cond:
+            if replace:
+                self._queue = entries
+                heapq.heapify(self._queue)
+            else:
+                for entry in entries:
+                    heapq.heappush(self._queue, entry)
+
+    def _next(self):
+        with self._cond:
+            while not self._queue and not self._incoming:
+                self._cond.wait()
+            incoming, self._incoming = self._incoming, []
+        for batch in incoming:
+            self._rank(*batch)
+        with self._cond:
+            return heapq.heappop(self._queue) if self._queue and not self._incoming else None
+
+    def _run(self):
+        while not self.engine.closed:
+            entry = self._next()
+            if entry is None:
+                continue  # more mines came in, rank them first
+            self.engine.wait_idle()
+            try:
+                if self.engine.lookup(entry[1], self.prefix) is None:
+                    self.engine.disarm(entry[1], self.prefix, background=True)
+                    self.warmed += 1
+            except disarm_engine.SolveCancelled:
+                with self._cond:
+                    heapq.heappush(self._queue, entry)
+            except (ValueError, OverflowError):
+                pass  # a serial the solver can't take, skip it
+            except Exception:
+                if self.engine.closed:
+                    return  # shut down under the solve
+                log.exception("PIN warm-up for serial %s failed", entry[1])
@@ -0,0 +1,165 @@
+# Sarim Shahwar
+# Dispatch engine: compiled command programs for single rovers, and batch
+# dispatch that simulates many rovers in one pass with numpy.
+#
+# Batch dispatch relies on a rover's path not depending on mines. On a mine
+# cell a rover either explodes or runs D, and D never moves it. So every
+# rover's positions are worked out at once from its commands. The (few) steps that land on a mine are then
+# replayed in rover order, then step order. That gives the same result as
+# dispatching the rovers one after another.
+import functools
+
+import numpy as np
+
+CMD_L, CMD_R, CMD_M, CMD_D, CMD_PAD = 0, 1, 2, 3, 255
+DIRECTION_OFFSETS = np.array([[-1, 0], [0, 1], [1, 0], [0, -1]])  # North, East, South, West
+_STEPS = [tuple(step) for step in DIRECTION_OFFSETS.tolist()]
+CHUNK_ROVERS = 2048  # rovers simulated together, bounds the (rovers x steps) arrays
+OP_TURN, OP_MOVE, OP_DISARM = 0, 1, 2
+LONG_RUN = 16  # M runs at least this long are checked with a numpy slice
+VALID_COMMANDS = frozenset("LRMD")
+
+_codes = np.full(256, CMD_PAD, dtype=np.uint8)
+for _ch, _code in (("L", CMD_L), ("R", CMD_R), ("M", CMD_M), ("D", CMD_D)):
+    _codes[ord(_ch)] = _code
+
+
+class RoverResult:
+    __slots__ = ("exploded", "executed", "position")
+
+    def __init__(self, exploded, executed, position):
+        self.exploded = exploded
+        self.executed = executed
+        self.position = position
+
+
+def encode_commands(command_strings):
+    # (rovers x longest) uint8 codes padded with CMD_PAD, plus each length
+    lengths = np.array([len(s) for s in command_strings], dtype=np.int64)
+    codes = np.full((len(command_strings), int(lengths.max(initial=0))), CMD_PAD, dtype=np.uint8)
+    for i, s in enumerate(command_strings):
+        if s:
+            codes[i, :len(s)] = _codes[np.frombuffer(s.encode("ascii"), dtype=np.uint8)]
+    return codes, lengths
+
+
+def trajectories(codes, shape, start=(0, 0), direction=2):
+    # Position of every rover before each of its commands, assuming no mines.
+    # A move off the map is a no-op, which is the same as clamping each axis.
+    n, steps = codes.shape
+    turns = np.where(codes == CMD_L, -1, np.where(codes == CMD_R, 1, 0))
+    directions = (direction + np.cumsum(turns, axis=1) - turns) % 4  # heading before each command
+    moving = codes == CMD_M
+    dr = np.where(moving, DIRECTION_OFFSETS[directions, 0], 0)
+    dc = np.where(moving, DIRECTION_OFFSETS[directions, 1], 0)
+    pos_r = np.empty((n, steps), dtype=np.int64)
+    pos_c = np.empty((n, steps), dtype=np.int64)
+    r = np.full(n, start[0], dtype=np.int64)
+    c = np.full(n, start[1], dtype=np.int64)
+    for t in range(steps):
+        pos_r[:, t] = r
+        pos_c[:, t] = c
+        r = np.clip(r + dr[:, t], 0, shape[0] - 1)
+        c = np.clip(c + dc[:, t], 0, shape[1] - 1)
+    return pos_r, pos_c, r, c
+
+
+def simulate(grid, command_strings, cleared=()):
+    # Returns (results, disarms). disarms lists (rover index, (row, col)) in the
+    # order the mines are taken off the map. cleared holds mine cells that no
+    # longer count, e.g. mines already being disarmed.
+    results = []
+    disarms = []
+    cleared = set(cleared)
+    for base in range(0, len(command_strings), CHUNK_ROVERS):
+        chunk = command_strings[base:base + CHUNK_ROVERS]
+        codes, lengths = encode_commands(chunk)
+        pos_r, pos_c, end_r, end_c = trajectories(codes, grid.shape)
+        live = np.arange(codes.shape[1]) < lengths[:, None]
+        hits = (grid[pos_r, pos_c] != 0) & live
+        exploded_at = {}
+        for i, t in zip(*(a.tolist() for a in np.nonzero(hits))):
+            if i in exploded_at:
+                continue
+            cell = (int(pos_r[i, t]), int(pos_c[i, t]))
+            if cell in cleared:
+                continue
+            if codes[i, t] == CMD_D:
+                cleared.add(cell)
+                disarms.append((base + i, cell))
+            else:
+                exploded_at[i] = t
+        for i, commands in enumerate(chunk):
+            if i in exploded_at:
+                t = exploded_at[i]
+                results.append(RoverResult(True, commands[:t + 1], (int(pos_r[i, t]), int(pos_c[i, t]))))
+            else:
+                results.append(RoverResult(False, commands, (int(end_r[i]), int(end_c[i]))))
+    return results, disarms
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_program(commands: str) -> tuple:
+    # Collapses a command string into (op, first index, count, net turn) runs:
+    # a run of L/R becomes one turn, a run of M one bounded jump, a run of D one disarm.
+    # Cached by string, the long external command sets are shared by many rovers.
+    if not VALID_COMMANDS.issuperset(commands):
+        raise ValueError("Invalid command in command list")
+    program = []
+    i = 0
+    while i < len(commands):
+        cmd = commands[i]
+        j = i + 1
+        if cmd in "LR":
+            net = 1 if cmd == "R" else -1
+            while j < len(commands) and commands[j] in "LR":
+                net += 1 if commands[j] == "R" else -1
+                j += 1
+            program.append((OP_TURN, i, j - i, net % 4))
+        else:
+            while j < len(commands) and commands[j] == cmd:
+                j += 1
+            program.append((OP_MOVE if cmd == "M" else OP_DISARM, i, j - i, 0))
+        i = j
+    return tuple(program)
+
+
+def run_program(program, grid, cleared=(), start=(0, 0), direction=2):
+    # Runs a compiled program the same way dispatch interprets the raw string.
+    # Returns (exploded, index of the last command run, position, cells disarmed in order).
+    rows, cols = grid.shape
+    cell_value = grid.item
+    r, c = start
+    disarmed = []
+    done = set()
+    last = -1
+    for op, index, count, net in program:
+        last = index + count - 1
+        if op == OP_MOVE:
+            dr, dc = _STEPS[direction]
+            room = (rows - 1 - r if dr > 0 else r) if dr else (cols - 1 - c if dc > 0 else c)
+            reach = min(count - 1, room)  # cells checked before each move stop at the map edge
+            if reach < LONG_RUN:
+                offsets = [k for k in range(reach + 1) if cell_value(r + k * dr, c + k * dc)]
+            else:
+                # Long jump: find the mine checkpoints on the way with one slice
+                if dr:
+                    line = grid[r:r + reach + 1, c] if dr > 0 else grid[r - reach:r + 1, c][::-1]
+                else:
+                    line = grid[r, c:c + reach + 1] if dc > 0 else grid[r, c - reach:c + 1][::-1]
+                offsets = np.flatnonzero(line).tolist()
+            for k in offsets:
+                cell = (r + k * dr, c + k * dc)
+                if cell not in cleared and cell not in done:
+                    return True, index + k, cell, disarmed
+            steps = min(count, room)
+            r, c = r + steps * dr, c + steps * dc
+        elif cell_value(r, c) and (r, c) not in cleared and (r, c) not in done:
+            if op == OP_TURN:
+                return True, index, (r, c), disarmed
+            # The first D disarms, the rest of the run does nothing
+            disarmed.append((r, c))
+            done.add((r, c))
+        elif op == OP_TURN:
+            direction = (direction + net) % 4
+    return False, last, (r, c), disarmed
@@ -0,0 +1,235 @@
+# Sarim Shahwar
+# Write-ahead event log plus snapshots, so the server state survives restarts.
+#
+# events.log holds one line per state change: "<crc32> <json>\n", each record
+# carrying a sequence number. A flusher thread writes whatever has piled up
+# and covers it with one fsync (group commit). While one fsync runs, the
+# records behind it queue up for the next one.
+#
+# snapshot.bin is the whole state as of some sequence number: a JSON header
+# followed by raw numpy arrays (grid, mine rows/cols/serials). Recovery maps
+# the file and reads the arrays in place, so no million-line parse is needed.
+# The log is truncated after every snapshot. Replay skips records the
+# snapshot already covers, so a crash between the two steps is harmless.
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+SNAPSHOT_MAGIC = b"RVSNAP1\n"
+SNAPSHOT_EVERY = 100_000  # records between automatic snapshots
+SYNC_COMMIT = "commit"  # requests wait for the fsync covering their changes
+SYNC_INTERVAL = "interval"  # fsync in the background, a crash can lose the last interval
+SYNC_INTERVAL_SECONDS = 0.01
+_ALIGN = 8
+
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _layout(header):
+    # Byte offsets of the arrays that follow the header
+    offset = _aligned(header["header_end"])
+    layout = {}
+    for name, dtype, count in (("grid", np.uint8, header["rows"] * header["cols"]),
+                               ("mine_rows", np.int32, header["mines"]),
+                               ("mine_cols", np.int32, header["mines"]),
+                               ("mine_serials", np.int64, header["mines"])):
+        layout[name] = (offset, np.dtype(dtype), count)
+        offset = _aligned(offset + count * np.dtype(dtype).itemsize)
+    return layout
+
+
+def write_snapshot(path, seq, grid, mine_rows, mine_cols, mine_serials, extra):
+    # Written to a temp file and renamed, a crash leaves the old snapshot intact
+    meta = json.dumps({"seq": seq, "rows": grid.shape[0], "cols": grid.shape[1],
+                       "mines": len(mine_serials), "extra": extra}).encode()
+    header = {"header_end": len(SNAPSHOT_MAGIC) + 8 + len(meta), "rows": grid.shape[0],
+              "cols": grid.shape[1], "mines": len(mine_serials)}
+    arrays = {"grid": grid, "mine_rows": mine_rows, "mine_cols": mine_cols, "mine_serials": mine_serials}
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(SNAPSHOT_MAGIC + struct.pack("<Q", len(meta)) + meta)
+        for name, (offset, dtype, count) in _layout(header).items():
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(os.path.dirname(path) or ".")
+
+
+def read_snapshot(path):
+    # Returns {"seq", "grid", "mine_rows", "mine_cols", "mine_serials", "extra"} or None
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if mm[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a rover snapshot")
+        start = len(SNAPSHOT_MAGIC) + 8
+        (meta_len,) = struct.unpack_from("<Q", mm, len(SNAPSHOT_MAGIC))
+        meta = json.loads(mm[start:start + meta_len])
+        header = {"header_end": start + meta_len, "rows": meta["rows"], "cols": meta["cols"],
+                  "mines": meta["mines"]}
+        snapshot = {"seq": meta["seq"], "extra": meta["extra"]}
+        for name, (offset, dtype, count) in _layout(header).items():
+            view = np.frombuffer(mm, dtype=dtype, count=count, offset=offset)
+            snapshot[name] = view.copy()  # the mmap is closed on the way out
+            del view
+        snapshot["grid"] = snapshot["grid"].reshape(meta["rows"], meta["cols"])
+    return snapshot
+
+
+def read_log(path, after_seq=0):
+    # Yields records with seq > after_seq. Stops at the first torn or corrupt
+    # line, which can only be the tail a crash cut off.
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            crc, _, data = line[:-1].partition(b" ")
+            try:
+                if int(crc, 16) != zlib.crc32(data):
+                    return
+                record = json.loads(data)
+            except ValueError:
+                return
+            if record["seq"] > after_seq:
+                yield record
+
+
+class EventLog:
+    def __init__(self, directory, sync=SYNC_COMMIT, interval=SYNC_INTERVAL_SECONDS,
+                 snapshot_every=SNAPSHOT_EVERY):
+        if sync not in (SYNC_COMMIT, SYNC_INTERVAL):
+            raise ValueError(f"sync must be {SYNC_COMMIT!r} or {SYNC_INTERVAL!r}")
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_path = os.path.join(directory, "snapshot.bin")
+        self.log_path = os.path.join(directory, "events.log")
+        self.sync = sync
+        self.interval = interval
+        self.snapshot_every = snapshot_every
+        self.on_snapshot = None  # called from the flusher when a snapshot is due
+        self.seq = 0  # last sequence number handed out
+        self.durable = 0  # last sequence number on disk
+        self.flushes = 0  # fsyncs done by the flusher, records / flushes = group size
+        self._since_snapshot = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)
+        self._synced = threading.Condition(self._lock)
+        self._file_lock = threading.Lock()  # flusher writes vs snapshot truncation
+        self._file = None
+        self._closed = False
+        self._flusher = None
+
+    def recover(self):
+        # Returns (snapshot or None, records after it). Call once, before start().
+        snapshot = read_snapshot(self.snapshot_path)
+        after = snapshot["seq"] if snapshot else 0
+        records = list(read_log(self.log_path, after))
+        self.seq = self.durable = records[-1]["seq"] if records else after
+        self._since_snapshot = len(records)
+        return snapshot, records
+
+    def start(self):
+        # Drops a torn tail (if any) before appending behind it
+        valid = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    crc, _, data = line[:-1].partition(b" ")
+                    if not line.endswith(b"\n") or crc != b"%08x" % zlib.crc32(data):
+                        break
+                    valid += len(line)
+        self._file = open(self.log_path, "ab")
+        self._file.truncate(valid)
+        self._flusher = threading.Thread(target=self._run, name="event-log-flusher", daemon=True)
+        self._flusher.start()
+
+    def append(self, record) -> int:
+        # Callers hold the state lock for what they log, so seq order is state order
+        with self._lock:
+            self.seq += 1
+            data = json.dumps({"seq": self.seq, **record}, separators=(",", ":")).encode()
+            self._buffer.append(b"%08x %s\n" % (zlib.crc32(data), data))
+            self._since_snapshot += 1
+            self._work.notify()
+            return self.seq
+
+    def wait(self, seq):
+        # Blocks until seq is on disk
+        with self._lock:
+            while self.durable < seq and not self._closed:
+                self._synced.wait()
+
+    @property
+    def snapshot_due(self):
+        return self._since_snapshot >= self.snapshot_every
+
+    def snapshot(self, grid, mine_rows, mine_cols, mine_serials, extra):
+        # Caller holds the state locks, so nothing is appended meanwhile and
+        # the snapshot covers every record handed out so far.
+        with self._file_lock:
+            with self._lock:
+                seq = self.seq
+                self._buffer = []
+            write_snapshot(self.snapshot_path, seq, grid, mine_rows, mine_cols, mine_serials, extra)
+            if self._file is not None:
+                self._file.truncate(0)
+                os.fsync(self._file.fileno())
+            with self._lock:
+                self._since_snapshot = 0
+                self.durable = seq
+                self._synced.notify_all()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._buffer and not self._closed:
+                    self._work.wait()
+                if self._closed and not self._buffer:
+                    return
+            with self._file_lock:
+                with self._lock:
+                    lines, self._buffer = self._buffer, []
+                    seq = self.seq
+                if lines:
+                    self._file.write(b"".join(lines))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    self.flushes += 1
+                with self._lock:
+                    self.durable = max(self.durable, seq)
+                    self._synced.notify_all()
+            if self.snapshot_due and self.on_snapshot is not None:
+                self.on_snapshot()
+            if self.sync == SYNC_INTERVAL:
+                time.sleep(self.interval)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._work.notify()
+        if self._flusher is not None:
+            self._flusher.join()
+        if self._file is not None:
+            self._file.close()
+        with self._lock:
+            self._synced.notify_all()
@@ -0,0 +1,121 @@
+# Sarim Shahwar
+# Event hub for /ws/events: mutation paths publish small deltas, every
+# subscriber reads them at its own pace.
+#
+# Endpoints publish from threadpool threads and subscribers live on an event
+# loop, so each loop gets one shared log that publish appends to with
+# call_soon_threadsafe. A subscriber only keeps a cursor into that log, which
+# makes publishing cost the same for 1 or 10,000 subscribers. When a subscriber
+# reads, a newer event for the same mine or rover replaces the older one if it
+# touches every cell the older one did (a move also touches the cell it left),
+# and takes the newer one's place in the batch. Otherwise both are sent, so a
+# cell a coalesced event would have cleared never goes stale. Subscribers
+# reading the same stretch of log share that batch. A subscriber that falls more than
+# max_pending events behind is told to resync from the REST endpoints.
+import asyncio
+import threading
+
+MAX_PENDING = 1000
+RESYNC = [{"type": "resync"}]
+
+
+class _Channel:
+    # Everything here runs on the channel's loop
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        self.log = []  # (key, event, cells)
+        self.base = 0  # sequence number of log[0]
+        self.wakeup = asyncio.Event()
+        self.subs = set()
+        self._cached = (None, None, None)  # (start, end, batch)
+
+    @property
+    def end(self):
+        return self.base + len(self.log)
+
+    def append(self, key, event, cells):
+        self.log.append((key, event, cells))
+        if len(self.log) > 2 * self.max_pending:
+            self._trim()
+        # Wake everyone waiting right now, later waiters wait on a fresh event
+        self.wakeup.set()
+        self.wakeup = asyncio.Event()
+
+    def _trim(self):
+        # Nobody more than max_pending behind gets these events anyway
+        keep_from = max(self.end - self.max_pending, min((s.cursor for s in self.subs), default=self.end))
+        del self.log[:keep_from - self.base]
+        self.base = keep_from
+
+    def read(self, start):
+        end = self.end
+        if start == end:
+            return [], end
+        if start < self.base or end - start > self.max_pending:
+            return RESYNC, end
+        cached_start, cached_end, batch = self._cached
+        if cached_start != start or cached_end != end:
+            events, latest = [], {}  # key -> (index in events, cells)
+            for key, event, cells in self.log[start - self.base:]:
+                older = latest.get(key)
+                if older is not None and older[1] <= cells:
+                    events[older[0]] = None
+                latest[key] = (len(events), cells)
+                events.append(event)
+            batch = [event for event in events if event is not None]
+            self._cached = (start, end, batch)
+        return batch, end
+
+
+class Subscriber:
+    def __init__(self, channel):
+        self.channel = channel
+        self.cursor = channel.end
+
+    async def next_batch(self):
+        while True:
+            batch, self.cursor = self.channel.read(self.cursor)
+            if batch:
+                return batch
+            await self.channel.wakeup.wait()
+
+
+class EventHub:
+    def __init__(self, max_pending=MAX_PENDING):
+        self.max_pending = max_pending
+        self._channels = {}  # loop -> _Channel
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> Subscriber:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            channel = self._channels.get(loop)
+            if channel is None:
+                channel = self._channels[loop] = _Channel(self.max_pending)
+            sub = Subscriber(channel)
+            channel.subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            sub.channel.subs.discard(sub)
+            if not sub.channel.subs:
+                self._channels = {loop: ch for loop, ch in self._channels.items() if ch is not sub.channel}
+
+    def __len__(self):
+        return sum(len(channel.subs) for channel in self._channels.values())
+
+    @property
+    def active(self):
+        return bool(self._channels)
+
+    def publish(self, key, event, cells=frozenset()):
+        # Safe to call from any thread, costs nothing without subscribers.
+        # cells: the map cells the event changes, see read for how they coalesce
+        if not self.active:
+            return
+        for loop, channel in list(self._channels.items()):
+            try:
+                loop.call_soon_threadsafe(channel.append, key, event, cells)
+            except RuntimeError:
+                pass  # loop already closed, its subscribers are going away
@@ -1,37 +1,60 @@
 # Sarim Shahwar
+import base64
 import hashlib
 import json
-import random
-import requests
+import numpy as np
 
-def generate_map_grid(row, col, update_change=True):
-    grid = []
-    mines = []
+MINE_DENSITY = 0.2  # same odds as the old randint(1, 10) < 3 per cell
+SERIAL_LOW, SERIAL_HIGH = 1000, 10000
+
+def generate_serials(count, rng):
+    # Unique serials from 1000-9999, the range widens when a map needs more than 9000 mines
+    size = max(SERIAL_HIGH - SERIAL_LOW, count)
+    return SERIAL_LOW + rng.choice(size, size=count, replace=False)
+
+def generate_map_grid(row, col, update_change=True, density=MINE_DENSITY, seed=None):
+    # Grid is a uint8 numpy array (1 = mine), mines is a list of [row, col, serial].
+    # The same seed always gives the same field and serials.
+    grid = np.zeros((row, col), dtype=np.uint8)
     if update_change:
-        for i in range(row):
-            grid.append([0] * col)
-        return grid, mines
-    else:
-        serial_num_list = random.sample(range(1000, 10000), 9000)
-        for i in range(row):
-            curr_row = []
-            for j in range(col):
-                if random.randint(1, 10) < 3:
-                    mines.append([i, j, serial_num_list.pop()])
-                    curr_row.append(1)
-                else:
-                    curr_row.append(0)
-            grid.append(curr_row)
-        return grid, mines
+        return grid, []
+    rng = np.random.default_rng(seed)
+    # Draw in row blocks so the random floats never take more than ~8MB at once
+    block = max(1, (1 << 21) // max(col, 1))
+    for start in range(0, row, block):
+        stop = min(start + block, row)
+        grid[start:stop] = rng.random((stop - start, col), dtype=np.float32) < density
+    rows, cols = np.nonzero(grid)
+    serials = generate_serials(len(rows), rng)
+    mines = np.column_stack((rows, cols, serials)).tolist()
+    return grid, mines
+
+def map_json_chunks(grid, head, rows_per_chunk=256):
+    # Streams {...head, "map": [[0,1,...], ...]} without building the nested lists.
+    # Each row is rendered straight from the array: digits with commas in between.
+    yield (json.dumps(head)[:-1] + ', "map": [').encode()
+    rows, cols = grid.shape
+    buf = np.full(max(2 * cols - 1, 0), ord(","), dtype=np.uint8)
+    for start in range(0, rows, rows_per_chunk):
+        parts = []
+        for r in range(start, min(start + rows_per_chunk, rows)):
+            buf[0::2] = grid[r] + ord("0")
+            parts.append(b"[" + buf.tobytes() + b"]")
+        yield (b"," if start else b"") + b",".join(parts)
+    yield b"]}"
+
+def encode_bits(window) -> str:
+    # 1 bit per cell, row-major, base64 (np.unpackbits on the client side reverses it)
+    return base64.b64encode(np.packbits(window.ravel()).tobytes()).decode("ascii")
 
-def get_rover_commands(rover_id):
-    api = 'https://coe892.reev.dev/lab1/rover'
-    r = requests.get(f'{api}/{rover_id}')
-    if r.ok:
-        content = json.loads(r.content)
-        return content['data']['moves']
-    else:
-        raise Exception("Failed to fetch API")
+def encode_rle(window) -> list:
+    # [first cell value, run length, run length, ...] over the row-major cells
+    flat = window.ravel()
+    if flat.size == 0:
+        return []
+    change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    runs = np.diff(np.concatenate(([0], change, [flat.size])))
+    return [int(flat[0])] + runs.tolist()
 
 # added as it's a pain to use numbers as directions :P
 direction_map = ["North", "East", "South", "West"]
@@ -55,13 +78,14 @@ def format_response_message(response: dict) -> str:
     return f"ℹ️ Executed Command: {response['command']}"
 
 # Deminer (from prev testing)
-def disarm_mine(serial) -> str:
+DISARM_PREFIX = "000000"
+def disarm_mine(serial, prefix=DISARM_PREFIX) -> str:
     serial = str(serial)
     pin = 0
     while True:
         candidate = str(pin)
         temp_key = serial + candidate
         hashed = hashlib.sha256(temp_key.encode('utf-8')).hexdigest()
-        if hashed.startswith("000000"):
+        if hashed.startswith(prefix):
             return candidate
         pin += 1
@@ -0,0 +1,60 @@
+# Sarim Shahwar
+# Reader-writer lock for the server state: any number of readers at once, or
+# a single writer. A waiting writer stops new readers from coming in, so a
+# steady stream of GETs cannot starve dispatches.
+import threading
+import time
+from contextlib import contextmanager
+
+
+class RWLock:
+    def __init__(self, name=None):
+        self.name = name
+        self.observe = None  # observe(mode, wait seconds, hold seconds) while instrumented
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        observe = self.observe
+        if observe is not None:
+            start = time.perf_counter()
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        if observe is not None:
+            acquired = time.perf_counter()
+        try:
+            yield
+        finally:
+            if observe is not None:
+                observe("read", acquired - start, time.perf_counter() - acquired)
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        observe = self.observe
+        if observe is not None:
+            start = time.perf_counter()
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        if observe is not None:
+            acquired = time.perf_counter()
+        try:
+            yield
+        finally:
+            if observe is not None:
+                observe("write", acquired - start, time.perf_counter() - acquired)
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
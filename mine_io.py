@@ -0,0 +1,97 @@
+# Sarim Shahwar
+# Mine import/export formats for /mines/bulk and /mines/export.
+#
+# NDJSON: one {"row": .., "col": .., "serialNum": ..} object per line ("id"
+# works in place of "serialNum", so an export can be imported again).
+# CSV: a header naming the row, col and serialNum (or id) columns, then one
+# mine per line. Both are read line by line as the body arrives, and written
+# in chunks from column arrays, so neither side holds the whole set as dicts.
+import csv
+import json
+
+FORMAT_NDJSON = "ndjson"
+FORMAT_CSV = "csv"
+FORMATS = (FORMAT_NDJSON, FORMAT_CSV)
+MEDIA_TYPES = {FORMAT_NDJSON: "application/x-ndjson", FORMAT_CSV: "text/csv"}
+_SERIAL_KEYS = ("serialNum", "id", "serial")
+
+
+def format_for(content_type):
+    # Body format from a Content-Type header, None if it is neither
+    media = (content_type or "").split(";")[0].strip().lower()
+    if media in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-seq"):
+        return FORMAT_NDJSON
+    if media in ("text/csv", "application/csv"):
+        return FORMAT_CSV
+    return None
+
+
+async def lines(chunks):
+    # Splits an async stream of byte chunks into lines, keeping only the unfinished tail
+    tail = b""
+    async for chunk in chunks:
+        parts = (tail + chunk).split(b"\n")
+        tail = parts.pop()
+        for part in parts:
+            yield part
+    if tail:
+        yield tail
+
+
+def _as_int(value, name):
+    if isinstance(value, str):
+        value = value.strip()
+        if value.lstrip("-").isdigit():
+            return int(value)
+    elif isinstance(value, int) and not isinstance(value, bool):
+        return value
+    raise ValueError(f"{name} must be an integer")
+
+
+class RowParser:
+    # parse(line) -> (row, col, serial), None for lines without a mine
+    # (blank, CSV header), ValueError with a message for a bad line
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self.columns = None  # CSV: index of row, col, serial
+
+    def parse(self, line):
+        text = line.decode("utf-8").strip()
+        if not text:
+            return None
+        if self.fmt == FORMAT_NDJSON:
+            try:
+                data = json.loads(text)
+            except ValueError:
+                raise ValueError("Not valid JSON")
+            if not isinstance(data, dict):
+                raise ValueError("Expected a JSON object")
+            serial_key = next((key for key in _SERIAL_KEYS if key in data), None)
+            if "row" not in data or "col" not in data or serial_key is None:
+                raise ValueError("Needs row, col and serialNum")
+            return _as_int(data["row"], "row"), _as_int(data["col"], "col"), _as_int(data[serial_key], "serialNum")
+        fields = next(csv.reader([text]))
+        if self.columns is None:
+            names = [name.strip() for name in fields]
+            serial_key = next((key for key in _SERIAL_KEYS if key in names), None)
+            if "row" not in names or "col" not in names or serial_key is None:
+                raise ValueError("CSV header must name row, col and serialNum columns")
+            self.columns = (names.index("row"), names.index("col"), names.index(serial_key))
+            return None
+        try:
+            return tuple(_as_int(fields[i], name) for i, name in zip(self.columns, ("row", "col", "serialNum")))
+        except IndexError:
+            raise ValueError("Missing columns")
+
+
+def export_chunks(rows, cols, serials, fmt, rows_per_chunk=10_000):
+    # Streams mines from column arrays, one chunk of lines at a time
+    if fmt == FORMAT_CSV:
+        yield b"id,row,col\n"
+    for start in range(0, len(serials), rows_per_chunk):
+        stop = start + rows_per_chunk
+        chunk = zip(serials[start:stop].tolist(), rows[start:stop].tolist(), cols[start:stop].tolist())
+        if fmt == FORMAT_CSV:
+            yield "".join(f"{s},{r},{c}\n" for s, r, c in chunk).encode()
+        else:
+            yield "".join(f'{{"id": {s}, "row": {r}, "col": {c}}}\n' for s, r, c in chunk).encode()
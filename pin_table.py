@@ -0,0 +1,192 @@
+# Sarim Shahwar
+# PIN table: solved disarm PINs for one prefix and a contiguous range of
+# serials, as a flat array in a small binary file. generate_map_grid draws
+# serials from 1000 up, so the table covers them from the first disarm and
+# can be built ahead of time (python -m pin_table) and shipped in the image.
+#
+# Layout, little-endian: magic b"RPIN", version u16, prefix (10 bytes, NUL
+# padded), base serial u32, count u32, then count uint32 PINs. MISSING marks
+# a serial that hasn't been solved yet. 9000 serials take 36KB.
+import argparse
+import fcntl
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+import helper
+
+MAGIC = b"RPIN"
+VERSION = 1
+HEADER = struct.Struct("<4sH10sII")
+MISSING = 0xFFFFFFFF
+MAX_COUNT = 1 << 22  # serials a table grows to (16MB of PINs)
+PIN_TABLE_PATH = os.environ.get("ROVER_PIN_TABLE", "pin_table.bin")
+RELOAD_EVERY = 1.0  # seconds between checks for a newer file (other processes save into it too)
+
+
+class PinTable:
+    # serial -> PIN for serials in [base, base + count). path=None keeps it in memory only.
+    def __init__(self, prefix=helper.DISARM_PREFIX, base=helper.SERIAL_LOW,
+                 count=helper.SERIAL_HIGH - helper.SERIAL_LOW, path=None):
+        self.prefix = prefix
+        self.base = base
+        self.pins = np.full(count, MISSING, dtype=np.uint32)
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None  # (mtime_ns, size) of the file last read or written
+        self._checked = 0.0
+
+    @property
+    def count(self):
+        return len(self.pins)
+
+    @classmethod
+    def open(cls, path, prefix=helper.DISARM_PREFIX):
+        # The table saved at path, an empty one for it if there is no file yet.
+        # ValueError when the file is not a PIN table or is for another prefix.
+        if not path or not os.path.exists(path):
+            return cls(prefix, path=path)
+        table, stamp = _load(path, prefix)
+        table._stamp = stamp
+        return table
+
+    @classmethod
+    def from_bytes(cls, data, path=None):
+        if len(data) < HEADER.size:
+            raise ValueError("Not a PIN table")
+        magic, version, prefix, base, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a PIN table")
+        pins = np.frombuffer(data, dtype="<u4", count=count, offset=HEADER.size)
+        table = cls(prefix.rstrip(b"\0").decode("ascii"), base, 0, path)
+        table.pins = pins.astype(np.uint32)
+        return table
+
+    def to_bytes(self):
+        head = HEADER.pack(MAGIC, VERSION, self.prefix.encode("ascii"), self.base, self.count)
+        return head + self.pins.astype("<u4").tobytes()
+
+    def get(self, serial):
+        # PIN as a string, None if it isn't in the table
+        i = serial - self.base
+        if 0 <= i < self.count and self.pins[i] != MISSING:
+            return str(int(self.pins[i]))
+        if self.path and time.monotonic() - self._checked >= RELOAD_EVERY and self._reload():
+            return self.get(serial)
+        return None
+
+    def known(self, serials):
+        # Bool mask over an int array: True where the table has the PIN
+        i = np.asarray(serials, dtype=np.int64) - self.base
+        inside = (i >= 0) & (i < self.count)
+        found = np.zeros(len(i), dtype=bool)
+        found[inside] = self.pins[i[inside]] != MISSING
+        return found
+
+    def put(self, serial, pin):
+        # False for a serial the table can't hold (below base, too far above it) or a PIN over 32 bits
+        i = serial - self.base
+        pin = int(pin)
+        if i < 0 or i >= MAX_COUNT or not 0 <= pin < MISSING:
+            return False
+        with self._lock:
+            if i >= self.count:
+                # Serials past the range (maps of more than 9000 mines) grow the table
+                grown = np.full(i + 1, MISSING, dtype=np.uint32)
+                grown[:self.count] = self.pins
+                self.pins = grown
+            self.pins[i] = pin
+        return True
+
+    def __len__(self):
+        return int(np.count_nonzero(self.pins != MISSING))
+
+    def _merge(self, other):
+        # PINs are deterministic, so the union of two tables is always right
+        with self._lock:
+            if other.base != self.base:
+                return
+            if other.count > self.count:
+                grown = np.full(other.count, MISSING, dtype=np.uint32)
+                grown[:self.count] = self.pins
+                self.pins = grown
+            head = self.pins[:other.count]
+            head[head == MISSING] = other.pins[head == MISSING]
+
+    def _reload(self):
+        # Picks up PINs another process saved since the last look. True if the file changed.
+        self._checked = time.monotonic()
+        try:
+            stat = os.stat(self.path)
+            if (stat.st_mtime_ns, stat.st_size) == self._stamp:
+                return False
+            other, self._stamp = _load(self.path, self.prefix)
+            self._merge(other)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def save(self):
+        # Merges with what is on disk, then writes and renames, under a lock file
+        # so processes sharing the table never lose each other's PINs
+        if not self.path:
+            return
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(self.path):
+                try:
+                    self._merge(_load(self.path, self.prefix)[0])
+                except ValueError:
+                    pass  # another prefix or a broken file, ours replaces it
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(self.to_bytes())
+            os.replace(tmp, self.path)
+            stat = os.stat(self.path)
+            self._stamp = (stat.st_mtime_ns, stat.st_size)
+
+
+def _load(path, prefix):
+    # (table, (mtime_ns, size)) from the file at path
+    with open(path, "rb") as f:
+        table = PinTable.from_bytes(f.read(), path)
+        stat = os.fstat(f.fileno())
+    if table.prefix != prefix:
+        raise ValueError(f"{path} holds PINs for prefix {table.prefix!r}, not {prefix!r}")
+    return table, (stat.st_mtime_ns, stat.st_size)
+
+
+def main():
+    # Builds (or finishes) a table ahead of time, resumes where an earlier run stopped
+    import disarm_engine
+
+    parser = argparse.ArgumentParser(description="Precompute disarm PINs into a PIN table file")
+    parser.add_argument("--out", default=PIN_TABLE_PATH)
+    parser.add_argument("--low", type=int, default=helper.SERIAL_LOW)
+    parser.add_argument("--high", type=int, default=helper.SERIAL_HIGH, help="first serial not included")
+    parser.add_argument("--prefix", default=disarm_engine.DISARM_PREFIX)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.out):
+        PinTable(args.prefix, args.low, args.high - args.low, args.out).save()
+    engine = disarm_engine.DisarmEngine(workers=args.workers, cache_path=None, table_path=args.out,
+                                        table_prefix=args.prefix)
+    try:
+        todo = [s for s in range(args.low, args.high) if engine.lookup(s, args.prefix) is None]
+        print(f"{args.high - args.low - len(todo)} PINs already in {args.out}, {len(todo)} to solve")
+        start = time.perf_counter()
+        for n, serial in enumerate(todo, 1):
+            engine.disarm(serial, args.prefix)
+            if n % 100 == 0 or n == len(todo):
+                rate = n / (time.perf_counter() - start)
+                print(f"{n}/{len(todo)} solved, {rate:.2f}/s, {(len(todo) - n) / rate / 60:.0f} min left")
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+# Sarim Shahwar
+# Route planner: the shortest command string that takes a rover from a start
+# pose to a target cell.
+#
+# A* over (row, col, heading) states where every command costs 1: L and R
+# turn in place, M moves one cell. A rover standing on a live mine explodes on
+# anything but D, so in "avoid" mode mine cells are walls and in "disarm" mode
+# entering one costs M + D. h = Manhattan distance plus the turns still needed
+# never overestimates, so the first time the target comes out of the queue
+# the route is optimal.
+#
+# The queue is a bucket per f = g + h, taken in order, so the bound starts at
+# h(start) and goes up one command at a time. A bucket is first expanded one
+# state at a time, last in first out, so ties go to the deepest state and an
+# open route is walked straight to the target. A bucket that keeps running
+# into dead ends is expanded in numpy steps instead. States are indexed over
+# the whole map, the arrays are zero-filled lazily so only the pages touched
+# cost memory. Mines are copied out of the grid (under the lock, when given) only
+# for the rectangle that states within the current f can reach, and visited
+# flags and back-pointers share one uint8 per state.
+import collections
+import contextlib
+import os
+import threading
+import time
+
+import numpy as np
+
+from dispatch_engine import DIRECTION_OFFSETS
+
+MODE_AVOID = "avoid"
+MODE_DISARM = "disarm"
+MODES = (MODE_AVOID, MODE_DISARM)
+MARGIN = 16  # first margin copied around start and target, in cells
+SMALL = 64  # dead ends a bucket may hit one state at a time before it goes to numpy
+MAX_STATES = int(os.environ.get("ROVER_PLAN_MAX_STATES", 4_000_000))  # states one plan may search
+MAX_SECONDS = float(os.environ.get("ROVER_PLAN_MAX_SECONDS", 2.0))  # and the time it may take
+
+_STEPS = [tuple(step) for step in DIRECTION_OFFSETS.tolist()]
+_DR = DIRECTION_OFFSETS[:, 0].copy()
+_DC = DIRECTION_OFFSETS[:, 1].copy()
+_START, _FROM_L, _FROM_R, _FROM_M, _FROM_MD = 1, 2, 3, 4, 5
+
+
+def _turn_table():
+    # [headings still needed as a 4-bit mask, heading] -> turns needed at least
+    table = np.zeros((16, 4), dtype=np.int64)
+    for mask in range(1, 16):
+        needed = [d for d in range(4) if mask >> d & 1]
+        for heading in range(4):
+            turns = [min((d - heading) % 4, (heading - d) % 4) for d in needed]
+            table[mask, heading] = min(turns) + (len(needed) - 1)
+    return table
+
+
+_TURNS = _turn_table()
+_TURN_ROWS = _TURNS.tolist()
+
+
+class NoRoute(Exception):
+    pass
+
+
+class SearchLimit(Exception):
+    # The search ran into max_states or max_seconds before finding a route
+    pass
+
+
+Plan = collections.namedtuple("Plan", ["commands", "disarms", "searched"])
+
+
+def plan(grid, start, direction, target, mode=MODE_AVOID, max_states=None, lock=None, max_seconds=None) -> Plan:
+    # grid: uint8 (1 = live mine). lock, when given, is held only while mines
+    # are copied out of grid, the search runs without it. Raises NoRoute when the
+    # target can't be reached, SearchLimit when max_states (MAX_STATES) or
+    # max_seconds (MAX_SECONDS) run out first.
+    max_states = MAX_STATES if max_states is None else max_states
+    deadline = time.monotonic() + (MAX_SECONDS if max_seconds is None else max_seconds)
+    (sr, sc), (tr, tc) = start, target
+    avoid = mode == MODE_AVOID
+    mines = _Snapshot(grid, start, target, lock)
+    mines.cover(0)
+    start_mine, target_mine = mines.flat[sr * mines.cols + sc], mines.flat[tr * mines.cols + tc]
+    if avoid and start_mine:
+        raise NoRoute("The start cell holds a mine")
+    if avoid and target_mine:
+        raise NoRoute("The target cell holds a mine, plan with mode=disarm to clear it")
+    commands, cells, searched = _search(mines, start, direction, target, avoid, max_states, deadline)
+    if start_mine:
+        # Any other first command would set it off
+        return Plan("D" + commands, [start] + cells, searched)
+    return Plan(commands, cells, searched)
+
+
+class _Snapshot:
+    # Mines of the rectangle around start and target that the search may reach so far
+    def __init__(self, grid, start, target, lock):
+        self.grid = grid
+        self.rows, self.cols = grid.shape
+        self.box = (min(start[0], target[0]), max(start[0], target[0]),
+                    min(start[1], target[1]), max(start[1], target[1]))
+        self.lock = lock
+        self.flat = np.zeros(grid.size, dtype=bool)  # zero-filled lazily by the OS
+        self.margin = -1
+
+    def cover(self, margin):
+        # Copies at least margin cells around the box, doubling so copies stay rare
+        if margin <= self.margin:
+            return
+        margin = min(max(margin, 2 * self.margin, MARGIN), max(self.rows, self.cols))
+        r0, r1 = max(self.box[0] - margin, 0), min(self.box[1] + margin + 1, self.rows)
+        c0, c1 = max(self.box[2] - margin, 0), min(self.box[3] + margin + 1, self.cols)
+        with self.lock() if self.lock else contextlib.nullcontext():
+            self.flat.reshape(self.rows, self.cols)[r0:r1, c0:c1] = self.grid[r0:r1, c0:c1]
+        self.margin = margin
+
+
+def _heuristic(cells, headings, width, target):
+    # Manhattan distance plus the turns still needed, never more than the real cost
+    r, c = np.divmod(cells, width)
+    dr, dc = target[0] - r, target[1] - c
+    mask = (dr < 0) * 1 | (dc > 0) * 2 | (dr > 0) * 4 | (dc < 0) * 8  # N, E, S, W as in DIRECTION_OFFSETS
+    return np.abs(dr) + np.abs(dc) + _TURNS[mask, headings]
+
+
+def _search(mines, start, direction, target, avoid, max_states, deadline):
+    # A* with a bucket queue on f - h(start). Returns (commands, disarmed cells, states searched).
+    rows, cols = mines.rows, mines.cols
+    tr, tc = target
+    goal = tr * cols + tc
+    came = np.zeros(rows * cols * 4, dtype=np.uint8)  # 0 = not reached, else _START / _FROM_*
+    seen = memoryview(came)
+    blocked = memoryview(mines.flat)
+    turns = _TURN_ROWS
+
+    def h(r, c, d):
+        dr, dc = tr - r, tc - c
+        return abs(dr) + abs(dc) + turns[(dr < 0) | (dc > 0) << 1 | (dr > 0) << 2 | (dc < 0) << 3][d]
+
+    f0 = h(start[0], start[1], direction)
+    # f - f0 -> ([states], [codes], [(state array, code array)]), small pushes go in the lists
+    buckets = collections.defaultdict(lambda: ([], [], []))
+    buckets[0][0].append((start[0] * cols + start[1]) * 4 + direction)
+    buckets[0][1].append(_START)
+    searched = 0
+    manhattan = abs(tr - start[0]) + abs(tc - start[1])
+    f = 0
+    wide = False  # this bucket has gone to numpy
+    while buckets:
+        bucket = buckets.get(f)
+        if bucket is None:
+            f += 1
+            wide = False
+            continue
+        # Cells with f under this one lie within (f + f0 - manhattan) / 2 of the box, plus the next step
+        mines.cover((f + f0 - manhattan) // 2 + 2)
+        states, codes, chunks = bucket
+        if wide or chunks:
+            # One numpy step over the whole bucket
+            batch = np.concatenate([np.array(states, dtype=np.int64)] + [chunk[0] for chunk in chunks])
+            batch_codes = np.concatenate([np.array(codes, dtype=np.uint8)] + [chunk[1] for chunk in chunks])
+            del states[:], codes[:], chunks[:]
+            batch, first = np.unique(batch, return_index=True)  # same f and state means the same g
+            batch_codes = batch_codes[first]
+            fresh = came[batch] == 0
+            batch, batch_codes = batch[fresh], batch_codes[fresh]
+            came[batch] = batch_codes
+            searched += len(batch)
+            at_goal = np.flatnonzero(batch >> 2 == goal)
+            if len(at_goal):
+                return _route(came, int(batch[at_goal[0]]), cols) + (searched,)
+            _check_limits(searched, max_states, deadline)
+            _expand(batch, f + f0, avoid, came, mines.flat, cols, rows, target, f0, buckets)
+        else:
+            # Last in first out, so ties go to the deepest state and an open route is
+            # walked straight to the target. After SMALL dead ends the rest goes to numpy.
+            dead_ends = 0
+            depth = -1
+            while states:
+                if dead_ends > SMALL and len(states) > SMALL:
+                    wide = True
+                    break
+                s = states.pop()
+                code = codes.pop()
+                if seen[s]:
+                    continue
+                seen[s] = code
+                searched += 1
+                cell = s >> 2
+                if cell == goal:
+                    return _route(came, s, cols) + (searched,)
+                if searched >= max_states or not searched & 1023:
+                    _check_limits(searched, max_states, deadline)
+                d = s & 3
+                r, c = divmod(cell, cols)
+                g = f + f0 - h(r, c, d)
+                if g <= depth:
+                    dead_ends += 1
+                depth = g
+                for turned, how in (((d + 3) & 3, _FROM_L), ((d + 1) & 3, _FROM_R)):
+                    nxt = (cell << 2) | turned
+                    if not seen[nxt]:
+                        pushed = buckets[g + 1 + h(r, c, turned) - f0]
+                        pushed[0].append(nxt)
+                        pushed[1].append(how)
+                nr, nc = r + _STEPS[d][0], c + _STEPS[d][1]
+                if 0 <= nr < rows and 0 <= nc < cols:
+                    ahead = nr * cols + nc
+                    nxt = (ahead << 2) | d
+                    if not seen[nxt]:
+                        if not blocked[ahead]:
+                            pushed = buckets[g + 1 + h(nr, nc, d) - f0]
+                            pushed[0].append(nxt)
+                            pushed[1].append(_FROM_M)
+                        elif not avoid:
+                            pushed = buckets[g + 2 + h(nr, nc, d) - f0]
+                            pushed[0].append(nxt)
+                            pushed[1].append(_FROM_MD)
+        if not (states or chunks):
+            del buckets[f]
+            f += 1
+            wide = False
+    raise NoRoute("The target cannot be reached")
+
+
+def _check_limits(searched, max_states, deadline):
+    if searched >= max_states:
+        raise SearchLimit(f"No route found within {max_states} search states")
+    if time.monotonic() > deadline:
+        raise SearchLimit("No route found within the time limit")
+
+
+def _expand(states, f, avoid, came, mines, width, height, target, f0, buckets):
+    # Pushes the successors of states (all at this f) into their buckets
+    cells, d = states >> 2, states & 3
+    g = f - _heuristic(cells, d, width, target)
+    r, c = np.divmod(cells, width)
+    nr, nc = r + _DR[d], c + _DC[d]
+    inside = (nr >= 0) & (nr < height) & (nc >= 0) & (nc < width)
+    ahead = ((nr[inside] * width + nc[inside]) << 2) | d[inside]
+    on_mine = mines[ahead >> 2]
+    moves = [((cells << 2) | ((d + 3) & 3), g + 1, _FROM_L), ((cells << 2) | ((d + 1) & 3), g + 1, _FROM_R),
+             (ahead[~on_mine], g[inside][~on_mine] + 1, _FROM_M)]
+    if not avoid:
+        moves.append((ahead[on_mine], g[inside][on_mine] + 2, _FROM_MD))
+    for next_states, next_g, code in moves:
+        open_ = came[next_states] == 0
+        next_states, next_g = next_states[open_], next_g[open_]
+        keys = next_g + _heuristic(next_states >> 2, next_states & 3, width, target) - f0
+        for key in np.unique(keys).tolist():
+            chosen = next_states[keys == key]
+            buckets[key][2].append((chosen, np.full(len(chosen), code, np.uint8)))
+
+
+def _route(came, s, width):
+    # Follows the back-pointers from the target state to the start
+    out, disarms = [], []
+    while True:
+        how = came[s]
+        if how == _START:
+            break
+        cell, d = s >> 2, s & 3
+        if how == _FROM_L:
+            out.append("L")
+            s = (cell << 2) | ((d + 1) & 3)
+        elif how == _FROM_R:
+            out.append("R")
+            s = (cell << 2) | ((d + 3) & 3)
+        else:
+            if how == _FROM_MD:
+                out.append("D")
+                disarms.append(divmod(cell, width))
+            out.append("M")
+            dr, dc = _STEPS[d]
+            s = ((cell - dr * width - dc) << 2) | d
+    return "".join(reversed(out)), disarms[::-1]
+
+
+class PlanCache:
+    # Plans for the current map version. Any mine change or a new map empties it.
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._plans = collections.OrderedDict()
+        self._mines = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _check(self, mines):
+        if mines is not self._mines or mines.version != self._version:
+            self._plans.clear()
+            self._mines, self._version = mines, mines.version
+
+    def get(self, mines, key):
+        with self._lock:
+            self._check(mines)
+            found = self._plans.get(key)
+            if found is not None:
+                self._plans.move_to_end(key)
+            return found
+
+    def put(self, mines, key, found):
+        with self._lock:
+            self._check(mines)
+            self._plans[key] = found
+            if len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
@@ -0,0 +1,72 @@
+# Sarim Shahwar
+# Sampling profiler that can be switched on while the server runs. A thread
+# snapshots every other thread's stack each interval and counts identical
+# stacks. Output is the collapsed format ("outer;inner;leaf count" per line)
+# read by flamegraph.pl and speedscope. Nothing runs while it is stopped.
+import collections
+import os
+import sys
+import threading
+
+MAX_DEPTH = 64
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self.interval = None
+        self.samples = 0
+        self._stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=0.005):
+        with self._lock:
+            if self._thread is not None:
+                raise RuntimeError("Profiler is already running")
+            self.interval = interval
+            self.samples = 0
+            self._stacks = collections.Counter()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> str:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            sampled = []
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                names = []
+                while frame is not None and len(names) < MAX_DEPTH:
+                    names.append(_frame_name(frame))
+                    frame = frame.f_back
+                sampled.append(";".join(reversed(names)))
+            del frames
+            with self._lock:
+                self._stacks.update(sampled)
+                self.samples += 1
@@ -0,0 +1,216 @@
+# Sarim Shahwar
+# Indexed state stores used by the server (constant time lookups instead of
+# scanning lists on every request).
+import bisect
+import contextlib
+import gc
+import itertools
+
+import numpy as np
+
+import spatial
+
+# Map versions are global so a replaced map never reuses an old version number
+_map_versions = itertools.count(1)
+
+
+class Mine:
+    __slots__ = ("row", "col", "serial")
+
+    def __init__(self, row, col, serial):
+        self.row = row
+        self.col = col
+        self.serial = serial
+
+    def to_dict(self):
+        return {"row": self.row, "col": self.col, "id": self.serial}
+
+
+class MineRegistry:
+    # Mines indexed by serial and by (row, col). Every change is mirrored into
+    # the numpy grid so the map and the mine list can never disagree.
+    def __init__(self, grid, mines=()):
+        self.grid = grid
+        self.version = next(_map_versions)  # bumped on every change to grid
+        self._by_serial = {}
+        self._by_cell = {}
+        for row, col, serial in mines:
+            self.add(row, col, serial)
+
+    @classmethod
+    def from_arrays(cls, grid, rows, cols, serials):
+        # Bulk load (snapshot recovery), grid already has the mines marked
+        registry = cls(grid)
+        rows, cols, serials = rows.tolist(), cols.tolist(), serials.tolist()
+        # A million new objects would set off repeated full GC passes for nothing
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            loaded = list(map(Mine, rows, cols, serials))
+            registry._by_serial = dict(zip(serials, loaded))
+            registry._by_cell = dict(zip(zip(rows, cols), loaded))
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return registry
+
+    def to_arrays(self):
+        # (rows, cols, serials) numpy arrays, the inverse of from_arrays
+        count = len(self._by_serial)
+        return (np.fromiter((m.row for m in self), dtype=np.int32, count=count),
+                np.fromiter((m.col for m in self), dtype=np.int32, count=count),
+                np.fromiter(self._by_serial, dtype=np.int64, count=count))
+
+    def __len__(self):
+        return len(self._by_serial)
+
+    def __iter__(self):
+        return iter(self._by_serial.values())
+
+    def __contains__(self, serial):
+        return serial in self._by_serial
+
+    def get(self, serial):
+        return self._by_serial.get(serial)
+
+    def at(self, row, col):
+        return self._by_cell.get((row, col))
+
+    def in_bounds(self, row, col):
+        rows, cols = self.grid.shape
+        return 0 <= row < rows and 0 <= col < cols
+
+    def add(self, row, col, serial) -> Mine:
+        if serial in self._by_serial:
+            raise ValueError(f"Mine with serial {serial} already exists")
+        if (row, col) in self._by_cell:
+            raise ValueError("Mine already exists at the set location")
+        mine = Mine(row, col, serial)
+        self._by_serial[serial] = mine
+        self._by_cell[(row, col)] = mine
+        self.grid[row, col] = 1
+        self.version = next(_map_versions)
+        return mine
+
+    def remove(self, serial) -> Mine:
+        mine = self._by_serial.pop(serial)
+        del self._by_cell[(mine.row, mine.col)]
+        self.grid[mine.row, mine.col] = 0
+        self.version = next(_map_versions)
+        return mine
+
+    def move(self, mine, row, col, serial):
+        # Caller checks that the new cell and serial are free
+        del self._by_serial[mine.serial]
+        del self._by_cell[(mine.row, mine.col)]
+        self.grid[mine.row, mine.col] = 0
+        mine.row, mine.col, mine.serial = row, col, serial
+        self._by_serial[serial] = mine
+        self._by_cell[(row, col)] = mine
+        self.grid[row, col] = 1
+        self.version = next(_map_versions)
+        return mine
+
+    def batch(self):
+        # Groups a run of changes (one transaction on the shared backend)
+        return contextlib.nullcontext()
+
+
+class Rover:
+    __slots__ = ("id", "commands", "program", "status", "position", "executed_commands", "direction")
+
+    def __init__(self, rover_id, commands, status, position=(0, 0), direction=2, program=None):
+        self.id = rover_id
+        self.commands = commands
+        self.program = program  # compiled form of commands (dispatch_engine.compile_program)
+        self.status = status
+        self.position = position
+        self.executed_commands = ""
+        self.direction = direction
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "commands": self.commands,
+            "status": self.status,
+            "position": self.position,
+            "executed_commands": self.executed_commands,
+            "direction": self.direction
+        }
+
+
+class RoverRegistry:
+    # Rovers keyed by id. Ids come from a counter so they never run out.
+    def __init__(self, first_id=100):
+        self._rovers = {}
+        self._ids = []  # sorted, so a page starts with a bisect instead of a sort
+        self._positions = spatial.BucketIndex()  # kept current by create, restore, save and remove
+        self.next_id = first_id
+
+    def __len__(self):
+        return len(self._rovers)
+
+    def __iter__(self):
+        return iter(self._rovers.values())
+
+    def get(self, rover_id):
+        return self._rovers.get(rover_id)
+
+    def create(self, commands, status, program=None) -> Rover:
+        rover = Rover(self.next_id, commands, status, program=program)
+        self.next_id += 1
+        self._rovers[rover.id] = rover
+        self._ids.append(rover.id)  # ids only go up, so this stays sorted
+        self._positions.put(rover.id, rover.position)
+        return rover
+
+    def restore(self, data, program=None) -> Rover:
+        # Puts back a rover saved with to_dict (recovery), replacing any with the same id
+        rover = Rover(data["id"], data["commands"], data["status"], tuple(data["position"]),
+                      data["direction"], program)
+        rover.executed_commands = data["executed_commands"]
+        if rover.id not in self._rovers:
+            bisect.insort(self._ids, rover.id)
+        self._rovers[rover.id] = rover
+        self._positions.put(rover.id, rover.position)
+        self.next_id = max(self.next_id, rover.id + 1)
+        return rover
+
+    def remove(self, rover_id):
+        self._positions.remove(rover_id)
+        i = bisect.bisect_left(self._ids, rover_id)
+        if i < len(self._ids) and self._ids[i] == rover_id:
+            del self._ids[i]
+        return self._rovers.pop(rover_id, None)
+
+    def save(self, rover):
+        # Rovers are changed in place, only the position index needs telling
+        if rover.id in self._rovers:
+            self._positions.put(rover.id, rover.position)
+
+    def positions(self, skip_status=None):
+        # Cells with a rover on them, leaving out rovers with skip_status
+        return list({rover.position for rover in self._rovers.values() if rover.status != skip_status})
+
+    def query(self, rect=None, status=None, after=None):
+        # Rovers by id, optionally only those with the status and inside rect
+        # (rows [r0, r1) x cols [c0, c1)) and with an id above after
+        if rect is None:
+            ids = self._ids_after(after)
+        else:
+            ids = sorted(i for i in self._positions.candidates(*rect) if after is None or i > after)
+        r0, r1, c0, c1 = rect or (None,) * 4
+        for rover_id in ids:
+            rover = self._rovers[rover_id]
+            if status is not None and rover.status != status:
+                continue
+            if rect is not None and not (r0 <= rover.position[0] < r1 and c0 <= rover.position[1] < c1):
+                continue
+            yield rover
+
+    def _ids_after(self, after):
+        # Ids above after in order, read lazily so a page only costs what it looks at
+        i = 0 if after is None else bisect.bisect_right(self._ids, after)
+        while i < len(self._ids):
+            yield self._ids[i]
+            i += 1
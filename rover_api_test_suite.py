@@ -1,8 +1,21 @@
+import os
+# Serve /commands from the local fixture so the suite runs without network access
+os.environ.setdefault("ROVER_COMMANDS_FIXTURE", os.path.join(os.path.dirname(__file__), "fixtures", "rover_commands.json"))
+os.environ.setdefault("ROVER_COMMANDS_SNAPSHOT", "")
+os.environ.setdefault("ROVER_PIN_WARMER", "0")  # tests that need it start their own
+
 from fastapi.testclient import TestClient
 from rover_server import *
+import numpy as np
+import pytest
 
 client = TestClient(app)
 
+def clear_mines():
+    # Earlier tests leave mines behind (and PUT /map keeps the field empty only without a density)
+    for m in client.get("/mines").json()["mines"]:
+        client.delete(f"/mines/{m['id']}")
+
 def test_get_map():
     response = client.get("/map")
     assert response.status_code == 200
@@ -21,6 +34,7 @@ def test_update_map():
     assert "map" in data
 
 def test_create_and_get_mine():
+    clear_mines()
     # Create a mine
     mine_payload = {"row": 2, "col": 2, "serialNum": 1234}
     response = client.post("/mines", json=mine_payload)
@@ -44,6 +58,7 @@ def test_create_and_get_mine():
     assert mine_data["col"] == mine_payload["col"]
 
 def test_delete_mine():
+    clear_mines()
     # Create a mine to delete
     mine_payload = {"row": 3, "col": 3, "serialNum": 5678}
     response = client.post("/mines", json=mine_payload)
@@ -102,6 +117,8 @@ def test_get_commands():
     assert response.status_code == 200
     data = response.json()
     assert "commands" in data
+    assert data["commands"] == command_store.source.commands[1]
+    assert client.get("/commands/999").status_code == 503
 
 def test_websocket_rover_control():
     # Create a rover to control via WebSocket
@@ -116,3 +133,832 @@ def test_websocket_rover_control():
         websocket.send_text("M")
         message = websocket.receive_json()
         assert "message" in message
+
+def test_disarm_engine_matches_serial_loop():
+    from disarm_engine import DisarmEngine
+    engine = DisarmEngine(workers=2, cache_path=None, chunk_size=5000)
+    try:
+        for serial in [1234, 4821, 7777]:
+            assert engine.solve(serial, "0000") == helper.disarm_mine(serial, "0000")
+    finally:
+        engine.close()
+
+def test_disarm_engine_pin_cache(tmp_path):
+    from disarm_engine import DisarmEngine
+    cache_file = str(tmp_path / "pins.json")
+    engine = DisarmEngine(workers=1, cache_path=cache_file)
+    pin = engine.disarm(4321, "000")
+    assert pin == helper.disarm_mine(4321, "000")
+
+    # New PINs are written in one go, on a timer or when the engine closes
+    engine.close()
+    # A fresh engine picks the solved PIN up from disk
+    reloaded = DisarmEngine(workers=1, cache_path=cache_file)
+    assert reloaded.cache.get(4321, "000") == pin
+
+    from disarm_engine import PinCache
+    batched = PinCache(str(tmp_path / "batched.json"), flush_every=60)
+    for serial in range(1000):
+        batched.put(serial, str(serial))
+    assert not os.path.exists(batched.path)
+    batched.flush()
+    assert PinCache(batched.path).get(999) == "999"
+
+# Serial 1234 needs PIN 7463024 (solved once with helper.disarm_mine)
+KNOWN_PIN = (1234, "7463024")
+
+def test_dispatch_disarm_runs_as_job(monkeypatch):
+    import time
+    import hashlib
+    import disarm_engine
+    serial, pin = KNOWN_PIN
+    assert hashlib.sha256(f"{serial}{pin}".encode()).hexdigest().startswith(helper.DISARM_PREFIX)
+    monkeypatch.setattr(disarm_engine.engine, "cache", disarm_engine.PinCache(None))
+    disarm_engine.engine.cache.put(serial, pin)
+
+    clear_mines()
+    assert client.post("/mines", json={"row": 1, "col": 0, "serialNum": serial}).status_code == 200
+    rover_id = client.post("/rovers", json={"commands": "MDM"}).json()["id"]
+    response = client.post(f"/rovers/{rover_id}/dispatch")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["rover"]["status"] == "ROVER OPERATION HAS COMPLETED"
+    assert data["rover"]["position"] == [2, 0]
+    assert len(data["disarm_jobs"]) == 1
+
+    job_id = data["disarm_jobs"][0]
+    for _ in range(100):
+        job = client.get(f"/disarm-jobs/{job_id}").json()
+        if job["status"] == "done":
+            break
+        time.sleep(0.05)
+    assert job["pin"] == pin
+    assert client.get(f"/mines/{serial}").status_code == 404
+    assert client.get("/disarm-jobs/999999").status_code == 404
+
+    # Finished jobs past the queue's keep are forgotten, oldest first
+    from disarm_jobs import DisarmJobQueue
+    queue = DisarmJobQueue(solver=lambda serial: "1", workers=1, keep=1)
+    first = queue.submit(1000, 0, 0)
+    first.future.result()
+    second = queue.submit(1001, 0, 1)
+    second.future.result()
+    assert queue.get(first.id) is None and queue.get(second.id).pin == "1"
+
+def test_websocket_disarm_reports_pin(monkeypatch):
+    import disarm_engine
+    serial, pin = KNOWN_PIN
+    monkeypatch.setattr(disarm_engine.engine, "cache", disarm_engine.PinCache(None))
+    disarm_engine.engine.cache.put(serial, pin)
+
+    clear_mines()
+    client.post("/mines", json={"row": 1, "col": 0, "serialNum": serial})
+    rover_id = client.post("/rovers", json={"commands": ""}).json()["id"]
+    with client.websocket_connect(f"/ws/rovers/{rover_id}") as websocket:
+        websocket.send_text("M")
+        websocket.receive_json()
+        websocket.send_text("D")
+        assert pin in websocket.receive_json()["message"]
+
+class CountingSource:
+    def __init__(self, commands, online=True):
+        self.commands = commands
+        self.online = online
+        self.calls = []
+
+    async def fetch_many(self, ids):
+        self.calls.append(list(ids))
+        if not self.online:
+            return {i: ConnectionError("offline") for i in ids}
+        return {i: self.commands[i] for i in ids}
+
+def test_command_store_ttl_and_snapshot(tmp_path):
+    import asyncio
+    from command_store import CommandStore
+    snapshot = str(tmp_path / "commands.json")
+    source = CountingSource({i: "M" * i for i in range(1, 11)})
+    store = CommandStore(source, ttl=60, snapshot_path=snapshot)
+
+    # First use warms the whole default set in one batch, later calls hit the cache
+    assert asyncio.run(store.get(3)) == "MMM"
+    assert asyncio.run(store.get(7)) == "MMMMMMM"
+    assert len(source.calls) == 1
+    assert sorted(source.calls[0]) == list(range(1, 11))
+
+    # An expired snapshot is still served when the API is unreachable
+    offline = CountingSource({}, online=False)
+    restored = CommandStore(offline, ttl=0, snapshot_path=snapshot)
+    assert asyncio.run(restored.get(5)) == "MMMMM"
+    assert offline.calls
+
+def test_mine_registry_keeps_grid_consistent():
+    clear_mines()
+    assert client.post("/mines", json={"row": 0, "col": 1, "serialNum": 4242}).status_code == 200
+    # Serial numbers and cells are both unique
+    assert client.post("/mines", json={"row": 0, "col": 2, "serialNum": 4242}).status_code == 400
+    assert client.post("/mines", json={"row": 0, "col": 1, "serialNum": 4243}).status_code == 400
+    assert client.post("/mines", json={"row": 99, "col": 0, "serialNum": 4244}).status_code == 400
+
+    assert client.post("/mines", json={"row": 0, "col": 3, "serialNum": 4245}).status_code == 200
+    assert client.put("/mines/4245", json={"row": 0, "col": 1}).status_code == 400
+    assert client.put("/mines/4245", json={"serialNum": 4242}).status_code == 400
+    # A failed update leaves the mine where it was
+    assert client.put("/mines/4245", json={"row": 99}).status_code == 400
+    assert client.get("/map").json()["map"][0][3] == 1
+
+    response = client.put("/mines/4245", json={"row": 1, "col": 1, "serialNum": 4246})
+    assert response.status_code == 200
+    grid_now = client.get("/map").json()["map"]
+    assert grid_now[0][3] == 0 and grid_now[1][1] == 1
+    assert client.get("/mines/4246").json()["row"] == 1
+    assert client.get("/mines/4245").status_code == 404
+
+def test_rover_ids_do_not_run_out():
+    from registry import RoverRegistry
+    store = RoverRegistry()
+    ids = [store.create("M", ROVER_IDLE).id for _ in range(5000)]
+    assert len(set(ids)) == 5000
+    assert store.get(ids[-1]).commands == "M"
+
+    rover_id = client.post("/rovers", json={"commands": "mrm"}).json()["id"]
+    assert client.get(f"/rovers/{rover_id}").json() == {
+        "id": rover_id, "commands": "MRM", "status": ROVER_IDLE,
+        "position": [0, 0], "executed_commands": "", "direction": 2
+    }
+    assert any(r["id"] == rover_id for r in client.get("/rovers").json()["rovers"])
+    assert client.delete(f"/rovers/{rover_id}").status_code == 200
+    assert client.get(f"/rovers/{rover_id}").status_code == 404
+
+def test_generate_map_grid_scales_past_9000_mines():
+    grid_big, mine_list = helper.generate_map_grid(300, 300, update_change=False, density=0.5)
+    assert grid_big.dtype == np.uint8
+    assert len(mine_list) > 9000
+    assert len({m[2] for m in mine_list}) == len(mine_list)
+    assert int(grid_big.sum()) == len(mine_list)
+    assert all(grid_big[r, c] == 1 for r, c, _ in mine_list[:100])
+
+def test_update_map_large_sparse():
+    response = client.put("/map", json={"row": 1500, "col": 2000, "density": 0.001})
+    assert response.status_code == 201
+    data = response.json()
+    assert data["row"] == 1500 and data["col"] == 2000
+    assert len(data["map"]) == 1500 and len(data["map"][0]) == 2000
+    mine_count = len(client.get("/mines").json()["mines"])
+    assert 0 < mine_count == sum(map(sum, data["map"]))
+    assert client.put("/map", json={"row": 5, "col": 5, "density": 2}).status_code == 400
+    assert client.put("/map", json={"row": 0, "col": 5}).status_code == 400
+    # Too many cells, or too many mines expected, are refused before anything is built
+    assert client.put("/map", json={"row": 100_000, "col": 100_000}).status_code == 422
+    assert client.put("/map", json={"row": 10_000, "col": 10_000, "density": 0.2}).status_code == 422
+    # Without a density the new field is empty, as before
+    assert sum(map(sum, client.put("/map", json={"row": 6, "col": 6}).json()["map"])) == 0
+
+def test_map_windows_encodings_and_etag():
+    import base64
+    client.put("/map", json={"row": 20, "col": 30, "density": 0.2})
+    full = np.array(client.get("/map").json()["map"], dtype=np.uint8)
+
+    response = client.get("/map", params={"row0": 5, "col0": 7, "rows": 4, "cols": 10})
+    data = response.json()
+    assert (data["row"], data["col"], data["rows"], data["cols"]) == (20, 30, 4, 10)
+    assert data["map"] == full[5:9, 7:17].tolist()
+
+    bits = client.get("/map", params={"format": "bits"}).json()
+    cells = np.unpackbits(np.frombuffer(base64.b64decode(bits["data"]), dtype=np.uint8))[:600]
+    assert (cells.reshape(20, 30) == full).all()
+
+    rle = client.get("/map", params={"format": "rle", "row0": 2, "rows": 3}).json()["data"]
+    value, decoded = rle[0], []
+    for run in rle[1:]:
+        decoded += [value] * run
+        value ^= 1
+    assert decoded == full[2:5].ravel().tolist()
+
+    raw = client.get("/map", headers={"Accept": "application/octet-stream"})
+    assert raw.headers["content-type"] == "application/octet-stream"
+    assert raw.headers["x-map-rows"] == "20"
+    assert (np.unpackbits(np.frombuffer(raw.content, dtype=np.uint8))[:600].reshape(20, 30) == full).all()
+
+    # Unchanged map -> 304, any mine change -> new ETag
+    response = client.get("/map")
+    etag = response.headers["etag"]
+    assert response.headers["vary"] == "Accept"
+    not_modified = client.get("/map", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304 and not_modified.headers["vary"] == "Accept"
+    assert client.get("/map", headers={"Accept": "application/octet-stream"}).headers["vary"] == "Accept"
+    clear_mines()
+    assert client.get("/map", headers={"If-None-Match": etag}).status_code == 200
+    assert client.get("/map", params={"row0": 20}).status_code == 400
+    assert client.get("/map", params={"format": "xml"}).status_code == 400
+
+def setup_dispatch_scenario(seed, rover_count=40):
+    # Fixed field and fleet so the same scenario can be replayed
+    import random as rnd
+    rng = rnd.Random(seed)
+    client.put("/map", json={"row": 12, "col": 15})
+    cells = rng.sample([(r, c) for r in range(12) for c in range(15) if (r, c) != (0, 0)], 40)
+    for serial, (r, c) in enumerate(cells, start=5000):
+        client.post("/mines", json={"row": r, "col": c, "serialNum": serial})
+    ids = []
+    for _ in range(rover_count):
+        commands = "".join(rng.choice("LRMMMDD") for _ in range(rng.randint(0, 40)))
+        ids.append(client.post("/rovers", json={"commands": commands}).json()["id"])
+    return ids
+
+def test_dispatch_batch_matches_single_dispatch(monkeypatch):
+    import rover_server
+    monkeypatch.setattr(rover_server.disarm_jobs, "solver", lambda serial: "0")
+    strip = lambda rover: (rover["commands"], rover["status"], tuple(rover["position"]), rover["executed_commands"])
+
+    ids = setup_dispatch_scenario(seed=7)
+    response = client.post("/rovers/dispatch-batch", json={"ids": ids})
+    assert response.status_code == 200
+    batch = [strip(result["rover"]) for result in response.json()["results"]]
+    batch_jobs = [len(result["disarm_jobs"]) for result in response.json()["results"]]
+    batch_mines = sorted((m["row"], m["col"]) for m in client.get("/mines").json()["mines"]
+                         if m["status"] == "armed")
+
+    ids = setup_dispatch_scenario(seed=7)
+    single, single_jobs = [], []
+    for rover_id in ids:
+        data = client.post(f"/rovers/{rover_id}/dispatch").json()
+        single.append(strip(data["rover"]))
+        single_jobs.append(len(data["disarm_jobs"]))
+    single_mines = sorted((m["row"], m["col"]) for m in client.get("/mines").json()["mines"]
+                          if m["status"] == "armed")
+
+    assert batch == single
+    assert batch_jobs == single_jobs
+    assert batch_mines == single_mines
+    assert any(status == ROVER_STATUS_ELIMINATED for _, status, _, _ in batch)
+
+    assert client.post("/rovers/dispatch-batch", json={"ids": [ids[0], ids[0]]}).status_code == 400
+    assert client.post("/rovers/dispatch-batch", json={"ids": [10 ** 9]}).status_code == 404
+
+def test_compiled_program_matches_batch_simulation():
+    import random as rnd
+    import dispatch_engine
+    rng = rnd.Random(11)
+    for _ in range(300):
+        rows, cols = rng.randint(1, 40), rng.randint(1, 40)
+        field = (np.array([[rng.random() < 0.05 for _ in range(cols)] for _ in range(rows)])).astype(np.uint8)
+        # Mix of short runs and long M runs (those take the numpy slice path)
+        commands = "".join(rng.choice(["L", "R", "M", "D", "M" * rng.randint(2, 60)]) for _ in range(rng.randint(0, 30)))
+        cleared = {(r, c) for r in range(rows) for c in range(cols) if field[r, c] and rng.random() < 0.2}
+
+        exploded, last, position, disarmed = dispatch_engine.run_program(
+            dispatch_engine.compile_program(commands), field, cleared)
+        (expected,), expected_disarms = dispatch_engine.simulate(field, [commands], cleared)
+        assert exploded == expected.exploded
+        assert commands[:last + 1] == expected.executed
+        assert position == expected.position
+        assert disarmed == [cell for _, cell in expected_disarms]
+
+    # Runs collapse: turns net out, moves and disarms become single ops
+    assert dispatch_engine.compile_program("LLRMMMDDRRRR") == (
+        (dispatch_engine.OP_TURN, 0, 3, 3), (dispatch_engine.OP_MOVE, 3, 3, 0),
+        (dispatch_engine.OP_DISARM, 6, 2, 0), (dispatch_engine.OP_TURN, 8, 4, 0))
+    hits = dispatch_engine.compile_program.cache_info().hits
+    dispatch_engine.compile_program("LLRMMMDDRRRR")
+    assert dispatch_engine.compile_program.cache_info().hits == hits + 1
+    assert client.post("/rovers", json={"commands": "MMX"}).status_code == 400
+
+def test_rwlock_readers_share_writers_exclude():
+    import threading
+    import time
+    from locks import RWLock
+    lock = RWLock()
+    both_reading = threading.Barrier(2, timeout=5)
+
+    def reader():
+        with lock.read():
+            both_reading.wait()  # only passes if two readers are inside together
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not both_reading.broken
+
+    order = []
+    writer_waiting = threading.Event()
+    with lock.read():
+        def writer():
+            writer_waiting.set()
+            with lock.write():
+                order.append("write")
+
+        def late_reader():
+            with lock.read():
+                order.append("read")
+
+        w = threading.Thread(target=writer)
+        w.start()
+        writer_waiting.wait()
+        time.sleep(0.05)
+        r = threading.Thread(target=late_reader)
+        r.start()
+        time.sleep(0.05)
+        assert order == []  # writer waits for us, the late reader waits for the writer
+    w.join()
+    r.join()
+    assert order == ["write", "read"]
+
+def test_events_websocket_pushes_deltas():
+    client.put("/map", json={"row": 6, "col": 6})
+    with client.websocket_connect("/ws/events") as websocket:
+        client.post("/mines", json={"row": 1, "col": 1, "serialNum": 3131})
+        rover_id = client.post("/rovers", json={"commands": "MMM"}).json()["id"]
+        client.post(f"/rovers/{rover_id}/dispatch")
+        client.delete("/mines/3131")
+
+        seen = []
+        while not any(e["type"] == "mine_removed" for e in seen):
+            seen += websocket.receive_json()["events"]
+    types = [e["type"] for e in seen]
+    assert "mine_added" in types and "mine_removed" in types
+    rover_events = [e["rover"] for e in seen if e["type"].startswith("rover") and e["rover"]["id"] == rover_id]
+    assert rover_events[-1]["status"] == ROVER_OPERATION_FINISHED
+    assert rover_events[-1]["position"] == [3, 0]
+
+def test_event_subscriber_coalesces_and_resyncs():
+    import asyncio
+    from events import EventHub
+
+    async def scenario():
+        hub = EventHub(max_pending=8)
+        sub = hub.subscribe()
+        for step in range(5):
+            hub.publish(("rover", 1), {"type": "rover_updated", "step": step})
+        hub.publish(("mine", 7), {"type": "mine_added"})
+        await asyncio.sleep(0)
+        first = await sub.next_batch()
+        for key in range(10):
+            hub.publish(("mine", key), {"type": "mine_added"})
+        await asyncio.sleep(0)
+        second = await sub.next_batch()
+        # A move then a remove, and a remove then an add elsewhere, keep both cells
+        hub.publish(("mine", 3), {"type": "mine_updated", "old_row": 1, "old_col": 1}, frozenset({(1, 1), (2, 2)}))
+        hub.publish(("mine", 3), {"type": "mine_removed"}, frozenset({(2, 2)}))
+        hub.publish(("mine", 4), {"type": "mine_removed"}, frozenset({(3, 3)}))
+        hub.publish(("mine", 4), {"type": "mine_added"}, frozenset({(4, 4)}))
+        await asyncio.sleep(0)
+        third = await sub.next_batch()
+        # Mine 5 and mine 6 take turns on one cell, mine 5 ends up there
+        for id, kind in [(5, "mine_added"), (5, "mine_removed"), (6, "mine_added"), (6, "mine_removed"), (5, "mine_added")]:
+            hub.publish(("mine", id), {"type": kind, "id": id}, frozenset({(5, 5)}))
+        await asyncio.sleep(0)
+        fourth = await sub.next_batch()
+        hub.unsubscribe(sub)
+        return first, second, third, fourth, hub.active
+
+    first, second, third, fourth, active = asyncio.run(scenario())
+    # Five updates for one rover collapse into the latest one
+    assert first == [{"type": "rover_updated", "step": 4}, {"type": "mine_added"}]
+    # A subscriber that overflows its queue is told to resync
+    assert second == [{"type": "resync"}]
+    assert third == [{"type": "mine_updated", "old_row": 1, "old_col": 1}, {"type": "mine_removed"},
+                     {"type": "mine_removed"}, {"type": "mine_added"}]
+    # Events on the same cells coalesce into the latest one, which stays after the others
+    assert fourth == [{"type": "mine_removed", "id": 6}, {"type": "mine_added", "id": 5}]
+    assert not active
+
+def test_websocket_batch_frames(monkeypatch):
+    import rover_server
+    monkeypatch.setattr(rover_server.disarm_jobs, "solver", lambda serial: "0")
+    client.put("/map", json={"row": 6, "col": 6})
+    client.post("/mines", json={"row": 2, "col": 0, "serialNum": 4242})
+    client.post("/mines", json={"row": 4, "col": 4, "serialNum": 4343})
+    rover_id = client.post("/rovers", json={"commands": ""}).json()["id"]
+    with client.websocket_connect(f"/ws/rovers/{rover_id}") as websocket:
+        websocket.send_text("MDMDMMLMM")
+        batch = websocket.receive_json()
+        assert batch["executed"] == "MDMDMMLMM"
+        assert batch["position"] == [4, 2] and batch["direction"] == 1
+        assert batch["errors"] == [[1, "No mine at current position"]]
+        assert batch["disarmed"] == [{"index": 3, "row": 2, "col": 0, "id": 4242, "pin": "0"}]
+
+        websocket.send_text("MXM")
+        assert websocket.receive_json() == {"error": "Invalid command batch"}
+
+        websocket.send_text('["M", "M", "M"]')
+        batch = websocket.receive_json()
+        assert batch["exploded"] and batch["executed"] == "MMM"
+        assert batch["errors"] == [[2, "Rover exploded upon encountering a mine"]]
+    rover = client.get(f"/rovers/{rover_id}").json()
+    assert rover["status"] == ROVER_STATUS_ELIMINATED
+    assert rover["executed_commands"] == "MDMDMMLMMMMM"
+    assert client.get("/mines/4242").status_code == 404
+
+# The event log is only for the in-memory backend, the shared one refuses ROVER_DATA_DIR
+@pytest.mark.skipif(os.environ.get("ROVER_BACKEND") == "shared", reason="event log is memory backend only")
+def test_event_log_restart_recovers_state(tmp_path, monkeypatch):
+    import rover_server
+    from registry import RoverRegistry
+
+    def restart():
+        # Forget the in-memory state, then rebuild it from tmp_path alone
+        monkeypatch.setattr(rover_server, "grid", None)
+        monkeypatch.setattr(rover_server, "mines", None)
+        monkeypatch.setattr(rover_server, "rovers", RoverRegistry())
+        monkeypatch.setattr(rover_server, "event_log", None)
+        rover_server.open_event_log(str(tmp_path), "interval")
+
+    restart()
+    client.put("/map", json={"row": 6, "col": 6})  # a new map is written as a snapshot
+    client.post("/mines", json={"row": 2, "col": 2, "serialNum": 11})
+    client.post("/mines", json={"row": 3, "col": 3, "serialNum": 12})
+    client.put("/mines/12", json={"row": 4, "serialNum": 13})
+    rover_id = client.post("/rovers", json={"commands": "MMLM"}).json()["id"]
+    client.post(f"/rovers/{rover_id}/dispatch")
+    # Deleted while its WebSocket is open: later moves must not bring it back
+    deleted_id = client.post("/rovers", json={"commands": ""}).json()["id"]
+    with client.websocket_connect(f"/ws/rovers/{deleted_id}") as websocket:
+        assert client.delete(f"/rovers/{deleted_id}").status_code == 200
+        websocket.send_text("M")
+        websocket.receive_json()
+    rover_server.event_log.close()
+    with open(tmp_path / "events.log", "ab") as f:
+        f.write(b'0badc0de {"seq": 99, "type": "mine_ad')  # torn write from a crash
+
+    restart()
+    try:
+        assert rover_server.grid.shape == (6, 6)
+        assert sorted((m["id"], m["row"], m["col"]) for m in client.get("/mines").json()["mines"]) == \
+            [(11, 2, 2), (13, 4, 3)]
+        rover = client.get(f"/rovers/{rover_id}").json()
+        assert rover["status"] == ROVER_OPERATION_FINISHED and rover["position"] == [2, 1]
+        assert client.get(f"/rovers/{deleted_id}").status_code == 404
+        rover_server.replay({"type": "rover_updated", "rover": {**rover, "id": deleted_id}})
+        assert client.get(f"/rovers/{deleted_id}").status_code == 404
+        assert client.post("/rovers", json={"commands": ""}).json()["id"] == deleted_id + 1
+    finally:
+        rover_server.event_log.close()
+
+def test_seeded_map_is_reproducible():
+    first, first_mines = helper.generate_map_grid(40, 30, update_change=False, density=0.2, seed=5)
+    again, again_mines = helper.generate_map_grid(40, 30, update_change=False, density=0.2, seed=5)
+    other, _ = helper.generate_map_grid(40, 30, update_change=False, density=0.2, seed=6)
+    assert np.array_equal(first, again) and first_mines == again_mines
+    assert not np.array_equal(first, other)
+
+    client.put("/map", json={"row": 40, "col": 30, "density": 0.2, "seed": 5})
+    listed = client.get("/mines").json()["mines"]
+    client.put("/map", json={"row": 40, "col": 30, "density": 0.2, "seed": 5})
+    assert client.get("/mines").json()["mines"] == listed
+
+def test_metrics_and_profiler(monkeypatch):
+    import metrics
+    import rover_server
+    assert "rover_mines" in client.get("/metrics").text
+    assert client.put("/debug/instrumentation", json={"enabled": True}).status_code == 404  # off by default
+    assert client.post("/debug/profile", json={"interval": 0.001}).status_code == 404
+    monkeypatch.setattr(rover_server, "debug_endpoints", True)
+    assert client.put("/debug/instrumentation", json={"enabled": True}).json() == {"enabled": True}
+    try:
+        rover_id = client.post("/rovers", json={"commands": "MM"}).json()["id"]
+        client.post(f"/rovers/{rover_id}/dispatch")
+        text = client.get("/metrics").text
+    finally:
+        metrics.set_enabled(False)
+    assert 'rover_http_request_duration_seconds_count{method="POST",route="/rovers/{id}/dispatch",status="200"}' in text
+    assert 'rover_lock_wait_seconds_count{lock="state",mode="write"}' in text
+    assert 'rover_dispatch_commands_bucket{mode="single",le="10"}' in text
+    assert rover_server.state_lock.observe is None  # switched off again
+
+    assert client.post("/debug/profile", json={"interval": 0.001}).status_code == 201
+    assert client.post("/debug/profile", json={}).status_code == 400  # already running
+    client.get("/map")
+    stacks = client.delete("/debug/profile").text
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in stacks.splitlines())
+    assert client.delete("/debug/profile").status_code == 400
+
+def test_shared_backend_across_workers(tmp_path):
+    # Two SharedState instances on one directory behave like two workers
+    import threading
+    from state_backend import SharedState
+    first, second = SharedState(str(tmp_path)), SharedState(str(tmp_path))
+
+    new_grid = np.zeros((8, 8), dtype=np.uint8)
+    new_grid[3, 4] = 1
+    with first.state_lock.write():
+        first.replace_map(new_grid, MineRegistry(new_grid, [[3, 4, 77]]))
+    with second.state_lock.read():  # picks up the new map on acquisition
+        assert second.grid.shape == (8, 8) and second.mines.at(3, 4).serial == 77
+        version = second.mines.version
+    with second.state_lock.write():
+        second.mines.add(5, 5, 78)
+    assert first.grid[5, 5] == 1 and first.mines.version == version + 1
+
+    # Racing adds of the same cell: the check-then-add under the write lock lets exactly one win
+    added = []
+
+    def add(state):
+        for serial in range(100, 140):
+            with state.state_lock.write():
+                if state.mines.at(6, serial % 8) is None:
+                    state.mines.add(6, serial % 8, serial)
+                    added.append(serial)
+
+    threads = [threading.Thread(target=add, args=(state,)) for state in (first, second)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(added) == 8 and int(first.grid[6].sum()) == 8
+
+    ids = [first.rovers.create("MM", "idle").id for _ in range(3)] + [second.rovers.create("R", "idle").id]
+    assert len(set(ids)) == 4
+    rover = second.rovers.get(ids[0])
+    rover.position = (2, 3)
+    second.rovers.save(rover)
+    assert first.rovers.get(ids[0]).position == (2, 3)
+    assert first.new_job_id() != second.new_job_id()
+
+def test_plan_routes_around_or_through_mines(monkeypatch):
+    import rover_server
+    monkeypatch.setattr(rover_server.disarm_jobs, "solver", lambda serial: "0")
+    client.put("/map", json={"row": 6, "col": 6})
+    for col in range(5):
+        client.post("/mines", json={"row": 2, "col": col, "serialNum": 9100 + col})
+    rover_id = client.post("/rovers", json={"commands": ""}).json()["id"]
+
+    avoid = client.post(f"/rovers/{rover_id}/plan", json={"row": 4, "col": 0, "apply": True}).json()
+    assert avoid["disarms"] == [] and avoid["cached"] is False
+    assert avoid["rover"]["commands"] == avoid["commands"]
+    result = client.post(f"/rovers/{rover_id}/dispatch").json()["rover"]
+    assert result["status"] == ROVER_OPERATION_FINISHED and result["position"] == [4, 0]
+
+    plan = client.post(f"/rovers/{rover_id}/plan", json={"row": 4, "col": 0, "mode": "disarm"}).json()
+    assert plan["commands"] == "MMDMM" and plan["disarms"] == [[2, 0]]
+    assert client.post(f"/rovers/{rover_id}/plan", json={"row": 4, "col": 0, "mode": "disarm"}).json()["cached"]
+    client.put(f"/rovers/{rover_id}", json={"commands": plan["commands"]})
+    dispatched = client.post(f"/rovers/{rover_id}/dispatch").json()
+    assert dispatched["rover"]["position"] == [4, 0] and len(dispatched["disarm_jobs"]) == 1
+
+    client.post("/mines", json={"row": 4, "col": 5, "serialNum": 9200})
+    client.post("/mines", json={"row": 5, "col": 4, "serialNum": 9201})
+    assert client.post(f"/rovers/{rover_id}/plan", json={"row": 5, "col": 5}).status_code == 409
+    assert client.post(f"/rovers/{rover_id}/plan", json={"row": 9, "col": 0}).status_code == 400
+    assert client.post(f"/rovers/{rover_id}/plan", json={"row": 1, "col": 0, "mode": "fly"}).status_code == 400
+    # A search that runs out of states is refused instead of holding up the server
+    monkeypatch.setattr(rover_server.planner, "MAX_STATES", 5)
+    assert client.post(f"/rovers/{rover_id}/plan", json={"row": 4, "col": 4}).status_code == 422
+
+    # Long open routes on a full-size map go straight to the target, a short wall costs a detour
+    grid = np.zeros((10000, 10000), dtype=np.uint8)
+    grid[5000, :40] = 1
+    for target, length in [((2000, 2000), 4001), ((9999, 9999), 20000), ((0, 9999), 10000), ((6000, 0), 6083)]:
+        route = rover_server.planner.plan(grid, (0, 0), 2, target, max_states=4_000_000, max_seconds=30)
+        assert len(route.commands) == length
+        assert route.searched == length + 1 or target == (6000, 0)
+        simulated = np.array([0, 0])
+        direction = 2
+        for command in route.commands:
+            if command == "M":
+                simulated += rover_server.planner.DIRECTION_OFFSETS[direction]
+                assert grid[tuple(simulated)] == 0
+            else:
+                direction = (direction + (1 if command == "R" else 3)) % 4
+        assert tuple(simulated) == target
+
+def test_coverage_plan_disarms_every_mine(monkeypatch):
+    import rover_server
+    monkeypatch.setattr(rover_server.disarm_jobs, "solver", lambda serial: "0")
+    client.put("/map", json={"row": 30, "col": 30, "density": 0.1, "seed": 11})
+    mine_ids = {m["id"] for m in client.get("/mines").json()["mines"]}
+    ids = [client.post("/rovers", json={"commands": ""}).json()["id"] for _ in range(3)]
+
+    plan = client.post("/rovers/coverage-plan", json={"ids": ids, "time_budget": 0.5, "pins": True}).json()
+    assert [route["rover"] for route in plan["routes"]] == ids
+    assert plan["mines"] == len(mine_ids)
+    assert {m["id"] for route in plan["routes"] for m in route["mines"]} == mine_ids
+    assert all("pin" in m for route in plan["routes"] for m in route["mines"])
+    assert plan["makespan"] == max(route["length"] for route in plan["routes"])
+
+    results = client.post("/rovers/dispatch-batch", json={"ids": ids[::-1]}).json()["results"]
+    assert not any(result["rover"]["status"] == ROVER_STATUS_ELIMINATED for result in results)
+    for job_id in [job for result in results for job in result["disarm_jobs"]]:
+        rover_server.disarm_jobs.get(job_id).future.result()
+    assert client.get("/mines").json()["mines"] == []
+    assert client.post("/rovers/coverage-plan", json={"rovers": 0}).status_code == 400
+
+def test_bulk_mine_import_and_export():
+    import rover_server
+    client.put("/map", json={"row": 20, "col": 20})
+    lines = [json.dumps({"row": r, "col": 3, "serialNum": 500 + r}) for r in range(1, 11)]
+    lines += ['{"row": 1, "col": 3, "serialNum": 999}', "not json", '{"row": 99, "col": 0, "id": 998}', ""]
+    ndjson = "\n".join(lines).encode()
+    body = (ndjson[i:i + 7] for i in range(0, len(ndjson), 7))  # lines split across chunks
+    result = client.post("/mines/bulk", content=body, headers={"Content-Type": "application/x-ndjson"}).json()
+    assert result["created"] == 10 and result["error_count"] == 3
+    assert [line for line, _ in result["errors"]] == [11, 12, 13]
+    assert result["errors"][0][1] == "Mine already exists at the set location"
+
+    csv_body = "serialNum,row,col\n700,5,5\n701,5,6\n702,five,7\n503,0,0\n"
+    result = client.post("/mines/bulk", content=csv_body, headers={"Content-Type": "text/csv"}).json()
+    assert result["created"] == 2
+    assert result["errors"] == [[4, "row must be an integer"], [5, "Mine with this serial number already exists"]]
+    assert client.post("/mines/bulk", content="x", headers={"Content-Type": "text/plain"}).status_code == 415
+
+    exported = client.get("/mines/export").text.splitlines()
+    assert len(exported) == 12 and json.loads(exported[0]) == {"id": 501, "row": 1, "col": 3}
+    exported_csv = client.get("/mines/export", params={"format": "csv"}).text
+    client.put("/map", json={"row": 20, "col": 20})
+    assert client.post("/mines/bulk", content=exported_csv, headers={"Content-Type": "text/csv"}).json()["created"] == 12
+    assert len(rover_server.mines) == 12
+
+def test_region_filters_and_cursor_pages():
+    client.put("/map", json={"row": 90, "col": 90, "density": 0.05, "seed": 3})
+    everything = client.get("/mines").json()["mines"]
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 37} if cursor is None else {"limit": 37, "cursor": cursor}
+        body = client.get("/mines", params=params).json()
+        pages += body["mines"]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == everything == sorted(everything, key=lambda m: (m["row"], m["col"]))
+
+    window = client.get("/mines", params={"row0": 10, "col0": 20, "rows": 30, "cols": 40}).json()["mines"]
+    assert window == [m for m in everything if 10 <= m["row"] < 40 and 20 <= m["col"] < 60]
+    circle = client.get("/mines", params={"center_row": 45, "center_col": 45, "radius": 15}).json()["mines"]
+    assert circle == [m for m in everything if (m["row"] - 45) ** 2 + (m["col"] - 45) ** 2 <= 225]
+    assert client.get("/mines", params={"status": "disarming"}).json()["mines"] == []
+    assert client.get("/mines", params={"row0": 1}).status_code == 400
+
+    client.put("/map", json={"row": 90, "col": 90})
+    ids = [client.post("/rovers", json={"commands": "M" * (10 * i)}).json()["id"] for i in range(1, 6)]
+    client.post("/rovers/dispatch-batch", json={"ids": ids})
+    moved = client.get("/rovers", params={"row0": 20, "col0": 0, "rows": 21, "cols": 1}).json()["rovers"]
+    assert [r["id"] for r in moved if r["id"] in ids] == ids[1:4]
+    near = client.get("/rovers", params={"center_row": 0, "center_col": 0, "radius": 20.5,
+                                         "status": "finished"}).json()["rovers"]
+    assert [r["id"] for r in near if r["id"] in ids] == ids[:2]
+    client.put(f"/rovers/{ids[1]}", json={"commands": "M"})  # index follows it back to (0, 0)
+    at_start = client.get("/rovers", params={"row0": 0, "col0": 0, "rows": 1, "cols": 1}).json()["rovers"]
+    assert ids[1] in [r["id"] for r in at_start] and ids[0] not in [r["id"] for r in at_start]
+    first = client.get("/rovers", params={"limit": 2}).json()
+    rest = client.get("/rovers", params={"cursor": first["next_cursor"]}).json()["rovers"]
+    assert first["rovers"] + rest == client.get("/rovers").json()["rovers"]
+    assert client.get("/rovers", params={"status": "lost"}).status_code == 400
+
+    # Pages stay in id order after removing and restoring rovers
+    from registry import RoverRegistry
+    store = RoverRegistry()
+    created = [store.create("", ROVER_IDLE) for _ in range(6)]
+    store.remove(created[2].id)
+    store.remove(created[4].id)
+    store.restore(created[2].to_dict())
+    assert [r.id for r in store.query(after=created[1].id)] == [created[i].id for i in (2, 3, 5)]
+
+def test_dashboard_canvas_and_event_shapes():
+    page = client.get("/")
+    assert page.status_code == 200
+    for element in ("map-scroll", "map-canvas", "map-spacer", "map-info", "zoom-in-btn", "zoom-out-btn",
+                    "refresh-map-btn"):
+        assert f'id="{element}"' in page.text
+    assert client.get("/static/script.js").status_code == 200
+
+    # The canvas applies these deltas in place, so the fields it reads must be there
+    with client.websocket_connect("/ws/events") as websocket:
+        def next_event(kind):
+            while True:
+                for event in websocket.receive_json()["events"]:
+                    if event["type"] == kind:
+                        return event
+
+        client.put("/map", json={"row": 8, "col": 9})
+        replaced = next_event("map_replaced")
+        assert (replaced["row"], replaced["col"]) == (8, 9)
+        client.post("/mines", json={"row": 2, "col": 3, "serialNum": 5151})
+        added = next_event("mine_added")
+        assert (added["mine"]["row"], added["mine"]["col"]) == (2, 3) and "map_version" in added
+        client.put("/mines/5151", json={"row": 4, "col": 5, "serialNum": 5152})
+        moved = next_event("mine_updated")
+        assert moved["old_id"] == 5151 and (moved["mine"]["row"], moved["mine"]["col"]) == (4, 5)
+        assert (moved["old_row"], moved["old_col"]) == (2, 3) and moved["map_version"] > added["map_version"]
+        # A move then a remove: however they are batched, the cell it left still gets cleared
+        client.put("/mines/5152", json={"row": 6, "col": 7})
+        client.delete("/mines/5152")
+        moved = next_event("mine_updated")
+        assert (moved["old_row"], moved["old_col"]) == (4, 5)
+        removed = next_event("mine_removed")
+        assert (removed["mine"]["row"], removed["mine"]["col"]) == (6, 7)
+        rover_id = client.post("/rovers", json={"commands": "M"}).json()["id"]
+        assert next_event("rover_added")["rover"]["id"] == rover_id
+        client.post(f"/rovers/{rover_id}/dispatch")
+        rover = next_event("rover_updated")["rover"]
+        while rover["status"] != ROVER_OPERATION_FINISHED:  # moving first, unless the two were coalesced
+            rover = next_event("rover_updated")["rover"]
+        assert rover["id"] == rover_id and rover["position"] == [1, 0]
+        # The canvas loads rovers for the rect around its viewport only
+        in_view = client.get("/rovers", params={"row0": 0, "col0": 0, "rows": 2, "cols": 2}).json()["rovers"]
+        assert rover_id in [r["id"] for r in in_view]
+        elsewhere = client.get("/rovers", params={"row0": 2, "col0": 0, "rows": 6, "cols": 9}).json()["rovers"]
+        assert rover_id not in [r["id"] for r in elsewhere]
+        client.delete(f"/rovers/{rover_id}")
+        assert next_event("rover_removed")["rover"]["id"] == rover_id
+
+def test_pin_table_file_round_trip(tmp_path):
+    from pin_table import PinTable, HEADER
+    path = str(tmp_path / "pins.bin")
+    table = PinTable("000", base=1000, count=10, path=path)
+    assert table.put(1003, "42") and table.put(1012, "7")  # past the range, the table grows
+    assert not table.put(999, "1")
+    table.save()
+    assert os.path.getsize(path) == HEADER.size + 13 * 4
+    reloaded = PinTable.open(path, "000")
+    assert (reloaded.base, reloaded.count, len(reloaded)) == (1000, 13, 2)
+    assert reloaded.get(1003) == "42" and reloaded.get(1004) is None
+    assert reloaded.known([1003, 1004, 5, 1012]).tolist() == [True, False, False, True]
+    with pytest.raises(ValueError):
+        PinTable.open(path, "0000")
+
+def test_pin_warmer_solves_nearest_mines_first(tmp_path):
+    import threading
+    import time
+    from disarm_engine import DisarmEngine, SolveCancelled
+    from disarm_jobs import PinWarmer
+    from pin_table import PinTable
+    solved = []
+
+    class RecordingEngine(DisarmEngine):
+        def solve(self, serial, prefix=helper.DISARM_PREFIX, cancel=None):
+            solved.append(serial)
+            return super().solve(serial, prefix, cancel)
+
+    path = str(tmp_path / "pins.bin")
+    engine = RecordingEngine(workers=1, cache_path=None, table_path=path, table_prefix="000")
+    engine.table.put(1001, helper.disarm_mine(1001, "000"))  # known already, never solved
+    reads = []
+
+    def positions():
+        reads.append(1)
+        return [(0, 0), (40, 40)]
+
+    warmer = PinWarmer(engine, "000", positions)
+    # Rovers at (0, 0) and (40, 40): 1002 is 10 away, 1000 20, 1003 40
+    warmer.schedule([1000, 1001, 1002, 1003], [50, 0, 5, 20], [50, 0, 5, 20])
+    for _ in range(500):
+        if warmer.warmed == 3:
+            break
+        time.sleep(0.01)
+    assert solved == [1002, 1000, 1003]
+    # Rover positions are read on the warmer thread and kept for a while, not per schedule
+    warmer.schedule([1001], [0], [0])
+    warmer.schedule([1002], [5], [5])
+    for _ in range(100):
+        if not len(warmer):
+            break
+        time.sleep(0.01)
+    assert len(reads) == 1
+    assert PinTable.open(path, "000").get(1003) == helper.disarm_mine(1003, "000")
+
+    # A disarm someone waits for stops a warm-up solve in progress
+    pooled = DisarmEngine(workers=2, cache_path=None, table_path=None, chunk_size=5000)
+    try:
+        cancel = threading.Event()
+        threading.Timer(0.2, cancel.set).start()
+        with pytest.raises(SolveCancelled):
+            pooled.solve(1234, "0" * 12, cancel=cancel)
+        assert pooled.solve(1234, "000") == helper.disarm_mine(1234, "000")
+    finally:
+        pooled.close()
+
+def test_disarms_read_the_pin_table(monkeypatch):
+    import time
+    import disarm_engine
+    import pin_table
+    import rover_server
+    serial, pin = KNOWN_PIN
+    table = pin_table.PinTable(disarm_engine.DISARM_PREFIX)
+    table.put(serial, pin)
+    monkeypatch.setattr(disarm_engine.engine, "table", table)
+    monkeypatch.setattr(disarm_engine.engine, "cache", disarm_engine.PinCache(None))
+    assert disarm_engine.cached_pin(serial) == pin
+
+    scheduled = []
+
+    class QueueingWarmer:
+        def schedule(self, serials, rows, cols, replace=False):
+            scheduled.append((list(serials), replace))
+
+    monkeypatch.setattr(rover_server, "pin_warmer", QueueingWarmer())
+    client.put("/map", json={"row": 10, "col": 10})
+    client.post("/mines", json={"row": 1, "col": 0, "serialNum": serial})
+    assert scheduled == [([], True), ([serial], False)]
+
+    hits = disarm_engine.engine.table_hits
+    rover_id = client.post("/rovers", json={"commands": "MD"}).json()["id"]
+    job_id = client.post(f"/rovers/{rover_id}/dispatch").json()["disarm_jobs"][0]
+    for _ in range(100):
+        job = client.get(f"/disarm-jobs/{job_id}").json()
+        if job["status"] == "done":
+            break
+        time.sleep(0.05)
+    assert job["pin"] == pin
+    assert disarm_engine.engine.table_hits == hits + 1
+    assert client.get(f"/mines/{serial}").status_code == 404
@@ -1,15 +1,39 @@
 # Sarim Shahwar
-from fastapi import FastAPI, status, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Depends, status, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, Response, PlainTextResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from helper import *
+from disarm_jobs import DisarmJobQueue, PinWarmer, JOB_DONE
+from command_store import CommandStore, CommandsUnavailable, make_source
+from registry import MineRegistry
+from events import EventHub
+from event_log import EventLog, SYNC_COMMIT
+from profiler import SamplingProfiler
+import disarm_engine
+import dispatch_engine
+import coverage_planner
+import metrics
+import mine_io
+import planner
+import spatial
+import state_backend
 import helper
-import random
-import threading
+import asyncio
+import collections
+import contextvars
+import json
+import numpy as np
+import os
+
+try:
+    import msgpack  # optional, enables binary batch frames on /ws/rovers/{id}
+except ImportError:
+    msgpack = None
 
 #Main Server File
 app = FastAPI()
@@ -35,18 +59,246 @@ async def read_index(request: Request):
 
 
 # Global data notations --> map, mines, rovers, commands
-grid, mines = helper.generate_map_grid(row=5, col=10, update_change=True)
-rovers = []  # Dictionary key id, commands, status, position, executed_commands
-commands = [helper.get_rover_commands(i) for i in range(1, 11)]
-id_list = random.sample(range(100, 1000), 900)
-valid_commands = ['L', 'R', 'M', 'D']
-state_lock = threading.Lock()
+# live in the state backend: this process (default) or shared by several
+# workers (ROVER_BACKEND=shared, see state_backend.py)
+backend = state_backend.make_backend()
+grid, mines = backend.grid, backend.mines  # mines indexed by serial and by (row, col)
+rovers = backend.rovers  # keyed by id: commands, status, position, executed_commands
+command_store = CommandStore(make_source())  # external command sets, fetched on first use
+map_formats = ['json', 'bits', 'rle', 'binary']
+BOOT_ID = backend.boot_id  # keeps ETags from matching across restarts
+state_lock = backend.state_lock  # grid, mines and disarming
+rover_lock = backend.rover_lock  # rovers (take state_lock first when both are needed)
+disarm_jobs = DisarmJobQueue(ids=backend.new_job_id)
+disarming = backend.disarming  # (row, col) -> disarm job id for mines held while their PIN is being solved
+events = EventHub()  # deltas for /ws/events subscribers
+plans = planner.PlanCache()  # routes for the current map version
+event_log = None  # EventLog when ROVER_DATA_DIR is set (see Persistence below)
+
+
+def adopt_map(new_grid, new_mines):
+    # Another worker replaced the map (shared backend), called under state_lock
+    global grid, mines
+    grid, mines = new_grid, new_mines
+
+backend.on_map_replaced = adopt_map
+
+
+# Disarming (PIN search runs in the background, outside the locks)
+def start_disarm(mine):
+    # Caller holds state_lock. The mine keeps its cell until the job finishes.
+    job = disarm_jobs.submit(mine.serial, mine.row, mine.col, on_done=finish_disarm)
+    disarming[(mine.row, mine.col)] = job.id
+    backend.save_job(job)
+    publish_mine("mine_disarming", mine, job_id=job.id)
+    return job
+
+def finish_disarm(job):
+    with state_lock.write():
+        backend.save_job(job)
+        if disarming.get((job.row, job.col)) != job.id:
+            return  # map was replaced while the job ran
+        del disarming[(job.row, job.col)]
+        if metrics.enabled:
+            disarm_seconds.observe(job.seconds, job.status)
+        if job.status != JOB_DONE:
+            publish_mine("mine_updated", mines.get(job.serial))  # back to being armed
+            return
+        publish_mine("mine_disarmed", mines.remove(job.serial), pin=job.pin)
+
+# PIN warmer: solves PINs for the mines on the map ahead of their disarms,
+# nearest rovers first (ROVER_PIN_WARMER=0 turns it off). Every dispatch
+# starts at (0, 0), so that counts as a rover too.
+def rover_positions():
+    # Called on the warmer thread, which keeps the answer for a second
+    with rover_lock.read():
+        return [(0, 0)] + rovers.positions(skip_status=ROVER_STATUS_ELIMINATED)
+
+pin_warmer = PinWarmer(positions=rover_positions) if os.environ.get("ROVER_PIN_WARMER", "1") != "0" else None
+
+def warm_pins(new_mines=None):
+    # Caller holds state_lock. new_mines=None queues the whole map again.
+    if pin_warmer is None:
+        return
+    if new_mines is None:
+        rows, cols, serials = mines.to_arrays()
+        pin_warmer.schedule(serials, rows, cols, replace=True)
+    elif new_mines:
+        pin_warmer.schedule([m.serial for m in new_mines], [m.row for m in new_mines], [m.col for m in new_mines])
+
+def mine_json(mine):
+    data = mine.to_dict()
+    data["status"] = "disarming" if (mine.row, mine.col) in disarming else "armed"
+    return data
+
+# Events (callers hold the lock for what they publish, so deltas go out in order).
+# Every state change goes through these two, so they also feed the event log.
+def publish_mine(kind, mine, **extra):
+    if event_log is not None and (kind in LOGGED_MINE_EVENTS or "old_id" in extra):
+        log_event({"type": kind, "row": mine.row, "col": mine.col, "id": mine.serial, **extra})
+    if events.active:
+        cells = {(mine.row, mine.col)}
+        if "old_row" in extra:
+            cells.add((extra["old_row"], extra["old_col"]))
+        events.publish(("mine", mine.serial), {"type": kind, "mine": mine_json(mine),
+                                               "map_version": mines.version, **extra}, frozenset(cells))
+
+def publish_rover(kind, rover):
+    if kind == "rover_updated":
+        if rovers.get(rover.id) is None:
+            return  # deleted while a dispatch or WebSocket still held it, nothing to save or log
+        rovers.save(rover)
+    if event_log is not None:
+        log_event({"type": kind, "rover": rover.to_dict()})
+    if events.active:
+        events.publish(("rover", rover.id), {"type": kind, "rover": rover.to_dict()})
+
+
+# Persistence: with ROVER_DATA_DIR set, state changes go to a write-ahead log
+# (event_log.py) and the state is rebuilt from snapshot + log at startup.
+# ROVER_WAL_SYNC=commit (default) holds each HTTP response until its changes
+# are fsynced, =interval fsyncs in the background. WebSocket changes are
+# never waited for.
+LOGGED_MINE_EVENTS = ("mine_added", "mine_removed", "mine_disarmed")  # plus moves (old_id)
+_logged_seq = contextvars.ContextVar("logged_seq", default=None)
+
+def log_event(record):
+    # Caller holds the lock for the change being logged
+    seq = event_log.append(record)
+    pending = _logged_seq.get()
+    if pending is not None:
+        pending[0] = seq
+
+def save_snapshot(mine_arrays=None):
+    # Caller holds state_lock and rover_lock, so the snapshot matches the last logged seq
+    rows, cols, serials = mine_arrays if mine_arrays is not None else mines.to_arrays()
+    event_log.snapshot(grid, rows, cols, serials,
+                       {"rovers": [rover.to_dict() for rover in rovers], "next_rover_id": rovers.next_id})
+
+def snapshot_when_due():
+    # Runs on the event log's flusher thread
+    with state_lock.read(), rover_lock.read():
+        save_snapshot()
+
+def replay(record):
+    kind = record["type"]
+    if kind == "mine_added":
+        mines.add(record["row"], record["col"], record["id"])
+    elif kind == "mine_updated":
+        mines.move(mines.get(record["old_id"]), record["row"], record["col"], record["id"])
+    elif kind in ("mine_removed", "mine_disarmed"):
+        mines.remove(record["id"])
+    elif kind == "rover_removed":
+        rovers.remove(record["rover"]["id"])
+        rovers.next_id = max(rovers.next_id, record["rover"]["id"] + 1)
+    elif kind == "rover_added" or rovers.get(record["rover"]["id"]) is not None:
+        # An update for a rover that isn't there was logged after its removal
+        data = record["rover"]
+        rovers.restore(data, dispatch_engine.compile_program(data["commands"]))
+
+def open_event_log(directory, sync=SYNC_COMMIT):
+    # Rebuilds grid, mines and rovers from disk, then starts logging
+    global grid, mines, event_log
+    if not isinstance(backend, state_backend.MemoryState):
+        raise RuntimeError("ROVER_DATA_DIR is for the in-memory backend, the shared backend keeps its own state")
+    log = EventLog(directory, sync=sync)
+    snapshot, records = log.recover()
+    if snapshot is not None:
+        grid = snapshot["grid"]
+        mines = MineRegistry.from_arrays(grid, snapshot["mine_rows"], snapshot["mine_cols"],
+                                         snapshot["mine_serials"])
+        for data in snapshot["extra"]["rovers"]:
+            rovers.restore(data, dispatch_engine.compile_program(data["commands"]))
+        rovers.next_id = max(rovers.next_id, snapshot["extra"]["next_rover_id"])
+    for record in records:
+        replay(record)
+    for rover in rovers:
+        if rover.status == ROVER_MOVING:
+            rover.status = ROVER_OPERATION_FINISHED  # was mid-run when the server stopped
+    log.on_snapshot = snapshot_when_due
+    log.start()
+    event_log = log
+    if log.sync == SYNC_COMMIT:
+        app.middleware("http")(wait_for_event_log)
+
+async def wait_for_event_log(request: Request, call_next):
+    # Group commit: the response goes out once the fsync covering its changes is done
+    pending = [0]
+    token = _logged_seq.set(pending)
+    try:
+        response = await call_next(request)
+    finally:
+        _logged_seq.reset(token)
+    if pending[0]:
+        await run_in_threadpool(event_log.wait, pending[0])
+    return response
+
+if os.environ.get("ROVER_DATA_DIR"):
+    open_event_log(os.environ["ROVER_DATA_DIR"], os.environ.get("ROVER_WAL_SYNC", SYNC_COMMIT))
+    with state_lock.write():
+        warm_pins()  # mines restored from the log
+
+
+# Metrics (GET /metrics). Histograms only fill while instrumentation is on,
+# see metrics.py. Counts are read from the live state at scrape time.
+request_seconds = metrics.Histogram("rover_http_request_duration_seconds", "HTTP request latency",
+                                    ("method", "route", "status"))
+lock_wait_seconds = metrics.Histogram("rover_lock_wait_seconds", "Time spent waiting for a lock", ("lock", "mode"))
+lock_hold_seconds = metrics.Histogram("rover_lock_hold_seconds", "Time a lock was held", ("lock", "mode"))
+disarm_seconds = metrics.Histogram("rover_disarm_duration_seconds", "PIN search time per disarm job", ("status",),
+                                   buckets=metrics.DISARM_BUCKETS)
+dispatch_commands = metrics.Histogram("rover_dispatch_commands", "Commands run per rover dispatch", ("mode",),
+                                      buckets=metrics.COUNT_BUCKETS)
+profiler = SamplingProfiler()
+debug_endpoints = os.environ.get("ROVER_DEBUG", "") == "1"  # /debug/* is 404 unless turned on
+app.add_middleware(metrics.MetricsMiddleware, histogram=request_seconds)
+
+def instrument_locks(on):
+    for lock in (state_lock, rover_lock):
+        if on:
+            def observe(mode, wait, hold, name=lock.name):
+                lock_wait_seconds.observe(wait, name, mode)
+                lock_hold_seconds.observe(hold, name, mode)
+            lock.observe = observe
+        else:
+            lock.observe = None
+
+def mine_counts():
+    with state_lock.read():
+        return {("armed",): len(mines) - len(disarming), ("disarming",): len(disarming)}
+
+def rover_counts():
+    with rover_lock.read():
+        return {(status,): count for status, count in collections.Counter(r.status for r in rovers).items()}
+
+metrics.on_switch(instrument_locks)
+metrics.CallbackMetric("rover_mines", "Mines on the map", mine_counts, labelnames=("status",))
+metrics.CallbackMetric("rover_rovers", "Rovers by status", rover_counts, labelnames=("status",))
+metrics.CallbackMetric("rover_map_cells", "Cells in the map", lambda: grid.size)
+metrics.CallbackMetric("rover_event_subscribers", "Open /ws/events connections", lambda: len(events))
+metrics.CallbackMetric("rover_disarm_solves_total", "PINs solved by hashing", lambda: disarm_engine.engine.solves,
+                       kind="counter")
+metrics.CallbackMetric("rover_disarm_cache_hits_total", "PINs served from the PIN cache",
+                       lambda: disarm_engine.engine.cache_hits, kind="counter")
+metrics.CallbackMetric("rover_disarm_table_hits_total", "PINs served from the PIN table",
+                       lambda: disarm_engine.engine.table_hits, kind="counter")
+metrics.CallbackMetric("rover_pin_table_size", "PINs in the PIN table", lambda: len(disarm_engine.engine.table))
+metrics.CallbackMetric("rover_pin_warmer_queued", "Mines waiting for the PIN warmer",
+                       lambda: len(pin_warmer) if pin_warmer is not None else 0)
+metrics.CallbackMetric("rover_disarm_hashes_total", "SHA-256 candidates up to each solved PIN",
+                       lambda: disarm_engine.engine.hashes, kind="counter")
+metrics.CallbackMetric("rover_event_log_records_total", "Records appended to the event log",
+                       lambda: event_log.seq if event_log is not None else 0, kind="counter")
+metrics.CallbackMetric("rover_event_log_fsyncs_total", "Group commits (fsyncs) of the event log",
+                       lambda: event_log.flushes if event_log is not None else 0, kind="counter")
 
 
 # Base Model Setup (pydantic)
 class MapDimensions(BaseModel):
     row: int
     col: int
+    density: Optional[float] = None  # None keeps the field empty
+    seed: Optional[int] = None  # same seed, same mines and serials
 
 class MineCreate(BaseModel):
     row: int
@@ -64,300 +316,830 @@ class RoverCreate(BaseModel):
 class RoverUpdate(BaseModel):
     commands: str
 
+class DispatchBatch(BaseModel):
+    ids: List[int]
+
+class PlanRequest(BaseModel):
+    row: int
+    col: int
+    mode: str = planner.MODE_AVOID  # "avoid" routes around mines, "disarm" clears the ones in the way
+    apply: bool = False  # also make the plan the rover's commands
+
+class CoverageRequest(BaseModel):
+    rovers: int = 1  # fleet size
+    ids: Optional[List[int]] = None  # give the routes to these rovers (fleet size = len(ids))
+    time_budget: float = 1.0  # seconds for improving the tour
+    pins: bool = False  # add already solved PINs to each mine
+
+class InstrumentationConfig(BaseModel):
+    enabled: bool
+
+class ProfileConfig(BaseModel):
+    interval: float = 0.005  # seconds between samples
+
 # Endpoints (Map)
+def map_response(head, window, status_code=status.HTTP_200_OK, headers=None):
+    # window must be a copy, it is streamed as JSON after state_lock is released
+    return StreamingResponse(helper.map_json_chunks(window, head), status_code=status_code,
+                             media_type="application/json", headers=headers)
+
+def etag_matches(request: Request, etag):
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return any(tag.strip() in (etag, "*") for tag in if_none_match.split(","))
+
 @app.get("/map", status_code=status.HTTP_200_OK)
-def get_map():
-    with state_lock:
-        return {
-            "row": len(grid),
-            "col": len(grid[0]),
-            "map": grid
-        }
+def get_map(request: Request, row0: int = 0, col0: int = 0, rows: Optional[int] = None,
+            cols: Optional[int] = None, format: str = "json"):
+    if "application/octet-stream" in request.headers.get("accept", ""):
+        format = "binary"
+    if format not in map_formats:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Format must be one of {map_formats}")
+    windowed = rows is not None or cols is not None or row0 or col0
+    with state_lock.read():
+        n_rows, n_cols = grid.shape
+        if not (0 <= row0 < n_rows and 0 <= col0 < n_cols):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Window out of bounds")
+        rows = n_rows - row0 if rows is None else min(rows, n_rows - row0)
+        cols = n_cols - col0 if cols is None else min(cols, n_cols - col0)
+        if rows < 1 or cols < 1:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Window must be at least 1x1")
+        etag = f'"{BOOT_ID}-{mines.version}-{row0}-{col0}-{rows}-{cols}-{format}"'
+        headers = {"ETag": etag, "Vary": "Accept"}  # Accept can pick the binary format, caches must key on it
+        if etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        window = grid[row0:row0 + rows, col0:col0 + cols].copy()
+
+    head = {"row": n_rows, "col": n_cols}
+    if windowed or format != "json":
+        head.update({"row0": row0, "col0": col0, "rows": rows, "cols": cols})
+    if format == "json":
+        return map_response(head, window, headers=headers)
+    if format == "bits":
+        return JSONResponse({**head, "encoding": "bits", "data": helper.encode_bits(window)}, headers=headers)
+    if format == "rle":
+        return JSONResponse({**head, "encoding": "rle", "data": helper.encode_rle(window)}, headers=headers)
+    # Raw bit-packed cells, the window goes in the headers
+    headers.update({f"X-Map-{k.capitalize()}": str(v) for k, v in head.items()})
+    return Response(np.packbits(window.ravel()).tobytes(), media_type="application/octet-stream", headers=headers)
+
+# The grid takes a byte per cell and every mine is a Python object, so map size is capped
+MAX_MAP_CELLS = int(os.environ.get("ROVER_MAX_MAP_CELLS", 100_000_000))
+MAX_MAP_MINES = int(os.environ.get("ROVER_MAX_MAP_MINES", 2_000_000))
+
 @app.put("/map", status_code=status.HTTP_201_CREATED)
 def update_map(dim: MapDimensions):
     global grid, mines
-    with state_lock:
-        grid, mines = helper.generate_map_grid(row=dim.row, col=dim.col)
-        grid[0][0] = 0
-        return {"message": "Map updated", "row": len(grid), "col": len(grid[0]), "map": grid}
+    if dim.row < 1 or dim.col < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Map dimensions must be positive")
+    if dim.density is not None and not 0 <= dim.density <= 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Mine density must be between 0 and 1")
+    if dim.row * dim.col > MAX_MAP_CELLS:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"Map is limited to {MAX_MAP_CELLS} cells")
+    if dim.row * dim.col * (dim.density or 0) > MAX_MAP_MINES:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"Map is limited to {MAX_MAP_MINES} mines (row * col * density)")
+    # Build the new field before taking the lock, large maps take a while
+    if dim.density is None:
+        new_grid, mine_list = helper.generate_map_grid(row=dim.row, col=dim.col)
+    else:
+        new_grid, mine_list = helper.generate_map_grid(row=dim.row, col=dim.col, update_change=False,
+                                                       density=dim.density, seed=dim.seed)
+    new_mines = MineRegistry(new_grid, mine_list)
+    if new_mines.at(0, 0):
+        new_mines.remove(new_mines.at(0, 0).serial)  # rovers start at (0, 0)
+    mine_arrays = new_mines.to_arrays() if event_log is not None else None
+    with state_lock.write():
+        grid, mines = backend.replace_map(new_grid, new_mines)
+        disarming.clear()
+        if event_log is not None:
+            # A new map replaces everything, so it starts a fresh snapshot
+            with rover_lock.read():
+                save_snapshot(mine_arrays)
+        events.publish(("map",), {"type": "map_replaced", "row": grid.shape[0], "col": grid.shape[1],
+                                  "map_version": mines.version})
+        warm_pins()
+        return map_response({"message": "Map updated", "row": grid.shape[0], "col": grid.shape[1]},
+                            grid.copy(), status.HTTP_201_CREATED)
+
+# Region filters and cursor pagination for GET /mines and GET /rovers.
+# Mines come in row-major cell order (the cursor is a cell index), rovers in
+# id order (the cursor is an id). Without limit everything that matches is returned.
+MAX_PAGE = 10_000
+MINE_STATUSES = ("armed", "disarming")
+ROVER_STATUS_NAMES = {"idle": ROVER_IDLE, "moving": ROVER_MOVING, "finished": ROVER_OPERATION_FINISHED,
+                      "eliminated": ROVER_STATUS_ELIMINATED}
+
+def parse_region(row0, col0, rows, cols, center_row, center_col, radius):
+    # Returns (rect as rows [r0, r1) x cols [c0, c1) or None, inside(row, col) or None).
+    # A radius becomes its bounding square plus an exact distance check.
+    window = (row0, col0, rows, cols)
+    circle = (center_row, center_col, radius)
+    if any(v is not None for v in window) and None in window:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="row0, col0, rows and cols go together")
+    if any(v is not None for v in circle) and None in circle:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="center_row, center_col and radius go together")
+    rect, inside = None, None
+    if row0 is not None:
+        if rows < 0 or cols < 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Window size must not be negative")
+        rect = (row0, row0 + rows, col0, col0 + cols)
+    if radius is not None:
+        if radius < 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Radius must not be negative")
+        reach = int(radius)
+        square = (center_row - reach, center_row + reach + 1, center_col - reach, center_col + reach + 1)
+        rect = square if rect is None else (max(rect[0], square[0]), min(rect[1], square[1]),
+                                            max(rect[2], square[2]), min(rect[3], square[3]))
+        inside = lambda r, c: (r - center_row) ** 2 + (c - center_col) ** 2 <= radius * radius
+    return rect, inside
+
+def parse_page(limit, cursor):
+    if limit is not None and not 1 <= limit <= MAX_PAGE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Limit must be between 1 and {MAX_PAGE}")
+    if cursor is None:
+        return None
+    try:
+        return int(cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def paginate(items, limit, cursor_of):
+    # First `limit` items and the cursor after them, None when nothing is left
+    page = []
+    for item in items:
+        if limit is not None and len(page) == limit:
+            return page, cursor_of(page[-1])
+        page.append(item)
+    return page, None
+
 
 # Endpoints (Mines)
 @app.get("/mines")
-def get_mines_endpoint():
-    with state_lock:
-        mines1 = [{"row": m[0], "col": m[1], "id": m[2]} for m in mines]
-        return {"mines": mines1}
+def get_mines_endpoint(row0: Optional[int] = None, col0: Optional[int] = None, rows: Optional[int] = None,
+                       cols: Optional[int] = None, center_row: Optional[int] = None,
+                       center_col: Optional[int] = None, radius: Optional[float] = None,
+                       status: Optional[str] = None, limit: Optional[int] = None, cursor: Optional[str] = None):
+    rect, inside = parse_region(row0, col0, rows, cols, center_row, center_col, radius)
+    after = parse_page(limit, cursor)
+    if status is not None and status not in MINE_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Status must be one of {', '.join(MINE_STATUSES)}")
+    with state_lock.read():
+        # The grid is the spatial index for mines, only the window is scanned
+        n_rows, n_cols = grid.shape
+        r0, r1, c0, c1 = rect or (0, n_rows, 0, n_cols)
+        cells = spatial.iter_cells(grid, max(r0, 0), min(r1, n_rows), max(c0, 0), min(c1, n_cols),
+                                   -1 if after is None else after)
+        if inside is not None:
+            cells = (cell for cell in cells if inside(*cell))
+        if status is not None:
+            busy = disarming.keys()
+            cells = (cell for cell in cells if (cell in busy) == (status == "disarming"))
+        page, next_cursor = paginate((mine_json(mines.at(r, c)) for r, c in cells), limit,
+                                     lambda m: str(m["row"] * n_cols + m["col"]))
+        return {"mines": page, "next_cursor": next_cursor}
+
+
+@app.get("/mines/export")
+def export_mines_endpoint(format: str = mine_io.FORMAT_NDJSON):
+    if format not in mine_io.FORMATS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Format must be one of {', '.join(mine_io.FORMATS)}")
+    with state_lock.read():
+        rows, cols, serials = mines.to_arrays()  # columns, streamed after the lock is released
+    return StreamingResponse(mine_io.export_chunks(rows, cols, serials, format),
+                             media_type=mine_io.MEDIA_TYPES[format])
 
 
 @app.get("/mines/{id}")
 def get_mine_endpoint(id: int):
-    with state_lock:
-        for m in mines:
-            if m[2] == id:
-                return {"row": m[0], "col": m[1], "id": m[2]}
-        raise HTTPException(status_code=404, detail="Mine not found")
+    with state_lock.read():
+        m = mines.get(id)
+        if m is None:
+            raise HTTPException(status_code=404, detail="Mine not found")
+        return mine_json(m)
 
 
 @app.delete("/mines/{id}")
 def delete_mine_endpoint(id: int):
-    global mines
-    with state_lock:
-        for i, m in enumerate(mines):
-            if m[2] == id:
-                row, col = m[0], m[1]
-                grid[row][col] = 0
-                mines.pop(i)
-                return {"message": "Mine deleted"}
-        raise HTTPException(status_code=404, detail="Mine not found")
+    with state_lock.write():
+        m = mines.get(id)
+        if m is None:
+            raise HTTPException(status_code=404, detail="Mine not found")
+        if (m.row, m.col) in disarming:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Mine is being disarmed")
+        publish_mine("mine_removed", mines.remove(id))
+        return {"message": "Mine deleted"}
 
 
+def new_mine_problem(row, col, serial):
+    # Caller holds state_lock. Why the mine can't be added, None if it can.
+    if not mines.in_bounds(row, col):
+        return "Coordinates out of bounds"
+    if grid[row, col]:
+        return "Mine already exists at the set location"
+    if serial in mines:
+        return "Mine with this serial number already exists"
+    return None
+
 @app.post("/mines")
 def create_mine_endpoint(new_mine: MineCreate):
-    with state_lock:
-        if grid[new_mine.row][new_mine.col]:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                detail="Mine already exists at the set location")
-        grid[new_mine.row][new_mine.col] = 1
-        mines.append([new_mine.row, new_mine.col, new_mine.serialNum])
+    with state_lock.write():
+        problem = new_mine_problem(new_mine.row, new_mine.col, new_mine.serialNum)
+        if problem is not None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=problem)
+        mine = mines.add(new_mine.row, new_mine.col, new_mine.serialNum)
+        publish_mine("mine_added", mine)
+        warm_pins([mine])
         return {"message": "Mine created", "id": new_mine.serialNum}
 
 
+# Bulk import/export (formats in mine_io.py). The body is parsed as it
+# arrives and applied BULK_CHUNK rows per state_lock acquisition, so other
+# requests get in between chunks. Rows that fail are reported, the rest go in.
+BULK_CHUNK = 5000
+BULK_MAX_ERRORS = 1000  # errors listed in the response, the count covers all of them
+
+def add_mine_rows(rows):
+    # rows: [(line number, (row, col, serial))]. Returns (added, [[line, error]]).
+    added, errors = [], []
+    with state_lock.write():
+        with mines.batch():
+            for line_no, (row, col, serial) in rows:
+                problem = new_mine_problem(row, col, serial)
+                if problem is not None:
+                    errors.append([line_no, problem])
+                    continue
+                added.append(mines.add(row, col, serial))
+                publish_mine("mine_added", added[-1])
+        warm_pins(added)
+    return len(added), errors
+
+@app.post("/mines/bulk")
+async def bulk_create_mines_endpoint(request: Request):
+    fmt = mine_io.format_for(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail="Send application/x-ndjson or text/csv")
+    parser = mine_io.RowParser(fmt)
+    added, error_count, errors, pending = 0, 0, [], []
+
+    def note_errors(found):
+        nonlocal error_count
+        error_count += len(found)
+        errors.extend(found[:BULK_MAX_ERRORS - len(errors)])
+
+    line_no = 0
+    async for line in mine_io.lines(request.stream()):
+        line_no += 1
+        try:
+            parsed = parser.parse(line)
+        except (ValueError, UnicodeDecodeError) as e:
+            note_errors([[line_no, str(e)]])
+            continue
+        if parsed is not None:
+            pending.append((line_no, parsed))
+        if len(pending) >= BULK_CHUNK:
+            chunk_added, chunk_errors = await run_in_threadpool(add_mine_rows, pending)
+            added += chunk_added
+            note_errors(chunk_errors)
+            pending = []
+    if pending:
+        chunk_added, chunk_errors = await run_in_threadpool(add_mine_rows, pending)
+        added += chunk_added
+        note_errors(chunk_errors)
+    errors.sort()
+    return {"message": f"{added} mines created", "created": added, "error_count": error_count, "errors": errors}
+
+
+
 @app.put("/mines/{id}")
 def update_mine_endpoint(id: int, mine_update: MineUpdate):
-    with state_lock:
-        for i, m in enumerate(mines):
-            if m[2] == id:
-                new_row = mine_update.row if mine_update.row is not None else m[0]
-                new_col = mine_update.col if mine_update.col is not None else m[1]
-                new_serial = mine_update.serialNum if mine_update.serialNum is not None else m[2]
-                grid[m[0]][m[1]] = 0
-                if not (0 <= new_row < len(grid) and 0 <= new_col < len(grid[0])):
-                    raise HTTPException(status_code=400, detail="New coordinates out of bounds")
-                grid[new_row][new_col] = 1
-                mines[i] = [new_row, new_col, new_serial]
-                return {"message": "Mine updated", "row": new_row, "col": new_col, "id": new_serial}
-        raise HTTPException(status_code=404, detail="Mine not found")
+    with state_lock.write():
+        m = mines.get(id)
+        if m is None:
+            raise HTTPException(status_code=404, detail="Mine not found")
+        if (m.row, m.col) in disarming:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Mine is being disarmed")
+        new_row = mine_update.row if mine_update.row is not None else m.row
+        new_col = mine_update.col if mine_update.col is not None else m.col
+        new_serial = mine_update.serialNum if mine_update.serialNum is not None else m.serial
+        if not mines.in_bounds(new_row, new_col):
+            raise HTTPException(status_code=400, detail="New coordinates out of bounds")
+        other = mines.at(new_row, new_col)
+        if other is not None and other is not m:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="Mine already exists at the set location")
+        if new_serial != m.serial and new_serial in mines:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="Mine with this serial number already exists")
+        old_serial, old_row, old_col = m.serial, m.row, m.col
+        moved = mines.move(m, new_row, new_col, new_serial)
+        publish_mine("mine_updated", moved, old_id=old_serial, old_row=old_row, old_col=old_col)
+        if new_serial != old_serial:
+            warm_pins([moved])
+        return {"message": "Mine updated", "row": new_row, "col": new_col, "id": new_serial}
 
 
 # Endpoints (Rover)
 @app.get("/rovers")
-def get_rovers_endpoint():
-    with state_lock:
-        return {"rovers": rovers}
+def get_rovers_endpoint(row0: Optional[int] = None, col0: Optional[int] = None, rows: Optional[int] = None,
+                        cols: Optional[int] = None, center_row: Optional[int] = None,
+                        center_col: Optional[int] = None, radius: Optional[float] = None,
+                        status: Optional[str] = None, limit: Optional[int] = None, cursor: Optional[str] = None):
+    rect, inside = parse_region(row0, col0, rows, cols, center_row, center_col, radius)
+    after = parse_page(limit, cursor)
+    if status is not None:
+        status = ROVER_STATUS_NAMES.get(status.lower(), status)  # short names or the full status text
+        if status not in ROVER_STATUS_NAMES.values():
+            raise HTTPException(status_code=400,
+                                detail=f"Status must be one of {', '.join(ROVER_STATUS_NAMES)}")
+    with rover_lock.read():
+        found = rovers.query(rect, status, after)  # bucket index narrows rect queries down
+        if inside is not None:
+            found = (rover for rover in found if inside(*rover.position))
+        page, next_cursor = paginate((rover.to_dict() for rover in found), limit, lambda r: str(r["id"]))
+        return {"rovers": page, "next_cursor": next_cursor}
 
 
 @app.get("/rovers/{id}")
 def get_rover_endpoint(id: int):
-    with state_lock:
-        for rover in rovers:
-            if rover["id"] == id:
-                return rover
-        raise HTTPException(status_code=404, detail="Rover not found")
+    with rover_lock.read():
+        rover = rovers.get(id)
+        if rover is None:
+            raise HTTPException(status_code=404, detail="Rover not found")
+        return rover.to_dict()
 
 
 @app.post("/rovers")
 def create_rover_endpoint(rover_data: RoverCreate):
-    with state_lock:
+    with rover_lock.write():
         cmd_str = rover_data.commands.upper()
-        for cmd in cmd_str:
-            if cmd not in valid_commands:
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid command in command list")
-        new_id = id_list.pop()
-        rover = {
-            "id": new_id,
-            "commands": cmd_str,
-            "status": ROVER_IDLE,
-            "position": (0, 0),
-            "executed_commands": "",
-            "direction": 2
-        }
-        rovers.append(rover)
-        return {"message": "New Rover created", "id": new_id}
+        try:
+            program = dispatch_engine.compile_program(cmd_str)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid command in command list")
+        rover = rovers.create(cmd_str, ROVER_IDLE, program)
+        publish_rover("rover_added", rover)
+        return {"message": "New Rover created", "id": rover.id}
 
 
 @app.delete("/rovers/{id}")
 def delete_rover_endpoint(id: int):
-    with state_lock:
-        for i, rover in enumerate(rovers):
-            if rover["id"] == id:
-                rovers.pop(i)
-                return {"message": "Rover deleted"}
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Rover with id {id} not found")
+    with rover_lock.write():
+        rover = rovers.remove(id)
+        if rover is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Rover with id {id} not found")
+        publish_rover("rover_removed", rover)
+        return {"message": "Rover deleted"}
 
 
 @app.put("/rovers/{id}")
 def update_rover_endpoint(id: int, rover_update: RoverUpdate):
-    with state_lock:
-        for rover in rovers:
-            if rover["id"] == id:
-                if rover["status"] not in [ROVER_IDLE, ROVER_OPERATION_FINISHED]:
-                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                        detail="Cannot update commands while rover is in moving")
-                new_cmd = rover_update.commands.upper()
-                for cmd in new_cmd:
-                    if cmd not in valid_commands:
-                        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                            detail="Not a valid command")
-                rover["commands"] = new_cmd
-                rover["executed_commands"] = ""
-                rover["status"] = ROVER_IDLE
-                rover["position"] = (0, 0)
-                return {"message": "Rover commands updated", "rover": rover}
-        raise HTTPException(status_code=404, detail="Rover not found")
+    with rover_lock.write():
+        rover = rovers.get(id)
+        if rover is None:
+            raise HTTPException(status_code=404, detail="Rover not found")
+        if rover.status not in [ROVER_IDLE, ROVER_OPERATION_FINISHED]:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="Cannot update commands while rover is in moving")
+        new_cmd = rover_update.commands.upper()
+        try:
+            program = dispatch_engine.compile_program(new_cmd)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="Not a valid command")
+        set_rover_commands(rover, new_cmd, program)
+        return {"message": "Rover commands updated", "rover": rover.to_dict()}
+
+def set_rover_commands(rover, commands, program):
+    # Caller holds rover_lock and has checked the rover is not moving
+    rover.program = program
+    rover.commands = commands
+    rover.executed_commands = ""
+    rover.status = ROVER_IDLE
+    rover.position = (0, 0)
+    publish_rover("rover_updated", rover)
 
 
+# Dispatch claims the rover, simulates on the map, then writes the result back.
+# Each step holds only the lock it needs, so reads of the other side keep going.
+def claim_rovers(ids):
+    with rover_lock.write():
+        claimed = []
+        for rover_id in ids:
+            rover = rovers.get(rover_id)
+            if rover is None:
+                raise HTTPException(status_code=404, detail=f"Rover {rover_id} was not found")
+            if rover.status not in [ROVER_IDLE, ROVER_OPERATION_FINISHED]:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                    detail=f"Rover {rover_id} is already in progress")
+            claimed.append(rover)
+        for rover in claimed:
+            rover.status = ROVER_MOVING
+            publish_rover("rover_updated", rover)
+        return claimed
+
 @app.post("/rovers/{id}/dispatch")
 def dispatch_rover_endpoint(id: int):
-    with state_lock:
-        for rover in rovers:
-            if rover["id"] == id:
-                if rover["status"] not in [ROVER_IDLE, ROVER_OPERATION_FINISHED]:
-                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Rover is already in progress")
-                r, c = 0, 0
-                direction = 2  # Starting facing south.
-                executed = ""
-                for cmd in rover["commands"]:
-                    if grid[r][c] != 0:
-                        mine_found = None
-                        for m in mines:
-                            if m[0] == r and m[1] == c:
-                                mine_found = m
-                                break
-                        if mine_found:
-                            if cmd == "D":
-                                pin = disarm_mine(mine_found[2])
-                                executed += cmd
-                                mines.remove(mine_found)
-                                grid[r][c] = 0
-                            else:
-                                executed += cmd
-                                rover["status"] = ROVER_STATUS_ELIMINATED
-                                rover["executed_commands"] = executed
-                                rover["position"] = (r, c)
-                                return {"message": "Rover exploded on a mine", "rover": rover}
-                        else:
-                            executed += cmd
-                    else:
-                        if cmd == "L":
-                            direction = (direction - 1) % 4
-                            executed += cmd
-                        elif cmd == "R":
-                            direction = (direction + 1) % 4
-                            executed += cmd
-                        elif cmd == "M":
-                            nr, nc = r, c
-                            if direction == 0:
-                                nr -= 1
-                            elif direction == 1:
-                                nc += 1
-                            elif direction == 2:
-                                nr += 1
-                            elif direction == 3:
-                                nc -= 1
-                            if 0 <= nr < len(grid) and 0 <= nc < len(grid[0]):
-                                r, c = nr, nc
-                            executed += cmd
-                        elif cmd == "D":
-                            executed += cmd
-                rover["status"] = ROVER_OPERATION_FINISHED
-                rover["executed_commands"] = executed
-                rover["position"] = (r, c)
-                return {"message": "Rover dispatched successfully", "rover": rover}
-        raise HTTPException(status_code=404, detail="Rover was not found")
+    with rover_lock.write():
+        rover = rovers.get(id)
+        if rover is None:
+            raise HTTPException(status_code=404, detail="Rover was not found")
+        if rover.status not in [ROVER_IDLE, ROVER_OPERATION_FINISHED]:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Rover is already in progress")
+        rover.status = ROVER_MOVING
+        publish_rover("rover_updated", rover)
+        commands, program = rover.commands, rover.program
+    with state_lock.write():
+        # Starts at (0, 0) facing south. A mine that is already being disarmed no longer blocks its cell.
+        exploded, last, position, disarmed = dispatch_engine.run_program(program, grid, disarming.keys())
+        jobs = [start_disarm(mines.at(r, c)).id for r, c in disarmed]
+    if metrics.enabled:
+        dispatch_commands.observe(last + 1, "single")
+    with rover_lock.write():
+        rover.executed_commands = commands[:last + 1]
+        rover.position = position
+        rover.status = ROVER_STATUS_ELIMINATED if exploded else ROVER_OPERATION_FINISHED
+        publish_rover("rover_updated", rover)
+        if exploded:
+            return {"message": "Rover exploded on a mine", "rover": rover.to_dict(), "disarm_jobs": jobs}
+        return {"message": "Rover dispatched successfully", "rover": rover.to_dict(), "disarm_jobs": jobs}
+
+@app.post("/rovers/dispatch-batch")
+def dispatch_batch_endpoint(batch: DispatchBatch):
+    if len(set(batch.ids)) != len(batch.ids):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Rover ids must be unique")
+    batch_rovers = claim_rovers(batch.ids)
+    command_list = [rover.commands for rover in batch_rovers]
+    with state_lock.write():
+        # Same outcome as dispatching the rovers one by one in the given order
+        outcome, disarms = dispatch_engine.simulate(grid, command_list, cleared=disarming.keys())
+        jobs = [[] for _ in batch_rovers]
+        for i, (r, c) in disarms:
+            jobs[i].append(start_disarm(mines.at(r, c)).id)
+    if metrics.enabled:
+        for result in outcome:
+            dispatch_commands.observe(len(result.executed), "batch")
+    with rover_lock.write():
+        results = []
+        for rover, result, rover_jobs in zip(batch_rovers, outcome, jobs):
+            rover.status = ROVER_STATUS_ELIMINATED if result.exploded else ROVER_OPERATION_FINISHED
+            rover.executed_commands = result.executed
+            rover.position = result.position
+            publish_rover("rover_updated", rover)
+            message = "Rover exploded on a mine" if result.exploded else "Rover dispatched successfully"
+            results.append({"message": message, "rover": rover.to_dict(), "disarm_jobs": rover_jobs})
+        return {"message": f"{len(results)} rovers dispatched", "results": results}
+
+@app.post("/rovers/{id}/plan")
+def plan_rover_endpoint(id: int, request: PlanRequest):
+    if request.mode not in planner.MODES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Mode must be one of {', '.join(planner.MODES)}")
+    with rover_lock.read():
+        if rovers.get(id) is None:
+            raise HTTPException(status_code=404, detail="Rover not found")
+    target = (request.row, request.col)
+    with state_lock.read():
+        if not mines.in_bounds(*target):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Target is outside the map")
+        # Dispatch runs commands from (0, 0) facing south, so that is where routes start.
+        # Mines being disarmed still count as mines, so plans only change with the map version.
+        key = ((0, 0), 2, target, request.mode)
+        found = plans.get(mines, key)
+        cached = found is not None
+        planned_on, version, planned_grid = mines, mines.version, grid
+    if not cached:
+        # The planner copies the windows it searches under the lock and searches without it
+        try:
+            found = planner.plan(planned_grid, (0, 0), 2, target, request.mode, lock=state_lock.read)
+        except planner.NoRoute as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        except planner.SearchLimit as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        with state_lock.read():
+            if mines is planned_on and mines.version == version:  # the map didn't change while planning
+                plans.put(mines, key, found)
+    response = {"commands": found.commands, "length": len(found.commands), "mode": request.mode,
+                "target": list(target), "disarms": [list(cell) for cell in found.disarms], "cached": cached}
+    if request.apply:
+        with rover_lock.write():
+            rover = rovers.get(id)
+            if rover is None:
+                raise HTTPException(status_code=404, detail="Rover not found")
+            if rover.status not in [ROVER_IDLE, ROVER_OPERATION_FINISHED]:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                    detail="Cannot update commands while rover is in moving")
+            set_rover_commands(rover, found.commands, dispatch_engine.compile_program(found.commands))
+            response["rover"] = rover.to_dict()
+    return response
+
+@app.post("/rovers/coverage-plan")
+def coverage_plan_endpoint(request: CoverageRequest):
+    fleet = len(request.ids) if request.ids is not None else request.rovers
+    if fleet < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Fleet size must be positive")
+    if not 0 < request.time_budget <= 60:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Time budget must be in (0, 60] seconds")
+    if request.ids is not None:
+        if len(set(request.ids)) != len(request.ids):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Rover ids must be unique")
+        with rover_lock.read():
+            for rover_id in request.ids:
+                if rovers.get(rover_id) is None:
+                    raise HTTPException(status_code=404, detail=f"Rover {rover_id} was not found")
+    with state_lock.read():
+        planned_mines, planned_grid = mines, grid
+        rows, cols, _ = mines.to_arrays()
+        busy = disarming.keys()
+        if len(busy):
+            # Mines being disarmed are taken care of already
+            keep = np.array([cell not in busy for cell in zip(rows.tolist(), cols.tolist())], dtype=bool)
+            rows, cols = rows[keep], cols[keep]
+    # The tour is worked out without the lock, the commands against the map as it is now
+    planned = coverage_planner.plan(planned_grid, rows, cols, fleet, request.time_budget, lock=state_lock.read)
+    with state_lock.read():
+        if mines is not planned_mines:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="The map was replaced while planning")
+        routes = []
+        for route in planned:
+            # A mine removed since the commands were read drops out of the list, its D is harmless
+            found = [mines.at(r, c) for r, c in route.cells]
+            routes.append({"commands": route.commands, "length": len(route.commands),
+                           "mines": [mine_json(mine) for mine in found if mine is not None]})
+    if request.pins:
+        for route in routes:
+            for mine in route["mines"]:
+                mine["pin"] = disarm_engine.cached_pin(mine["id"])
+    if request.ids is not None:
+        with rover_lock.write():
+            claimed = []
+            for rover_id in request.ids:
+                rover = rovers.get(rover_id)
+                if rover is None:
+                    raise HTTPException(status_code=404, detail=f"Rover {rover_id} was not found")
+                if rover.status not in [ROVER_IDLE, ROVER_OPERATION_FINISHED]:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                        detail=f"Rover {rover_id} is already in progress")
+                claimed.append(rover)
+            for rover, route in zip(claimed, routes):
+                set_rover_commands(rover, route["commands"], dispatch_engine.compile_program(route["commands"]))
+                route["rover"] = rover.id
+    return {"mines": int(len(rows)), "routes": routes, "makespan": max(route["length"] for route in routes),
+            "total_commands": sum(route["length"] for route in routes)}
+
+@app.get("/disarm-jobs/{id}")
+def get_disarm_job_endpoint(id: int):
+    job = disarm_jobs.get(id)
+    if job is not None:
+        return job.to_dict()
+    data = backend.load_job(id)  # started by another worker
+    if data is None:
+        raise HTTPException(status_code=404, detail="Disarm job not found")
+    return data
 
 @app.get("/commands/{id}")
-def get_commands_endpoint(id: int):
-    return {"commands": helper.get_rover_commands(id)}
+async def get_commands_endpoint(id: int):
+    try:
+        return {"commands": await command_store.get(id)}
+    except CommandsUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+# Endpoints (Metrics and profiling)
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def require_debug():
+    # Profiling and instrumentation switches are for operators, not on by default
+    if not debug_endpoints:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@app.put("/debug/instrumentation", dependencies=[Depends(require_debug)])
+def set_instrumentation_endpoint(config: InstrumentationConfig):
+    metrics.set_enabled(config.enabled)
+    return {"enabled": metrics.enabled}
+
+@app.post("/debug/profile", status_code=status.HTTP_201_CREATED, dependencies=[Depends(require_debug)])
+def start_profile_endpoint(config: ProfileConfig):
+    if not 0.0001 <= config.interval <= 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Interval must be 0.0001-1 seconds")
+    try:
+        profiler.start(config.interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"message": "Profiler started", "interval": config.interval}
+
+@app.get("/debug/profile", response_class=PlainTextResponse, dependencies=[Depends(require_debug)])
+def get_profile_endpoint():
+    # Collapsed stacks so far ("frame;frame;frame count" per line, for flamegraph.pl / speedscope)
+    return profiler.collapsed()
+
+@app.delete("/debug/profile", response_class=PlainTextResponse, dependencies=[Depends(require_debug)])
+def stop_profile_endpoint():
+    if not profiler.running:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Profiler is not running")
+    return profiler.stop()
 
 # Endpoint (WebSockets)
+# Anything that takes a lock runs in the threadpool so the event loop never blocks on it.
+def claim_rover_for_control(id: int):
+    with rover_lock.write():
+        target_rover = rovers.get(id)
+        if target_rover is None:
+            return None, "Rover was not found"
+        if target_rover.status not in [ROVER_IDLE, ROVER_OPERATION_FINISHED]:
+            return None, "Rover is not ready for real-time control"
+        target_rover.commands = ""
+        target_rover.program = dispatch_engine.compile_program("")
+        target_rover.executed_commands = ""
+        target_rover.position = (0, 0)
+        target_rover.status = ROVER_MOVING
+        publish_rover("rover_updated", target_rover)
+        return target_rover, None
+
+def release_rover(target_rover):
+    with rover_lock.write():
+        target_rover.status = ROVER_OPERATION_FINISHED
+        publish_rover("rover_updated", target_rover)
+
+def parse_batch(data):
+    # A batch frame is a command string ("MMRMMD"), a JSON array of commands or
+    # {"commands": ...}. Returns the commands as one string, or None if invalid.
+    if isinstance(data, str) and data.lstrip()[:1] in ("[", "{"):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            return None
+    if isinstance(data, dict):
+        data = data.get("commands")
+    if isinstance(data, list):
+        if not all(isinstance(cmd, str) for cmd in data):
+            return None
+        data = "".join(data)
+    if not isinstance(data, str):
+        return None
+    commands = "".join(data.split()).upper()
+    return commands if dispatch_engine.VALID_COMMANDS.issuperset(commands) else None
+
 @app.websocket("/ws/rovers/{id}")
 async def websocket_control_rover(websocket: WebSocket, id: int):
+    # Single character frames get one message per command, as before. Longer
+    # frames are batches: run under one lock acquisition, one response each.
+    # Binary frames are msgpack batches answered in msgpack (needs msgpack).
     await websocket.accept()
-    with state_lock:
-        target_rover = None
-        for rover in rovers:
-            if rover["id"] == id:
-                target_rover = rover
-                break
-        if target_rover is None:
-            await websocket.send_json({"error": "Rover was not found"})
-            await websocket.close()
-            return
-        if target_rover["status"] not in [ROVER_IDLE, ROVER_OPERATION_FINISHED]:
-            await websocket.send_json({"error": "Rover is not ready for real-time control"})
-            await websocket.close()
-            return
-        target_rover["commands"] = ""
-        target_rover["executed_commands"] = ""
-        target_rover["position"] = (0, 0)
-        target_rover["status"] = ROVER_MOVING
+    target_rover, error = await run_in_threadpool(claim_rover_for_control, id)
+    if target_rover is None:
+        await websocket.send_json({"error": error})
+        await websocket.close()
+        return
     direction = 2
     r, c = 0, 0
+
+    def apply(cmd):
+        # Caller holds state_lock. Returns (response, disarm job or None, exploded)
+        nonlocal direction, r, c
+        # Check if there's a mine at the current position.
+        mine_found = None
+        if grid[r, c] != 0 and (r, c) not in disarming:
+            mine_found = mines.at(r, c)
+
+        # If on a mine and the command is not "D", the rover explodes.
+        if mine_found and cmd != "D":
+            response = {
+                "command": cmd,
+                "result": False,
+                "error": "Rover exploded upon encountering a mine"
+            }
+            return response, None, True
+        job = None
+        if cmd == "L":
+            direction = (direction - 1) % 4
+            response = {"command": "L", "result": True, "direction": direction}
+        elif cmd == "R":
+            direction = (direction + 1) % 4
+            response = {"command": "R", "result": True, "direction": direction}
+        elif cmd == "M":
+            nr, nc = r, c
+            if direction == 0:
+                nr -= 1
+            elif direction == 1:
+                nc += 1
+            elif direction == 2:
+                nr += 1
+            elif direction == 3:
+                nc -= 1
+            if 0 <= nr < grid.shape[0] and 0 <= nc < grid.shape[1]:
+                r, c = nr, nc
+                response = {"command": "M", "result": True, "new_position": [r, c]}
+            else:
+                response = {"command": "M", "result": False, "error": "Rover hit the end of the map"}
+        elif cmd == "D":
+            if mine_found:
+                # Disarm the mine if it exists (PIN is awaited off the lock).
+                job = start_disarm(mine_found)
+                response = {"command": "D", "result": True, "job_id": job.id}
+            else:
+                response = {"command": "D", "error": "No mine at current position"}
+        else:
+            response = {"error": "Invalid command"}
+        return response, job, False
+
+    def record(executed, exploded):
+        # Caller holds state_lock
+        with rover_lock.write():
+            target_rover.executed_commands += executed
+            target_rover.position = (r, c)
+            if exploded:
+                target_rover.status = ROVER_STATUS_ELIMINATED
+            publish_rover("rover_updated", target_rover)
+
+    def step(cmd):
+        with state_lock.write():
+            response, job, exploded = apply(cmd)
+            record(cmd, exploded)
+        return response, job, exploded
+
+    def run_batch(commands):
+        # Returns (response, [(disarm entry, job)], exploded). Errors and
+        # disarms are listed by index, successful moves and turns are not.
+        errors = []
+        disarms = []
+        exploded = False
+        executed = 0
+        with state_lock.write():
+            for index, cmd in enumerate(commands):
+                response, job, exploded = apply(cmd)
+                executed = index + 1
+                if exploded:
+                    errors.append([index, response["error"]])
+                    break
+                if job is not None:
+                    disarms.append(({"index": index, "row": job.row, "col": job.col, "id": job.serial}, job))
+                elif "error" in response:
+                    errors.append([index, response["error"]])
+            record(commands[:executed], exploded)
+            response = {
+                "executed": commands[:executed],
+                "position": [r, c],
+                "direction": direction,
+                "exploded": exploded,
+                "errors": errors,
+                "disarmed": [entry for entry, _ in disarms]
+            }
+        return response, disarms, exploded
+
+    async def handle_batch(data, binary):
+        commands = parse_batch(data)
+        if commands is None:
+            response, exploded = {"error": "Invalid command batch"}, False
+        else:
+            response, disarms, exploded = await run_in_threadpool(run_batch, commands)
+            for entry, job in disarms:
+                await asyncio.wrap_future(job.future)
+                if job.status == JOB_DONE:
+                    entry["pin"] = job.pin
+                else:
+                    entry["error"] = job.error
+        if binary:
+            await websocket.send_bytes(msgpack.packb(response))
+        else:
+            await websocket.send_json(response)
+        return exploded
+
     try:
         while True:
-            data = await websocket.receive_text()
-            cmd = data.strip().upper()
-            should_explode = False
-
-            with state_lock:
-                # Check if there's a mine at the current position.
-                mine_found = None
-                if grid[r][c] != 0:
-                    for m in mines:
-                        if m[0] == r and m[1] == c:
-                            mine_found = m
-                            break
-
-                # If on a mine and the command is not "D", the rover explodes.
-                if mine_found and cmd != "D":
-                    target_rover["executed_commands"] += cmd
-                    target_rover["status"] = ROVER_STATUS_ELIMINATED
-                    target_rover["position"] = (r, c)
-                    response = {
-                        "command": cmd,
-                        "result": False,
-                        "error": "Rover exploded upon encountering a mine"
-                    }
-                    should_explode = True
-                else:
-                    if cmd == "L":
-                        direction = (direction - 1) % 4
-                        response = {"command": "L", "result": True, "direction": direction}
-                    elif cmd == "R":
-                        direction = (direction + 1) % 4
-                        response = {"command": "R", "result": True, "direction": direction}
-                    elif cmd == "M":
-                        nr, nc = r, c
-                        if direction == 0:
-                            nr -= 1
-                        elif direction == 1:
-                            nc += 1
-                        elif direction == 2:
-                            nr += 1
-                        elif direction == 3:
-                            nc -= 1
-                        if 0 <= nr < len(grid) and 0 <= nc < len(grid[0]):
-                            r, c = nr, nc
-                            response = {"command": "M", "result": True, "new_position": [r, c]}
-                        else:
-                            response = {"command": "M", "result": False, "error": "Rover hit the end of the map"}
-                    elif cmd == "D":
-                        if mine_found:
-                            # Disarm the mine if it exists.
-                            pin = disarm_mine(mine_found[2])
-                            response = {"command": "D", "result": True, "pin": pin}
-                            mines.remove(mine_found)
-                            grid[r][c] = 0
-                        else:
-                            response = {"command": "D", "error": "No mine at current position"}
-                    else:
-                        response = {"error": "Invalid command"}
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes") is not None:
+                if msgpack is None:
+                    await websocket.send_json({"error": "Binary frames need msgpack on the server"})
+                    continue
+                try:
+                    data = msgpack.unpackb(message["bytes"])
+                except ValueError:
+                    data = None
+                should_explode = await handle_batch(data, binary=True)
+            elif len(message["text"].strip()) > 1:
+                should_explode = await handle_batch(message["text"], binary=False)
+            else:
+                cmd = message["text"].strip().upper()
+                response, job, should_explode = await run_in_threadpool(step, cmd)
 
-                    target_rover["executed_commands"] += cmd
-                    target_rover["position"] = (r, c)
+                if job is not None:
+                    await asyncio.wrap_future(job.future)
+                    if job.status == JOB_DONE:
+                        response["pin"] = job.pin
+                    else:
+                        response = {"command": "D", "result": False, "error": job.error}
 
-            # Send the response (pull from helper).
-            await websocket.send_json({"message": format_response_message(response)})
+                # Send the response (pull from helper).
+                await websocket.send_json({"message": format_response_message(response)})
 
             # If the rover exploded, close the websocket.
             if should_explode:
@@ -365,8 +1147,30 @@ async def websocket_control_rover(websocket: WebSocket, id: int):
                 return
 
     except WebSocketDisconnect:
-        with state_lock:
-            target_rover["status"] = ROVER_OPERATION_FINISHED
+        await run_in_threadpool(release_rover, target_rover)
         return
 
 
+@app.websocket("/ws/events")
+async def websocket_events(websocket: WebSocket):
+    # Pushes batches of deltas: {"events": [{"type": "mine_added", ...}, ...]}.
+    # A {"type": "resync"} event means this client fell behind and should reload.
+    sub = events.subscribe()
+    await websocket.accept()
+
+    async def pump():
+        try:
+            while True:
+                await websocket.send_json({"events": await sub.next_batch()})
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # client went away, the receive loop below cleans up
+
+    sender = asyncio.create_task(pump())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    finally:
+        sender.cancel()
+        events.unsubscribe(sub)
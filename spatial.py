@@ -0,0 +1,77 @@
+# Sarim Shahwar
+# Spatial lookups behind the region filters on GET /mines and GET /rovers.
+#
+# Mines need no extra index: the grid is a bitmap of them, so a window is
+# scanned with numpy a block of rows at a time, in row-major order (which is
+# also the pagination order). Rovers move on every dispatch, so they sit in
+# a uniform bucket grid that RoverRegistry keeps current.
+import numpy as np
+
+BUCKET = 64  # cells per bucket side
+SCAN_CELLS = 1 << 20  # grid cells looked at per numpy call
+
+
+def iter_cells(grid, r0, r1, c0, c1, after=-1):
+    # (row, col) of every mine in rows [r0, r1) x cols [c0, c1), row-major,
+    # starting after flat cell index `after` (row * cols + col)
+    cols = grid.shape[1]
+    if after >= 0:
+        r0 = max(r0, after // cols)
+    block = max(1, SCAN_CELLS // max(c1 - c0, 1))
+    for start in range(r0, r1, block):
+        stop = min(start + block, r1)
+        rows, cs = np.nonzero(grid[start:stop, c0:c1])
+        rows += start
+        cs += c0
+        if start * cols <= after:
+            keep = rows * cols + cs > after
+            rows, cs = rows[keep], cs[keep]
+        yield from zip(rows.tolist(), cs.tolist())
+
+
+class BucketIndex:
+    # key -> (row, col), with the keys of each BUCKET x BUCKET square kept together
+    def __init__(self, size=BUCKET):
+        self.size = size
+        self._buckets = {}  # (row // size, col // size) -> set of keys
+        self._where = {}  # key -> its bucket
+
+    def __len__(self):
+        return len(self._where)
+
+    def put(self, key, position):
+        bucket = (position[0] // self.size, position[1] // self.size)
+        old = self._where.get(key)
+        if old == bucket:
+            return
+        if old is not None:
+            self._discard(key, old)
+        self._buckets.setdefault(bucket, set()).add(key)
+        self._where[key] = bucket
+
+    def remove(self, key):
+        old = self._where.pop(key, None)
+        if old is not None:
+            self._discard(key, old)
+
+    def _discard(self, key, bucket):
+        keys = self._buckets[bucket]
+        keys.discard(key)
+        if not keys:
+            del self._buckets[bucket]
+
+    def candidates(self, r0, r1, c0, c1):
+        # Keys in buckets touching rows [r0, r1) x cols [c0, c1). Callers check exact positions.
+        b_r0, b_r1 = r0 // self.size, (r1 - 1) // self.size
+        b_c0, b_c1 = c0 // self.size, (c1 - 1) // self.size
+        found = set()
+        if (b_r1 - b_r0 + 1) * (b_c1 - b_c0 + 1) <= len(self._buckets):
+            for br in range(b_r0, b_r1 + 1):
+                for bc in range(b_c0, b_c1 + 1):
+                    found.update(self._buckets.get((br, bc), ()))
+        else:
+            # Window spans more buckets than are in use, walk the ones in use
+            for (br, bc), keys in self._buckets.items():
+                if b_r0 <= br <= b_r1 and b_c0 <= bc <= b_c1:
+                    found.update(keys)
+        return found
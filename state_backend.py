@@ -0,0 +1,436 @@
+# Sarim Shahwar
+# State backends: where the map, mines, rovers and disarm bookkeeping live.
+#
+# MemoryState keeps everything in this process (the default, one worker).
+# SharedState lets several uvicorn workers on one machine serve the same
+# world (ROVER_BACKEND=shared, files under ROVER_STATE_DIR):
+#   - the grid is a file mapped into every worker (np.memmap), so a mine
+#     placed by one worker is in everyone's grid at once
+#   - mines, rovers, disarming cells and disarm jobs are SQLite tables in
+#     WAL mode (readers never wait for the writer)
+#   - state_lock / rover_lock become ProcessRWLock: the usual RWLock for
+#     this worker's threads plus an flock for the other workers. Every
+#     check-then-change the server does under a write lock is therefore
+#     atomic across workers.
+# A worker notices another worker's PUT /map on its next state_lock
+# acquisition (control.bin holds the map generation) and maps the new grid.
+import fcntl
+import itertools
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+import dispatch_engine
+import helper
+from disarm_jobs import JOB_PENDING, JOB_RUNNING, MAX_FINISHED_JOBS
+from locks import RWLock
+from registry import Mine, MineRegistry, Rover, RoverRegistry
+
+BACKEND_MEMORY = "memory"
+BACKEND_SHARED = "shared"
+INITIAL_MAP = (5, 10)
+FIRST_ROVER_ID = 100
+
+# control.bin: magic, map generation, map version, rows, cols, store id
+_CONTROL = struct.Struct("<8sQQQQQ")
+_CONTROL_MAGIC = b"RVCTL001"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mines (serial INTEGER PRIMARY KEY, row INTEGER NOT NULL, col INTEGER NOT NULL,
+                                  UNIQUE (row, col));
+CREATE TABLE IF NOT EXISTS rovers (id INTEGER PRIMARY KEY, commands TEXT NOT NULL, status TEXT NOT NULL,
+                                   row INTEGER NOT NULL, col INTEGER NOT NULL,
+                                   executed_commands TEXT NOT NULL, direction INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS rovers_cell ON rovers (row, col);
+CREATE TABLE IF NOT EXISTS disarming (row INTEGER NOT NULL, col INTEGER NOT NULL, job_id INTEGER NOT NULL,
+                                      PRIMARY KEY (row, col));
+CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, serial INTEGER, row INTEGER, col INTEGER,
+                                 status TEXT, pin TEXT, error TEXT);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO counters VALUES ('rover_id', %d), ('job_id', 1);
+""" % FIRST_ROVER_ID
+
+
+class MemoryState:
+    def __init__(self):
+        self.grid, mine_list = helper.generate_map_grid(*INITIAL_MAP)
+        self.mines = MineRegistry(self.grid, mine_list)  # indexed by serial and by (row, col)
+        self.rovers = RoverRegistry(FIRST_ROVER_ID)
+        self.disarming = {}  # (row, col) -> disarm job id
+        self.state_lock = RWLock("state")  # grid, mines and disarming
+        self.rover_lock = RWLock("rovers")  # rovers (take state_lock first when both are needed)
+        self.boot_id = os.urandom(4).hex()  # keeps ETags from matching across restarts
+        self.on_map_replaced = None  # never called, nothing else changes the map
+        self.new_job_id = itertools.count(1).__next__
+
+    def replace_map(self, grid, mines):
+        # Caller holds state_lock
+        self.grid, self.mines = grid, mines
+        return grid, mines
+
+    def save_job(self, job):
+        pass  # jobs live in the DisarmJobQueue already
+
+    def load_job(self, job_id):
+        return None
+
+
+class ProcessRWLock:
+    # RWLock across worker processes. Threads of this worker queue on an
+    # RWLock, then take an flock on a descriptor of their own (flock is per
+    # open file, so sharing one descriptor would let threads skip each other).
+    def __init__(self, path, name=None, on_acquire=None):
+        self.name = name
+        self.path = path
+        self.observe = None  # observe(mode, wait seconds, hold seconds) while instrumented
+        self.on_acquire = on_acquire  # runs right after each acquisition
+        self._threads = RWLock(name)
+        self._fds = threading.local()
+
+    def _fd(self):
+        fd = getattr(self._fds, "fd", None)
+        if fd is None:
+            fd = self._fds.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        return fd
+
+    @contextmanager
+    def _hold(self, mode, thread_lock, flock_mode):
+        observe = self.observe
+        if observe is not None:
+            start = time.perf_counter()
+        with thread_lock():
+            fd = self._fd()
+            fcntl.flock(fd, flock_mode)
+            try:
+                if observe is not None:
+                    acquired = time.perf_counter()
+                if self.on_acquire is not None:
+                    self.on_acquire()
+                yield
+            finally:
+                if observe is not None:
+                    observe(mode, acquired - start, time.perf_counter() - acquired)
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def read(self):
+        return self._hold("read", self._threads.read, fcntl.LOCK_SH)
+
+    def write(self):
+        return self._hold("write", self._threads.write, fcntl.LOCK_EX)
+
+
+class SharedMines:
+    # MineRegistry over the mines table and the shared grid. Callers hold state_lock.
+    def __init__(self, state, grid):
+        self.state = state
+        self.grid = grid
+
+    @property
+    def version(self):
+        return self.state.control()[2]
+
+    def __len__(self):
+        return self.state.db().execute("SELECT COUNT(*) FROM mines").fetchone()[0]
+
+    def __iter__(self):
+        rows = self.state.db().execute("SELECT row, col, serial FROM mines").fetchall()
+        return iter([Mine(*row) for row in rows])
+
+    def __contains__(self, serial):
+        return self.get(serial) is not None
+
+    def get(self, serial):
+        row = self.state.db().execute("SELECT row, col, serial FROM mines WHERE serial = ?", (serial,)).fetchone()
+        return Mine(*row) if row else None
+
+    def at(self, row, col):
+        found = self.state.db().execute("SELECT row, col, serial FROM mines WHERE row = ? AND col = ?",
+                                        (row, col)).fetchone()
+        return Mine(*found) if found else None
+
+    def in_bounds(self, row, col):
+        rows, cols = self.grid.shape
+        return 0 <= row < rows and 0 <= col < cols
+
+    def add(self, row, col, serial) -> Mine:
+        if serial in self:
+            raise ValueError(f"Mine with serial {serial} already exists")
+        if self.at(row, col) is not None:
+            raise ValueError("Mine already exists at the set location")
+        self.state.db().execute("INSERT INTO mines (serial, row, col) VALUES (?, ?, ?)", (serial, row, col))
+        self.grid[row, col] = 1
+        self.state.bump_version()
+        return Mine(row, col, serial)
+
+    def remove(self, serial) -> Mine:
+        mine = self.get(serial)
+        if mine is None:
+            raise KeyError(serial)
+        self.state.db().execute("DELETE FROM mines WHERE serial = ?", (serial,))
+        self.grid[mine.row, mine.col] = 0
+        self.state.bump_version()
+        return mine
+
+    def move(self, mine, row, col, serial):
+        # Caller checks that the new cell and serial are free
+        self.state.db().execute("UPDATE mines SET row = ?, col = ?, serial = ? WHERE serial = ?",
+                                (row, col, serial, mine.serial))
+        self.grid[mine.row, mine.col] = 0
+        mine.row, mine.col, mine.serial = row, col, serial
+        self.grid[row, col] = 1
+        self.state.bump_version()
+        return mine
+
+    @contextmanager
+    def batch(self):
+        db = self.state.db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def to_arrays(self):
+        data = np.array(self.state.db().execute("SELECT row, col, serial FROM mines").fetchall(),
+                        dtype=np.int64).reshape(-1, 3)
+        return data[:, 0].astype(np.int32), data[:, 1].astype(np.int32), data[:, 2]
+
+
+class SharedRovers:
+    # RoverRegistry over the rovers table. Rovers come back as fresh objects,
+    # changes are written with save() (the server calls it on every update).
+    def __init__(self, state):
+        self.state = state
+
+    @staticmethod
+    def _rover(row):
+        rover_id, commands, status, r, c, executed, direction = row
+        rover = Rover(rover_id, commands, status, (r, c), direction, dispatch_engine.compile_program(commands))
+        rover.executed_commands = executed
+        return rover
+
+    @property
+    def next_id(self):
+        return self.state.db().execute("SELECT value FROM counters WHERE name = 'rover_id'").fetchone()[0]
+
+    def __len__(self):
+        return self.state.db().execute("SELECT COUNT(*) FROM rovers").fetchone()[0]
+
+    def __iter__(self):
+        return iter([self._rover(row) for row in self.state.db().execute("SELECT * FROM rovers ORDER BY id")])
+
+    def get(self, rover_id):
+        row = self.state.db().execute("SELECT * FROM rovers WHERE id = ?", (rover_id,)).fetchone()
+        return self._rover(row) if row else None
+
+    def create(self, commands, status, program=None) -> Rover:
+        rover = Rover(self.state.next_counter("rover_id"), commands, status, program=program)
+        self.state.db().execute("INSERT INTO rovers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (rover.id, commands, status, 0, 0, "", rover.direction))
+        return rover
+
+    def remove(self, rover_id):
+        rover = self.get(rover_id)
+        if rover is not None:
+            self.state.db().execute("DELETE FROM rovers WHERE id = ?", (rover_id,))
+        return rover
+
+    def positions(self, skip_status=None):
+        # Same as RoverRegistry.positions, without building the rovers
+        return self.state.db().execute("SELECT DISTINCT row, col FROM rovers WHERE status IS NOT ?",
+                                       (skip_status,)).fetchall()
+
+    def query(self, rect=None, status=None, after=None):
+        # Same as RoverRegistry.query, filtered by SQLite (rovers_cell index)
+        sql, args = ["SELECT * FROM rovers WHERE id > ?"], [after if after is not None else -1]
+        if status is not None:
+            sql.append("status = ?")
+            args.append(status)
+        if rect is not None:
+            sql.append("row >= ? AND row < ? AND col >= ? AND col < ?")
+            args += rect
+        for row in self.state.db().execute(" AND ".join(sql) + " ORDER BY id", args):
+            yield self._rover(row)
+
+    def save(self, rover):
+        # UPDATE only, a rover deleted by another request stays deleted
+        self.state.db().execute(
+            "UPDATE rovers SET commands = ?, status = ?, row = ?, col = ?, executed_commands = ?, direction = ? "
+            "WHERE id = ?", (rover.commands, rover.status, rover.position[0], rover.position[1],
+                             rover.executed_commands, rover.direction, rover.id))
+
+
+class SharedDisarming:
+    # (row, col) -> job id mapping over the disarming table. Callers hold state_lock.
+    # Cells of a worker that dies mid-job stay held until the map is replaced.
+    def __init__(self, state):
+        self.state = state
+
+    def __setitem__(self, cell, job_id):
+        self.state.db().execute("INSERT OR REPLACE INTO disarming VALUES (?, ?, ?)", (*cell, job_id))
+
+    def __delitem__(self, cell):
+        self.state.db().execute("DELETE FROM disarming WHERE row = ? AND col = ?", cell)
+
+    def __contains__(self, cell):
+        return self.get(cell) is not None
+
+    def __len__(self):
+        return self.state.db().execute("SELECT COUNT(*) FROM disarming").fetchone()[0]
+
+    def get(self, cell, default=None):
+        row = self.state.db().execute("SELECT job_id FROM disarming WHERE row = ? AND col = ?", cell).fetchone()
+        return row[0] if row else default
+
+    def keys(self):
+        return {(r, c) for r, c in self.state.db().execute("SELECT row, col FROM disarming")}
+
+    def clear(self):
+        self.state.db().execute("DELETE FROM disarming")
+
+
+class SharedState:
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.db_path = os.path.join(directory, "state.db")
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+        self.generation = None
+        self.grid = None
+        self.mines = None
+        self.on_map_replaced = None  # on_map_replaced(grid, mines) when another worker replaced the map
+        self._setup()
+        self.boot_id = f"{self.control()[5]:08x}"  # shared, so ETags hold across workers
+        self.state_lock = ProcessRWLock(os.path.join(directory, "state.lock"), "state", on_acquire=self.sync)
+        self.rover_lock = ProcessRWLock(os.path.join(directory, "rovers.lock"), "rovers")
+        self.rovers = SharedRovers(self)
+        self.disarming = SharedDisarming(self)
+        with self.state_lock.read():
+            pass  # maps the current grid
+
+    def _setup(self):
+        # First worker in creates the files, the others wait on init.lock and reuse them
+        with open(os.path.join(self.directory, "init.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            db = self.db()
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+            control_path = os.path.join(self.directory, "control.bin")
+            if not os.path.exists(control_path):
+                rows, cols = INITIAL_MAP
+                self._write_grid(1, np.zeros(INITIAL_MAP, dtype=np.uint8))
+                with open(control_path + ".tmp", "wb") as f:
+                    f.write(_CONTROL.pack(_CONTROL_MAGIC, 1, 1, rows, cols, int.from_bytes(os.urandom(4), "big")))
+                os.replace(control_path + ".tmp", control_path)
+            with open(control_path, "r+b") as f:
+                self._control = mmap.mmap(f.fileno(), _CONTROL.size)
+            if self.control()[0] != _CONTROL_MAGIC:
+                raise ValueError(f"{control_path} is not a rover state control file")
+
+    def db(self):
+        # One connection per thread, autocommit: each statement is its own transaction
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def control(self):
+        return _CONTROL.unpack_from(self._control)
+
+    def _set_control(self, generation, version, rows, cols):
+        _CONTROL.pack_into(self._control, 0, _CONTROL_MAGIC, generation, version, rows, cols, self.control()[5])
+
+    def _grid_path(self, generation):
+        return os.path.join(self.directory, f"grid-{generation}.bin")
+
+    def _write_grid(self, generation, grid):
+        shared = np.memmap(self._grid_path(generation), dtype=np.uint8, mode="w+", shape=grid.shape)
+        shared[:] = grid
+        shared.flush()
+        return shared
+
+    def next_counter(self, name):
+        # Atomic across workers without any of the server locks
+        return self.db().execute("UPDATE counters SET value = value + 1 WHERE name = ? RETURNING value - 1",
+                                 (name,)).fetchone()[0]
+
+    def new_job_id(self):
+        return self.next_counter("job_id")
+
+    def bump_version(self):
+        # Caller holds state_lock for writing
+        generation, version, rows, cols = self.control()[1:5]
+        self._set_control(generation, version + 1, rows, cols)
+
+    def sync(self):
+        # Runs on every state_lock acquisition: adopt a map another worker put in
+        generation, _, rows, cols = self.control()[1:5]
+        if generation == self.generation:
+            return
+        with self._sync_lock:
+            if generation == self.generation:
+                return
+            self.grid = np.memmap(self._grid_path(generation), dtype=np.uint8, mode="r+", shape=(rows, cols))
+            self.mines = SharedMines(self, self.grid)
+            self.generation = generation
+            if self.on_map_replaced is not None:
+                self.on_map_replaced(self.grid, self.mines)
+
+    def replace_map(self, grid, mines):
+        # Caller holds state_lock for writing. mines is a MineRegistry for grid.
+        old_generation, version = self.control()[1:3]
+        generation = old_generation + 1
+        self._write_grid(generation, grid)
+        rows, cols, serials = mines.to_arrays()
+        db = self.db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM mines")
+            db.execute("DELETE FROM disarming")
+            db.executemany("INSERT INTO mines (serial, row, col) VALUES (?, ?, ?)",
+                           zip(serials.tolist(), rows.tolist(), cols.tolist()))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self._set_control(generation, version + 1, *grid.shape)
+        self.sync()
+        try:
+            os.remove(self._grid_path(old_generation))  # workers still mapping it keep their pages
+        except FileNotFoundError:
+            pass
+        return self.grid, self.mines
+
+    def save_job(self, job):
+        db = self.db()
+        db.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                   (job.id, job.serial, job.row, job.col, job.status, job.pin, job.error))
+        if job.status not in (JOB_PENDING, JOB_RUNNING):
+            # Like the DisarmJobQueue, keep about MAX_FINISHED_JOBS finished jobs (ids run across workers)
+            db.execute("DELETE FROM jobs WHERE id <= ? AND status NOT IN (?, ?)",
+                       (job.id - MAX_FINISHED_JOBS, JOB_PENDING, JOB_RUNNING))
+
+    def load_job(self, job_id):
+        row = self.db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "serial", "row", "col", "status", "pin", "error"), row))
+
+
+def make_backend():
+    kind = os.environ.get("ROVER_BACKEND", BACKEND_MEMORY)
+    if kind == BACKEND_MEMORY:
+        return MemoryState()
+    if kind == BACKEND_SHARED:
+        return SharedState(os.environ.get("ROVER_STATE_DIR", "rover_state"))
+    raise ValueError(f"ROVER_BACKEND must be {BACKEND_MEMORY!r} or {BACKEND_SHARED!r}")
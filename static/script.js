@@ -1,84 +1,484 @@
 // Sarim Shahwar
 
+// Field map: a canvas that only draws the cells in view. The grid is fetched
+// in TILE x TILE windows (GET /map?format=bits) as they scroll into view and
+// kept current by /ws/events deltas, so a change never reloads the whole map.
+// A spacer the size of the full map gives the scroll container its scrollbars;
+// the canvas is moved to the visible corner and redrawn on scroll.
+const TILE = 128; // cells per tile side
+const MIN_CELL = 2, MAX_CELL = 48; // cell size in px
+const MAX_TILE_REQUESTS = 4; // tile fetches in flight at once
+const LIST_LIMIT = 200; // mines / rovers listed per page
+const ROVER_ELIMINATED = "ROVER STATUS: ELIMINATED";
+
+const TILE_MISSING = 0, TILE_LOADING = 1, TILE_LOADED = 2;
+
+const field = {
+    rows: 0, cols: 0,
+    cells: new Uint8Array(0), // 1 = mine, row-major
+    tiles: new Uint8Array(0), // TILE_* per tile
+    filled: new Uint8Array(0), // 1 once a tile has cells for this map (kept while it is fetched again)
+    tileEtags: [],
+    stale: new Set(), // tiles changed by a delta while their fetch was in flight
+    disarming: new Set(), // cell index of mines whose PIN is being solved
+    rovers: new Map(), // id -> rover, for the cells in roverRect and any a delta moved
+    roverRect: null, // {r0, r1, c0, c1} the rovers were fetched for (or are being fetched for)
+    roverStale: new Set(), // rover ids changed by a delta while that fetch was in flight
+    cellSize: 24,
+    selected: null, // [row, col]
+};
+let tileRequests = 0;
+let roverRequest = 0, roverPending = false;
+let drawPending = false;
+let eventsSocket = null;
+
+const mapScroll = document.getElementById("map-scroll");
+const mapSpacer = document.getElementById("map-spacer");
+const canvas = document.getElementById("map-canvas");
+const ctx = canvas.getContext("2d");
+
+function resetField(rows, cols) {
+    const tilesAcross = Math.ceil(cols / TILE), tilesDown = Math.ceil(rows / TILE);
+    field.rows = rows;
+    field.cols = cols;
+    field.cells = new Uint8Array(rows * cols);
+    field.tiles = new Uint8Array(tilesAcross * tilesDown);
+    field.filled = new Uint8Array(field.tiles.length);
+    field.tileEtags = new Array(field.tiles.length).fill(null);
+    field.stale.clear();
+    field.disarming.clear();
+    field.roverRect = null;
+    field.selected = null;
+    mapScroll.scrollTop = mapScroll.scrollLeft = 0;
+    // Small maps start zoomed in so the whole field fits the width
+    field.cellSize = Math.max(MIN_CELL, Math.min(MAX_CELL, Math.floor(mapScroll.clientWidth / cols)));
+    resizeSpacer();
+}
+
+function resizeSpacer() {
+    mapSpacer.style.width = field.cols * field.cellSize + "px";
+    mapSpacer.style.height = field.rows * field.cellSize + "px";
+}
+
+function tileOf(row, col) {
+    return Math.floor(row / TILE) * Math.ceil(field.cols / TILE) + Math.floor(col / TILE);
+}
+
+function viewport() {
+    // Visible cells as rows [r0, r1) x cols [c0, c1)
+    const size = field.cellSize;
+    const r0 = Math.floor(mapScroll.scrollTop / size), c0 = Math.floor(mapScroll.scrollLeft / size);
+    return {
+        r0, c0,
+        r1: Math.min(field.rows, r0 + Math.ceil(mapScroll.clientHeight / size) + 1),
+        c1: Math.min(field.cols, c0 + Math.ceil(mapScroll.clientWidth / size) + 1),
+    };
+}
+
+function decodeBits(data, target, offset, rows, cols, stride) {
+    // Unpacks base64 bit-packed cells (np.packbits order) into target rows
+    const bytes = atob(data);
+    for (let r = 0; r < rows; r++) {
+        for (let c = 0; c < cols; c++) {
+            const i = r * cols + c;
+            target[offset + r * stride + c] = (bytes.charCodeAt(i >> 3) >> (7 - (i & 7))) & 1;
+        }
+    }
+}
+
+async function fetchTile(tile) {
+    const tilesAcross = Math.ceil(field.cols / TILE);
+    const row0 = Math.floor(tile / tilesAcross) * TILE, col0 = (tile % tilesAcross) * TILE;
+    const etag = field.tileEtags[tile];
+    field.tiles[tile] = TILE_LOADING;
+    tileRequests++;
+    try {
+        const params = `row0=${row0}&col0=${col0}&rows=${TILE}&cols=${TILE}&format=bits`;
+        const res = await fetch("/map?" + params, {headers: etag ? {"If-None-Match": etag} : {}, cache: "no-store"});
+        if (field.tiles.length <= tile || field.tiles[tile] !== TILE_LOADING) return; // map replaced meanwhile
+        if (res.status === 200) {
+            const data = await res.json();
+            if (data.row !== field.rows || data.col !== field.cols) {
+                loadMap(); // the map was replaced, start over at its size
+                return;
+            }
+            decodeBits(data.data, field.cells, row0 * field.cols + col0, data.rows, data.cols, field.cols);
+            field.filled[tile] = 1;
+            field.tileEtags[tile] = res.headers.get("ETag");
+        } else if (res.status !== 304) {
+            field.tiles[tile] = TILE_MISSING;
+            return;
+        }
+        // A delta that arrived while this was in flight may be older than the response, fetch again
+        field.tiles[tile] = field.stale.delete(tile) ? TILE_MISSING : TILE_LOADED;
+    } catch (err) {
+        field.tiles[tile] = TILE_MISSING;
+    } finally {
+        tileRequests--;
+        scheduleDraw();
+    }
+}
+
+function fetchVisibleTiles() {
+    const {r0, r1, c0, c1} = viewport();
+    if (r1 <= r0 || c1 <= c0) return;
+    for (let tr = Math.floor(r0 / TILE); tr <= Math.floor((r1 - 1) / TILE); tr++) {
+        for (let tc = Math.floor(c0 / TILE); tc <= Math.floor((c1 - 1) / TILE); tc++) {
+            const tile = tileOf(tr * TILE, tc * TILE);
+            if (field.tiles[tile] === TILE_MISSING && tileRequests < MAX_TILE_REQUESTS) fetchTile(tile);
+        }
+    }
+}
+
+function fetchVisibleRovers() {
+    const {r0, r1, c0, c1} = viewport();
+    const rect = field.roverRect;
+    if (rect && r0 >= rect.r0 && r1 <= rect.r1 && c0 >= rect.c0 && c1 <= rect.c1) return;
+    loadRoverPositions();
+}
+
+function scheduleDraw() {
+    if (drawPending) return;
+    drawPending = true;
+    requestAnimationFrame(() => {
+        drawPending = false;
+        fetchVisibleTiles();
+        fetchVisibleRovers();
+        draw();
+    });
+}
+
+function pixel(hex) {
+    // "#rrggbb" as one opaque ImageData pixel (little-endian RGBA)
+    const v = parseInt(hex.slice(1), 16);
+    return (0xff000000 | ((v & 0xff) << 16) | (v & 0xff00) | (v >> 16)) >>> 0;
+}
+const COLOURS = {unloaded: pixel("#f3f4f6"), empty: pixel("#fafafa"), mine: pixel("#c0392b"),
+                 disarming: pixel("#e67e22")};
+const cellCanvas = document.createElement("canvas"); // one pixel per visible cell, scaled up onto the map
+
+function draw() {
+    const ratio = window.devicePixelRatio || 1;
+    const width = mapScroll.clientWidth, height = mapScroll.clientHeight;
+    if (canvas.width !== Math.round(width * ratio) || canvas.height !== Math.round(height * ratio)) {
+        canvas.width = Math.round(width * ratio);
+        canvas.height = Math.round(height * ratio);
+        canvas.style.width = width + "px";
+        canvas.style.height = height + "px";
+    }
+    canvas.style.transform = `translate(${mapScroll.scrollLeft}px, ${mapScroll.scrollTop}px)`;
+    ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+    ctx.fillStyle = "#f3f4f6";
+    ctx.fillRect(0, 0, width, height);
+
+    const size = field.cellSize;
+    const {r0, r1, c0, c1} = viewport();
+    // Cell (r, c) is drawn at (x(c), y(r)) relative to the scrolled corner
+    const x = c => c * size - mapScroll.scrollLeft, y = r => r * size - mapScroll.scrollTop;
+    const w = c1 - c0, h = r1 - r0;
+    if (w > 0 && h > 0) {
+        cellCanvas.width = w;
+        cellCanvas.height = h;
+        const cellCtx = cellCanvas.getContext("2d");
+        const image = cellCtx.createImageData(w, h);
+        const pixels = new Uint32Array(image.data.buffer);
+        for (let r = r0; r < r1; r++) {
+            for (let c = c0; c < c1; c++) {
+                const i = r * field.cols + c;
+                let colour = COLOURS.unloaded; // not fetched yet
+                if (field.filled[tileOf(r, c)]) {
+                    colour = !field.cells[i] ? COLOURS.empty : field.disarming.has(i) ? COLOURS.disarming : COLOURS.mine;
+                }
+                pixels[(r - r0) * w + (c - c0)] = colour;
+            }
+        }
+        cellCtx.putImageData(image, 0, 0);
+        ctx.imageSmoothingEnabled = false;
+        ctx.drawImage(cellCanvas, x(c0), y(r0), w * size, h * size);
+        if (size >= 8) {
+            // Grid lines once cells are big enough to tell apart
+            ctx.strokeStyle = "#e0e0e0";
+            ctx.lineWidth = 1;
+            ctx.beginPath();
+            for (let c = c0; c <= c1; c++) {
+                ctx.moveTo(x(c) + 0.5, y(r0));
+                ctx.lineTo(x(c) + 0.5, y(r1));
+            }
+            for (let r = r0; r <= r1; r++) {
+                ctx.moveTo(x(c0), y(r) + 0.5);
+                ctx.lineTo(x(c1), y(r) + 0.5);
+            }
+            ctx.stroke();
+        }
+    }
+
+    ctx.fillStyle = "#27ae60";
+    for (const rover of field.rovers.values()) {
+        const [r, c] = rover.position;
+        if (r < r0 || r >= r1 || c < c0 || c >= c1 || rover.status === ROVER_ELIMINATED) continue;
+        ctx.beginPath();
+        ctx.arc(x(c) + size / 2, y(r) + size / 2, Math.max(size * 0.35, 1.5), 0, 2 * Math.PI);
+        ctx.fill();
+    }
+
+    if (field.selected) {
+        const [r, c] = field.selected;
+        ctx.strokeStyle = "#3498db";
+        ctx.lineWidth = 2;
+        ctx.strokeRect(x(c) + 1, y(r) + 1, size - 2, size - 2);
+    }
+    document.getElementById("map-info").textContent =
+        `${field.rows} × ${field.cols} • rows ${r0}–${Math.max(r1 - 1, r0)}, cols ${c0}–${Math.max(c1 - 1, c0)}`;
+}
+
+function cellAt(event) {
+    // (row, col) under the pointer, null outside the map
+    const rect = canvas.getBoundingClientRect();
+    const row = Math.floor((event.clientY - rect.top + mapScroll.scrollTop) / field.cellSize);
+    const col = Math.floor((event.clientX - rect.left + mapScroll.scrollLeft) / field.cellSize);
+    return row >= 0 && row < field.rows && col >= 0 && col < field.cols ? [row, col] : null;
+}
+
+function zoom(factor, event) {
+    // Keeps the cell under the pointer (or the centre) in place
+    const size = Math.max(MIN_CELL, Math.min(MAX_CELL, Math.round(field.cellSize * factor)));
+    if (size === field.cellSize) return;
+    const rect = mapScroll.getBoundingClientRect();
+    const px = event ? event.clientX - rect.left : mapScroll.clientWidth / 2;
+    const py = event ? event.clientY - rect.top : mapScroll.clientHeight / 2;
+    const col = (mapScroll.scrollLeft + px) / field.cellSize, row = (mapScroll.scrollTop + py) / field.cellSize;
+    field.cellSize = size;
+    resizeSpacer();
+    mapScroll.scrollLeft = col * size - px;
+    mapScroll.scrollTop = row * size - py;
+    scheduleDraw();
+}
+
 async function loadMap() {
-    const res = await fetch( "/map");
+    // Full resync: map size, then every tile again (unchanged ones come back as 304)
+    const res = await fetch("/map?rows=1&cols=1&format=bits", {cache: "no-store"});
     const data = await res.json();
-    const map = data.map;
-    const container = document.getElementById("map-container");
-    container.innerHTML = "";
-    const table = document.createElement("table");
-
-    // Column headers
-    const headerRow = document.createElement("tr");
-    headerRow.appendChild(document.createElement("th")); // Empty corner cell
-    for (let c = 0; c < map[0].length; c++) {
-        const th = document.createElement("th");
-        th.textContent = c;
-        th.style.background = "#f0f0f0";
-        th.style.fontWeight = "bold";
-        headerRow.appendChild(th);
+    if (data.row !== field.rows || data.col !== field.cols) {
+        resetField(data.row, data.col);
+    } else {
+        field.tiles.fill(TILE_MISSING);
+        field.stale.clear();
+    }
+    await loadDisarming();
+    scheduleDraw();
+}
+
+async function loadDisarming() {
+    let cursor = null;
+    const disarming = new Set();
+    do {
+        const res = await fetch("/mines?status=disarming&limit=10000" + (cursor ? "&cursor=" + cursor : ""));
+        const data = await res.json();
+        data.mines.forEach(mine => disarming.add(mine.row * field.cols + mine.col));
+        cursor = data.next_cursor;
+    } while (cursor);
+    field.disarming = disarming;
+}
+
+async function loadRoverPositions() {
+    // Rovers in the tiles around the viewport (GET /rovers?row0=..), deltas keep them current after that
+    const {r0, r1, c0, c1} = viewport();
+    if (r1 <= r0 || c1 <= c0) {
+        field.roverRect = null; // map not loaded yet, the first draw fetches them
+        return;
+    }
+    const rect = {
+        r0: Math.floor(r0 / TILE) * TILE, r1: Math.min(field.rows, Math.ceil(r1 / TILE) * TILE),
+        c0: Math.floor(c0 / TILE) * TILE, c1: Math.min(field.cols, Math.ceil(c1 / TILE) * TILE),
+    };
+    const request = ++roverRequest;
+    field.roverRect = rect;
+    field.roverStale.clear();
+    roverPending = true;
+    try {
+        const found = new Map();
+        let cursor = null;
+        do {
+            const params = `row0=${rect.r0}&col0=${rect.c0}&rows=${rect.r1 - rect.r0}&cols=${rect.c1 - rect.c0}`;
+            const res = await fetch("/rovers?" + params + "&limit=10000" + (cursor ? "&cursor=" + cursor : ""));
+            const data = await res.json();
+            data.rovers.forEach(rover => found.set(rover.id, rover));
+            cursor = data.next_cursor;
+        } while (cursor);
+        if (request !== roverRequest) return; // a newer fetch replaced this one
+        // A delta that arrived while this was in flight is newer than the response
+        field.roverStale.forEach(id => {
+            if (field.rovers.has(id)) found.set(id, field.rovers.get(id));
+            else found.delete(id);
+        });
+        field.rovers = found;
+    } catch (err) {
+        // Kept as fetched, the 🔄 button or a resync tries again
+    } finally {
+        if (request === roverRequest) {
+            roverPending = false;
+            field.roverStale.clear();
+        }
+        scheduleDraw();
     }
-    table.appendChild(headerRow);
-
-    // Rows with row headers
-    for (let r = 0; r < map.length; r++) {
-        const row = document.createElement("tr");
-
-        // Row number header
-        const rowHeader = document.createElement("th");
-        rowHeader.textContent = r;
-        rowHeader.style.background = "#f0f0f0";
-        rowHeader.style.fontWeight = "bold";
-        row.appendChild(rowHeader);
-
-        for (let c = 0; c < map[r].length; c++) {
-            const cell = document.createElement("td");
-            if (map[r][c] === 1) {
-                cell.textContent = "💣";
-                cell.classList.add("mine");
-            } else if (map[r][c] === 2) {
-                cell.textContent = "🤖";
-                cell.classList.add("rover-path");
+}
+
+function markCell(row, col, mine) {
+    if (row < 0 || row >= field.rows || col < 0 || col >= field.cols) return;
+    const i = row * field.cols + col;
+    field.cells[i] = mine ? 1 : 0;
+    if (!mine) field.disarming.delete(i);
+    const tile = tileOf(row, col);
+    if (field.tiles[tile] === TILE_LOADING) field.stale.add(tile);
+    field.tileEtags[tile] = null;
+}
+
+function applyEvent(event) {
+    const mine = event.mine;
+    switch (event.type) {
+        case "map_replaced":
+            resetField(event.row, event.col);
+            loadRoverPositions();
+            scheduleLists();
+            return;
+        case "resync":
+            loadMap();
+            loadRoverPositions();
+            scheduleLists();
+            return;
+        case "mine_added":
+            markCell(mine.row, mine.col, true);
+            break;
+        case "mine_removed":
+        case "mine_disarmed":
+            markCell(mine.row, mine.col, false);
+            break;
+        case "mine_disarming":
+            field.disarming.add(mine.row * field.cols + mine.col);
+            break;
+        case "mine_updated":
+            if (event.old_row !== undefined) {
+                markCell(event.old_row, event.old_col, false); // moved, the cell it left is clear
             } else {
-                cell.textContent = "";
+                field.disarming.delete(mine.row * field.cols + mine.col); // PIN search failed, armed again
             }
-            cell.addEventListener("click", () => {
-                document.getElementById("mine-x").value = c;
-                document.getElementById("mine-y").value = r;
-            });
-            row.appendChild(cell);
-        }
-        table.appendChild(row);
+            markCell(mine.row, mine.col, true);
+            break;
+        case "rover_added":
+        case "rover_updated":
+            field.rovers.set(event.rover.id, event.rover);
+            if (roverPending) field.roverStale.add(event.rover.id);
+            break;
+        case "rover_removed":
+            field.rovers.delete(event.rover.id);
+            if (roverPending) field.roverStale.add(event.rover.id);
+            break;
     }
-    container.appendChild(table);
+    scheduleDraw();
+    scheduleLists();
 }
 
-async function loadMines() {
-    const res = await fetch("/mines");
-    const data = await res.json();
-    const minesList = document.getElementById("mines1");
-    minesList.innerHTML = "<h4>🧾 Existing Mines</h4>";
-    data.mines.forEach(mine => {
-        const div = document.createElement("div");
-        div.textContent = `💣 ID: ${mine.id} — (Y: ${mine.row}, X: ${mine.col})`;
-        minesList.appendChild(div);
-    });
+function connectEvents(delay = 1000) {
+    // Live deltas for the map and lists, reconnects with backoff and resyncs on connect
+    const protocol = window.location.protocol === "https:" ? "wss://" : "ws://";
+    const socket = new WebSocket(protocol + window.location.host + "/ws/events");
+    socket.onopen = () => {
+        eventsSocket = socket;
+        delay = 1000;
+        loadMap();
+        loadRoverPositions();
+        scheduleLists();
+    };
+    socket.onmessage = (message) => JSON.parse(message.data).events.forEach(applyEvent);
+    socket.onclose = () => {
+        if (eventsSocket === socket) eventsSocket = null;
+        else afterChange(); // never opened, load once without live updates
+        setTimeout(() => connectEvents(Math.min(delay * 2, 30000)), delay);
+    };
+}
+
+function afterChange() {
+    // Without the event stream nothing else will pull in the change
+    if (!eventsSocket) {
+        loadMap();
+        loadRoverPositions();
+        loadMines();
+        loadRovers();
+    }
+}
+
+let listTimer = null;
+function scheduleLists() {
+    // Lists are rebuilt at most once a second however many deltas arrive
+    if (listTimer) return;
+    listTimer = setTimeout(() => {
+        listTimer = null;
+        loadMines();
+        loadRovers();
+    }, 1000);
 }
 
-async function loadRovers() {
-    const res = await fetch( "/rovers");
+async function loadList(url, key, containerId, title, describe, cursor = null) {
+    // One page of LIST_LIMIT entries, "Load more" fetches the next one
+    const res = await fetch(`${url}?limit=${LIST_LIMIT}` + (cursor ? "&cursor=" + cursor : ""));
     const data = await res.json();
-    const roversList = document.getElementById("rovers-list");
-    roversList.innerHTML = "<h4>🧾 Rover Fleet</h4>";
-    data.rovers.forEach(rover => {
+    const list = document.getElementById(containerId);
+    if (!cursor) list.innerHTML = `<h4>${title}</h4>`;
+    list.querySelector(".load-more")?.remove();
+    const fragment = document.createDocumentFragment();
+    data[key].forEach(item => {
         const div = document.createElement("div");
-        div.textContent = `🤖 ID: ${rover.id} — Status: ${rover.status}`;
-        roversList.appendChild(div);
+        div.textContent = describe(item);
+        fragment.appendChild(div);
     });
+    list.appendChild(fragment);
+    if (data.next_cursor) {
+        const more = document.createElement("button");
+        more.className = "load-more";
+        more.textContent = "Load more";
+        more.addEventListener("click", () => loadList(url, key, containerId, title, describe, data.next_cursor));
+        list.appendChild(more);
+    }
+}
+
+function loadMines() {
+    return loadList("/mines", "mines", "mines1", "🧾 Existing Mines",
+        mine => `💣 ID: ${mine.id} — (Y: ${mine.row}, X: ${mine.col})`);
+}
+
+function loadRovers() {
+    return loadList("/rovers", "rovers", "rovers-list", "🧾 Rover Fleet",
+        rover => `🤖 ID: ${rover.id} — Status: ${rover.status}`);
 }
 
+// Map interaction: one handler each on the scroll container, none per cell
+mapScroll.addEventListener("scroll", scheduleDraw, {passive: true});
+window.addEventListener("resize", scheduleDraw);
+canvas.addEventListener("click", (e) => {
+    const cell = cellAt(e);
+    if (!cell) return;
+    field.selected = cell;
+    document.getElementById("mine-y").value = cell[0];
+    document.getElementById("mine-x").value = cell[1];
+    scheduleDraw();
+});
+canvas.addEventListener("mousemove", (e) => {
+    const cell = cellAt(e);
+    canvas.title = cell ? `Y: ${cell[0]}, X: ${cell[1]}` : "";
+});
+mapScroll.addEventListener("wheel", (e) => {
+    if (!e.ctrlKey) return; // plain wheel scrolls
+    e.preventDefault();
+    zoom(e.deltaY < 0 ? 1.25 : 0.8, e);
+}, {passive: false});
+document.getElementById("zoom-in-btn").addEventListener("click", () => zoom(1.5));
+document.getElementById("zoom-out-btn").addEventListener("click", () => zoom(1 / 1.5));
+
 // Event Listeners for Map, Mine and Rover forms
-document.getElementById("refresh-map-btn").addEventListener("click", loadMap);
+document.getElementById("refresh-map-btn").addEventListener("click", () => {
+    loadMap();
+    loadRoverPositions();
+});
 document.getElementById("create-mine-form").addEventListener("submit", async (e) => {
     e.preventDefault();
     const serialNum = parseInt(document.getElementById("mine-serial").value);
@@ -91,8 +491,7 @@ document.getElementById("create-mine-form").addEventListener("submit", async (e)
     });
     const data = await res.json();
     alert(data.message);
-    loadMap();
-    loadMines();
+    afterChange();
 });
 
 document.getElementById("create-rover-form").addEventListener("submit", async (e) => {
@@ -114,7 +513,7 @@ document.getElementById("create-rover-form").addEventListener("submit", async (e
     });
     const data = await res.json();
     alert(data.message + " ID: " + data.id);
-    loadRovers();
+    afterChange();
 });
 
 document.getElementById("dispatch-rover-form").addEventListener("submit", async (e) => {
@@ -129,9 +528,7 @@ document.getElementById("dispatch-rover-form").addEventListener("submit", async
     alert(data.message);
     dispatchStatus.textContent = "";
     dispatchBtn.disabled = false;
-    loadRovers();
-    loadMines();
-    loadMap();
+    afterChange();
 });
 
 // WebSocket for real-time rover control
@@ -156,9 +553,7 @@ document.getElementById("open-ws-btn").addEventListener("click", async () => {
         div.textContent = msg.message;
         wsMessages.appendChild(div);
         wsMessages.scrollTop = wsMessages.scrollHeight;
-        loadMap();
-        loadMines();
-        loadRovers();
+        afterChange();
     };
     ws.onclose = () => {
         document.getElementById("ws-status").textContent = "Disconnected";
@@ -178,6 +573,4 @@ document.querySelectorAll(".ws-cmd").forEach(button => {
     });
 });
 
-loadMap();
-loadMines();
-loadRovers();
+connectEvents(); // loads everything once connected